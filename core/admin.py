@@ -1,13 +1,22 @@
 from django.contrib import admin
-from .models import Cliente, Factura, ConfiguracionRecordatorio, HistorialRecordatorio
+from .busqueda import ruts_busqueda
+from .models import Cliente, Factura, ConfiguracionRecordatorio, HistorialRecordatorio, RecalculoCobranza, ResumenCartera, TrabajoImportacion
+
+
+def buscar_por_rut(queryset, resultados, busqueda, campo):
+    """Agrega a los resultados del buscador del admin las coincidencias por RUT normalizado"""
+    ruts = ruts_busqueda(busqueda)
+    if ruts:
+        resultados |= queryset.filter(**{f'{campo}__in': ruts})
+    return resultados
 
 
 @admin.register(Cliente)
 class ClienteAdmin(admin.ModelAdmin):
-    list_display = ['nombre', 'rut', 'email', 'telefono', 'activo', 'fecha_registro', 'usuario']
+    list_display = ['nombre', 'rut', 'email', 'telefono', 'deuda_pendiente', 'n_vencidas', 'activo', 'fecha_registro', 'usuario']
     list_filter = ['activo', 'fecha_registro']
     search_fields = ['nombre', 'rut', 'email']
-    readonly_fields = ['fecha_registro']
+    readonly_fields = ['fecha_registro', 'deuda_pendiente', 'n_vencidas', 'n_mora', 'n_facturas', 'n_pagadas', 'ultima_emision']
     fieldsets = (
         ('Información Principal', {
             'fields': ('nombre', 'rut', 'email', 'telefono')
@@ -15,8 +24,16 @@ class ClienteAdmin(admin.ModelAdmin):
         ('Detalles Adicionales', {
             'fields': ('notas', 'activo', 'usuario', 'fecha_registro')
         }),
+        ('Contadores de Deuda', {
+            'fields': ('deuda_pendiente', 'n_vencidas', 'n_mora', 'n_facturas', 'n_pagadas', 'ultima_emision'),
+            'classes': ('collapse',)
+        }),
     )
 
+    def get_search_results(self, request, queryset, search_term):
+        resultados, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        return buscar_por_rut(queryset, resultados, search_term, 'rut_numero'), may_have_duplicates
+
 
 @admin.register(Factura)
 class FacturaAdmin(admin.ModelAdmin):
@@ -24,6 +41,7 @@ class FacturaAdmin(admin.ModelAdmin):
                     'moneda', 'estado', 'estado_cobranza_display', 'fecha_emision', 'fecha_vencimiento', 'importado_sii', 'usuario']
     list_filter = ['estado', 'estado_cobranza', 'estado_sii', 'moneda', 'importado_sii', 'fecha_emision', 'tipo_dte']
     search_fields = ['numero_factura', 'cliente__nombre', 'cliente__rut', 'descripcion']
+    list_select_related = ['cliente', 'usuario']
     readonly_fields = ['fecha_creacion', 'dias_vencidos', 'porcentaje_pagado_display']
     date_hierarchy = 'fecha_emision'
 
@@ -69,6 +87,10 @@ class FacturaAdmin(admin.ModelAdmin):
         return '0%'
     porcentaje_pagado_display.short_description = '% Pagado'
 
+    def get_search_results(self, request, queryset, search_term):
+        resultados, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        return buscar_por_rut(queryset, resultados, search_term, 'cliente__rut_numero'), may_have_duplicates
+
 
 @admin.register(ConfiguracionRecordatorio)
 class ConfiguracionRecordatorioAdmin(admin.ModelAdmin):
@@ -110,3 +132,37 @@ class HistorialRecordatorioAdmin(admin.ModelAdmin):
             'fields': ('exitoso', 'mensaje_error')
         }),
     )
+
+
+@admin.register(RecalculoCobranza)
+class RecalculoCobranzaAdmin(admin.ModelAdmin):
+    list_display = ['usuario', 'fecha', 'fecha_actualizacion']
+    search_fields = ['usuario__username', 'usuario__email']
+    readonly_fields = ['fecha_actualizacion']
+
+
+@admin.register(ResumenCartera)
+class ResumenCarteraAdmin(admin.ModelAdmin):
+    list_display = ['usuario', 'moneda', 'estado', 'estado_cobranza', 'cantidad', 'monto_total', 'monto_pagado', 'monto_pendiente']
+    list_filter = ['moneda', 'estado', 'estado_cobranza']
+    search_fields = ['usuario__username', 'usuario__email']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(TrabajoImportacion)
+class TrabajoImportacionAdmin(admin.ModelAdmin):
+    list_display = ['nombre_archivo', 'usuario', 'estado', 'filas_procesadas', 'filas_con_error', 'filas_por_segundo', 'fecha_creacion']
+    list_filter = ['estado']
+    search_fields = ['nombre_archivo', 'usuario__username', 'usuario__email']
+    list_select_related = ['usuario']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
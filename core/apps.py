@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .busqueda import instalar_indices_post_migrate
+
+        # Las reconstrucciones de tabla de SQLite eliminan los triggers del índice FTS
+        post_migrate.connect(instalar_indices_post_migrate, sender=self)
@@ -0,0 +1,269 @@
+import re
+
+from django.db import connections
+from django.db.models import Q, Case, When, FloatField, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce
+
+from .models import Cliente, Factura, normalizar_rut, RUT_CUERPO_MAXIMO
+
+
+# ========================
+# BÚSQUEDA DE TEXTO COMPLETO
+# ========================
+
+# Una sola API para buscar facturas y clientes, con el índice que ofrezca
+# cada motor:
+#   - SQLite: tablas FTS5 de contenido externo (core_factura_fts y
+#     core_cliente_fts) mantenidas por triggers, de modo que cualquier
+#     escritura (save, bulk_create, update) las deja al día.
+#   - PostgreSQL: índices GIN sobre to_tsvector('simple', ...), que el motor
+#     mantiene solo.
+#   - Otros motores: icontains, como antes.
+# Los resultados se anotan con `relevancia` (mayor es mejor).
+
+MAX_TERMINOS = 8
+
+# Cuerpo de RUT más bajo que se busca por el índice de RUT normalizado
+RUT_MINIMO = 1000000
+
+# Relevancia extra de una coincidencia exacta de RUT
+BONO_RUT = 100.0
+
+# Tabla FTS5 -> (tabla de contenido, columnas indexadas)
+TABLAS_FTS = {
+    'core_factura_fts': ('core_factura', ('numero_factura', 'descripcion')),
+    'core_cliente_fts': ('core_cliente', ('nombre', 'rut', 'email')),
+}
+
+
+def terminos_busqueda(texto):
+    """Palabras de la búsqueda en minúsculas; descarta la puntuación que no se indexa"""
+    return re.findall(r'\w+', texto.lower())[:MAX_TERMINOS]
+
+
+def _consulta_fts5(terminos):
+    # Cada término como prefijo entre comillas: "abc"* "123"* (AND implícito)
+    return ' '.join(f'"{termino}"*' for termino in terminos)
+
+
+def _consulta_tsquery(terminos):
+    return ' & '.join(f'{termino}:*' for termino in terminos)
+
+
+def _vector_factura():
+    from django.contrib.postgres.search import SearchVector
+    return SearchVector('numero_factura', 'descripcion', config='simple')
+
+
+def _vector_cliente(prefijo=''):
+    from django.contrib.postgres.search import SearchVector
+    return SearchVector(f'{prefijo}nombre', f'{prefijo}rut', f'{prefijo}email', config='simple')
+
+
+def _coincidencias_fts5(tabla_fts, consulta):
+    return RawSQL(f'SELECT rowid FROM {tabla_fts} WHERE {tabla_fts} MATCH %s', [consulta])
+
+
+def _rango_fts5(tabla_fts, consulta, columna_id):
+    # bm25() es negativo y menor cuanto más relevante: se invierte el signo
+    return Coalesce(
+        RawSQL(
+            f'SELECT -bm25({tabla_fts}) FROM {tabla_fts} WHERE {tabla_fts} MATCH %s AND rowid = {columna_id}',
+            [consulta],
+            output_field=FloatField(),
+        ),
+        Value(0.0),
+    )
+
+
+def ruts_busqueda(texto):
+    """
+    Cuerpos de RUT que puede representar la búsqueda, escrita en cualquier
+    formato (12.345.678-5, 12345678-5, 123456785 o solo el cuerpo). Los
+    números de menos de 7 dígitos no se consideran RUT (suelen ser folios),
+    ni los de más de 9.
+    """
+    texto = texto.strip().upper().replace('.', '').replace(' ', '')
+    if not re.fullmatch(r'[0-9]+(-?[0-9K])?', texto):
+        return []
+
+    candidatos = set()
+    if '-' in texto:
+        candidatos.add(int(texto.split('-')[0]))
+    else:
+        rut_numero, rut_dv = normalizar_rut(texto)
+        if rut_numero is not None:
+            candidatos.add(rut_numero)
+        if texto.isdigit():
+            candidatos.add(int(texto))
+    return sorted(candidato for candidato in candidatos if RUT_MINIMO <= candidato <= RUT_CUERPO_MAXIMO)
+
+
+def _por_rut(campo, ruts):
+    """Condición y bonificación de relevancia por RUT normalizado (búsqueda por índice)"""
+    if not ruts:
+        return Q(pk__in=[]), Value(0.0, output_field=FloatField())
+    return Q(**{f'{campo}__in': ruts}), Case(
+        When(**{f'{campo}__in': ruts}, then=Value(BONO_RUT)),
+        default=Value(0.0),
+        output_field=FloatField(),
+    )
+
+
+def buscar_facturas(facturas, texto):
+    """
+    Filtra las facturas cuyo número o descripción, o el nombre, RUT o email
+    de su cliente, contienen palabras que empiezan por los términos buscados,
+    o cuyo cliente tiene el RUT buscado. Anota `relevancia` para ordenar.
+    """
+    terminos = terminos_busqueda(texto)
+    if not terminos:
+        return facturas.none().annotate(relevancia=Value(0.0, output_field=FloatField()))
+
+    vendor = connections[facturas.db].vendor
+    if vendor == 'sqlite':
+        consulta = _consulta_fts5(terminos)
+        condicion = (
+            Q(pk__in=_coincidencias_fts5('core_factura_fts', consulta)) |
+            Q(cliente_id__in=_coincidencias_fts5('core_cliente_fts', consulta))
+        )
+        relevancia = (
+            _rango_fts5('core_factura_fts', consulta, '"core_factura"."id"') +
+            _rango_fts5('core_cliente_fts', consulta, '"core_factura"."cliente_id"')
+        )
+    elif vendor == 'postgresql':
+        from django.contrib.postgres.search import SearchQuery, SearchRank
+
+        consulta = SearchQuery(_consulta_tsquery(terminos), search_type='raw', config='simple')
+        clientes = Cliente.objects.annotate(vector_busqueda=_vector_cliente()).filter(vector_busqueda=consulta)
+        facturas = facturas.annotate(vector_busqueda=_vector_factura())
+        condicion = Q(vector_busqueda=consulta) | Q(cliente_id__in=clientes.values('pk'))
+        relevancia = SearchRank(_vector_factura(), consulta) + SearchRank(_vector_cliente('cliente__'), consulta)
+    else:
+        condicion = Q()
+        for termino in terminos:
+            condicion &= (
+                Q(numero_factura__icontains=termino) |
+                Q(cliente__nombre__icontains=termino) |
+                Q(cliente__rut__icontains=termino) |
+                Q(descripcion__icontains=termino)
+            )
+        relevancia = Value(0.0, output_field=FloatField())
+
+    condicion_rut, relevancia_rut = _por_rut('cliente__rut_numero', ruts_busqueda(texto))
+    return facturas.filter(condicion | condicion_rut).annotate(relevancia=relevancia + relevancia_rut)
+
+
+def buscar_clientes(clientes, texto):
+    """
+    Filtra los clientes por nombre, RUT o email (prefijos de palabra) o por
+    RUT normalizado, y anota `relevancia`
+    """
+    terminos = terminos_busqueda(texto)
+    if not terminos:
+        return clientes.none().annotate(relevancia=Value(0.0, output_field=FloatField()))
+
+    vendor = connections[clientes.db].vendor
+    if vendor == 'sqlite':
+        consulta = _consulta_fts5(terminos)
+        condicion = Q(pk__in=_coincidencias_fts5('core_cliente_fts', consulta))
+        relevancia = _rango_fts5('core_cliente_fts', consulta, '"core_cliente"."id"')
+    elif vendor == 'postgresql':
+        from django.contrib.postgres.search import SearchQuery, SearchRank
+
+        consulta = SearchQuery(_consulta_tsquery(terminos), search_type='raw', config='simple')
+        clientes = clientes.annotate(vector_busqueda=_vector_cliente())
+        condicion = Q(vector_busqueda=consulta)
+        relevancia = SearchRank(_vector_cliente(), consulta)
+    else:
+        condicion = Q()
+        for termino in terminos:
+            condicion &= Q(nombre__icontains=termino) | Q(rut__icontains=termino) | Q(email__icontains=termino)
+        relevancia = Value(0.0, output_field=FloatField())
+
+    condicion_rut, relevancia_rut = _por_rut('rut_numero', ruts_busqueda(texto))
+    return clientes.filter(condicion | condicion_rut).annotate(relevancia=relevancia + relevancia_rut)
+
+
+# ========================
+# INSTALACIÓN DE LOS ÍNDICES
+# ========================
+
+def _sql_fts5(tabla_fts, tabla, columnas):
+    lista = ', '.join(columnas)
+    nuevos = ', '.join(f'new.{columna}' for columna in columnas)
+    viejos = ', '.join(f'old.{columna}' for columna in columnas)
+    borrar = f"INSERT INTO {tabla_fts}({tabla_fts}, rowid, {lista}) VALUES ('delete', old.id, {viejos});"
+    insertar = f'INSERT INTO {tabla_fts}(rowid, {lista}) VALUES (new.id, {nuevos});'
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {tabla_fts} USING fts5("
+        f"{lista}, content='{tabla}', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+        f'CREATE TRIGGER IF NOT EXISTS {tabla_fts}_ai AFTER INSERT ON {tabla} BEGIN {insertar} END',
+        f'CREATE TRIGGER IF NOT EXISTS {tabla_fts}_ad AFTER DELETE ON {tabla} BEGIN {borrar} END',
+        f'CREATE TRIGGER IF NOT EXISTS {tabla_fts}_au AFTER UPDATE OF {lista} ON {tabla} BEGIN {borrar} {insertar} END',
+    ]
+
+
+def instalar_indices_busqueda(connection, reconstruir=False):
+    """
+    Crea los índices de búsqueda del motor de la conexión si no existen.
+
+    En SQLite, las migraciones que reconstruyen una tabla (ALTER en SQLite
+    copia la tabla) eliminan sus triggers: si falta alguno se recrea y se
+    reconstruye la tabla FTS. Retorna la lista de índices creados o reconstruidos.
+    """
+    instalados = []
+
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger')")
+            existentes = {fila[0] for fila in cursor.fetchall()}
+            for tabla_fts, (tabla, columnas) in TABLAS_FTS.items():
+                if tabla not in existentes:
+                    continue
+                nombres = {tabla_fts, f'{tabla_fts}_ai', f'{tabla_fts}_ad', f'{tabla_fts}_au'}
+                if reconstruir or not nombres <= existentes:
+                    for sql in _sql_fts5(tabla_fts, tabla, columnas):
+                        cursor.execute(sql)
+                    cursor.execute(f"INSERT INTO {tabla_fts}({tabla_fts}) VALUES ('rebuild')")
+                    instalados.append(tabla_fts)
+
+    elif connection.vendor == 'postgresql':
+        from django.contrib.postgres.indexes import GinIndex
+
+        indices = [
+            (Factura, GinIndex(_vector_factura(), name='factura_busqueda_gin')),
+            (Cliente, GinIndex(_vector_cliente(), name='cliente_busqueda_gin')),
+        ]
+        with connection.cursor() as cursor:
+            tablas = connection.introspection.table_names(cursor)
+        with connection.schema_editor() as schema_editor:
+            for modelo, indice in indices:
+                if modelo._meta.db_table not in tablas:
+                    continue
+                with connection.cursor() as cursor:
+                    restricciones = connection.introspection.get_constraints(cursor, modelo._meta.db_table)
+                if indice.name not in restricciones:
+                    schema_editor.add_index(modelo, indice)
+                    instalados.append(indice.name)
+
+    return instalados
+
+
+def eliminar_indices_busqueda(connection):
+    """Elimina las tablas FTS, sus triggers y los índices GIN de búsqueda"""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            for tabla_fts in TABLAS_FTS:
+                for sufijo in ('ai', 'ad', 'au'):
+                    cursor.execute(f'DROP TRIGGER IF EXISTS {tabla_fts}_{sufijo}')
+                cursor.execute(f'DROP TABLE IF EXISTS {tabla_fts}')
+        elif connection.vendor == 'postgresql':
+            cursor.execute('DROP INDEX IF EXISTS factura_busqueda_gin')
+            cursor.execute('DROP INDEX IF EXISTS cliente_busqueda_gin')
+
+
+def instalar_indices_post_migrate(sender, using, **kwargs):
+    """Receptor de post_migrate: recrea lo que una migración haya eliminado"""
+    instalar_indices_busqueda(connections[using])
@@ -0,0 +1,61 @@
+import time
+
+from django.core.cache import cache
+
+
+# ========================
+# CACHÉ VERSIONADA POR USUARIO
+# ========================
+
+# Los datos derivados (resumen del dashboard, contadores, etc.) se guardan
+# bajo una clave que incluye la versión del usuario. Invalidar consiste en
+# cambiar la versión: las entradas antiguas dejan de leerse y expiran solas.
+
+TIMEOUT_RESUMEN = 60 * 60 * 24
+
+
+def _clave_version(usuario_id):
+    return f'usuario:{usuario_id}:version'
+
+
+def version_usuario(usuario_id):
+    """Retorna la versión actual de los datos del usuario, creándola si no existe"""
+    clave = _clave_version(usuario_id)
+    version = cache.get(clave)
+    if version is None:
+        # Partir desde un valor basado en el reloj evita reutilizar versiones
+        # de entradas antiguas si la clave de versión fue desalojada
+        version = time.time_ns()
+        if not cache.add(clave, version, timeout=None):
+            version = cache.get(clave, version)
+    return version
+
+
+def invalidar_cache_usuario(usuario_id):
+    """Cambia la versión del usuario para que se recalculen sus datos en caché"""
+    clave = _clave_version(usuario_id)
+    try:
+        cache.incr(clave)
+    except ValueError:
+        cache.set(clave, time.time_ns(), timeout=None)
+
+
+def prefijo_usuario(usuario_id):
+    """Prefijo de las claves de caché del usuario para su versión actual"""
+    return f'usuario:{usuario_id}:v{version_usuario(usuario_id)}'
+
+
+def obtener_cache_usuario(usuario_id, nombre, calcular, timeout=TIMEOUT_RESUMEN):
+    """
+    Retorna el valor en caché `nombre` del usuario para su versión actual.
+    Si no existe, lo calcula con `calcular()` y lo guarda.
+
+    `nombre` debe incluir todo lo que haga variar el resultado aparte de
+    los datos del usuario (por ejemplo, la fecha de hoy).
+    """
+    clave = f'{prefijo_usuario(usuario_id)}:{nombre}'
+    valor = cache.get(clave)
+    if valor is None:
+        valor = calcular()
+        cache.set(clave, valor, timeout=timeout)
+    return valor
@@ -0,0 +1,105 @@
+import datetime
+
+from django.db.models import Q, Case, When, Value, CharField
+from django.utils import timezone
+
+from .cache_usuario import invalidar_cache_usuario
+
+
+# ========================
+# UMBRALES DE COBRANZA
+# ========================
+
+# Orden de evaluación: el primer tramo que calce gana
+ESTADOS_COBRANZA = ['incobrable', 'mora', 'vencida', 'por_vencer', 'vigente']
+
+DIAS_INCOBRABLE = 90
+DIAS_MORA = 30
+DIAS_POR_VENCER = 7
+
+
+def filtros_estado_cobranza(hoy=None):
+    """
+    Retorna un diccionario {estado_cobranza: Q} con el rango de
+    fecha_vencimiento que corresponde a cada tramo de cobranza.
+
+    Los rangos son disjuntos y cubren todas las fechas, por lo que pueden
+    usarse tanto para UPDATE masivos como para filtros y agregados.
+    Replican los umbrales de Factura.actualizar_estado_cobranza().
+    """
+    if hoy is None:
+        hoy = timezone.localdate()
+
+    limite_incobrable = hoy - datetime.timedelta(days=DIAS_INCOBRABLE)
+    limite_mora = hoy - datetime.timedelta(days=DIAS_MORA)
+    limite_por_vencer = hoy + datetime.timedelta(days=DIAS_POR_VENCER)
+
+    return {
+        'incobrable': Q(fecha_vencimiento__lte=limite_incobrable),
+        'mora': Q(fecha_vencimiento__gt=limite_incobrable, fecha_vencimiento__lte=limite_mora),
+        'vencida': Q(fecha_vencimiento__gt=limite_mora, fecha_vencimiento__lt=hoy),
+        'por_vencer': Q(fecha_vencimiento__gte=hoy, fecha_vencimiento__lte=limite_por_vencer),
+        'vigente': Q(fecha_vencimiento__gt=limite_por_vencer),
+    }
+
+
+def expresion_estado_cobranza(hoy=None):
+    """
+    Expresión SQL (CASE) que calcula el estado de cobranza a partir de
+    fecha_vencimiento. Las facturas no pendientes quedan en NULL, igual que
+    en la columna almacenada.
+    """
+    return Case(
+        *[
+            When(Q(estado='pendiente') & filtro, then=Value(estado))
+            for estado, filtro in filtros_estado_cobranza(hoy).items()
+        ],
+        default=None,
+        output_field=CharField(),
+    )
+
+
+def recalcular_estados_cobranza(facturas, hoy=None):
+    """
+    Recalcula el estado de cobranza de las facturas pendientes del QuerySet
+    con un UPDATE por tramo, sin cargar las facturas en memoria.
+
+    Solo se escriben las filas cuyo tramo cambió. Retorna un diccionario
+    {estado_cobranza: filas_movidas}.
+    """
+    pendientes = facturas.filter(estado='pendiente')
+    movidas = {}
+    for estado, filtro in filtros_estado_cobranza(hoy).items():
+        movidas[estado] = pendientes.filter(filtro).exclude(
+            estado_cobranza=estado
+        ).update(estado_cobranza=estado)
+    return movidas
+
+
+def asegurar_estados_cobranza(usuario, hoy=None):
+    """
+    Recalcula los estados de cobranza del usuario solo si no se han
+    recalculado hoy (fecha de America/Santiago).
+
+    Retorna el diccionario de filas movidas, o None si la marca del día ya
+    estaba al día y no hubo que escribir nada.
+    """
+    from .models import Factura, RecalculoCobranza
+    from .resumen_cartera import reconstruir_resumen_cartera
+    from .contadores_cliente import recalcular_contadores_clientes
+
+    if hoy is None:
+        hoy = timezone.localdate()
+
+    if RecalculoCobranza.objects.filter(usuario=usuario, fecha=hoy).exists():
+        return None
+
+    movidas = recalcular_estados_cobranza(Factura.objects.filter(usuario=usuario), hoy)
+    RecalculoCobranza.objects.update_or_create(usuario=usuario, defaults={'fecha': hoy})
+    if any(movidas.values()):
+        # Los UPDATE masivos no pasan por save(): reconstruir el resumen de cartera
+        # y los contadores de los clientes
+        reconstruir_resumen_cartera([usuario.pk])
+        recalcular_contadores_clientes([usuario.pk])
+        invalidar_cache_usuario(usuario.pk)
+    return movidas
@@ -0,0 +1,120 @@
+from django.db import transaction
+from django.db.models import F, Q, Sum, Count, Max, Value, DecimalField
+from django.db.models.functions import Coalesce, NullIf
+
+from .metricas import expresion_deuda
+from .models import Cliente, Factura
+
+
+# ========================
+# CONTADORES DE DEUDA POR CLIENTE
+# ========================
+
+# Los contadores se recalculan por cliente con un aggregate sobre sus
+# facturas (índice factura_cliente_estado_idx) en la misma transacción que
+# guarda o elimina la factura. Usan la columna estado_cobranza, por lo que
+# después de un recálculo masivo de estados hay que recalcularlos también.
+
+ESTADOS_VENCIDOS = ['vencida', 'mora', 'incobrable']
+
+CONTADORES_VACIOS = {
+    'deuda_pendiente': 0,
+    'n_vencidas': 0,
+    'n_mora': 0,
+    'n_facturas': 0,
+    'n_pagadas': 0,
+    'ultima_emision': None,
+}
+
+
+def expresion_deuda_cliente():
+    """
+    Saldo de una factura en deuda_pendiente: el de expresion_deuda(), o monto
+    si la factura no tiene monto_total (como lo sumaba Cliente.total_deuda
+    antes de los contadores).
+    """
+    return Coalesce(
+        NullIf(expresion_deuda(), Value(0)),
+        F('monto'),
+        output_field=DecimalField(max_digits=14, decimal_places=2),
+    )
+
+
+def _calcular_contadores(facturas):
+    """Agrupa las facturas recibidas por cliente y retorna {cliente_id: contadores}"""
+    pendiente = Q(estado='pendiente')
+    grupos = facturas.order_by().values('cliente_id').annotate(
+        deuda_pendiente=Sum(expresion_deuda_cliente(), filter=pendiente),
+        n_vencidas=Count('id', filter=pendiente & Q(estado_cobranza__in=ESTADOS_VENCIDOS)),
+        n_mora=Count('id', filter=pendiente & Q(estado_cobranza='mora')),
+        n_facturas=Count('id'),
+        n_pagadas=Count('id', filter=Q(estado='pagada')),
+        ultima_emision=Max('fecha_emision'),
+    )
+    contadores = {}
+    for grupo in grupos:
+        cliente_id = grupo.pop('cliente_id')
+        grupo['deuda_pendiente'] = grupo['deuda_pendiente'] or 0
+        contadores[cliente_id] = grupo
+    return contadores
+
+
+def actualizar_contadores_cliente(*cliente_ids):
+    """Recalcula y guarda los contadores de los clientes indicados (uso por factura)"""
+    cliente_ids = {pk for pk in cliente_ids if pk is not None}
+    if not cliente_ids:
+        return
+    contadores = _calcular_contadores(Factura.objects.filter(cliente_id__in=cliente_ids))
+    for cliente_id in cliente_ids:
+        Cliente.objects.filter(pk=cliente_id).update(**contadores.get(cliente_id, CONTADORES_VACIOS))
+
+
+def registrar_factura_contadores(factura):
+    """Actualiza los contadores del cliente de una factura guardada o eliminada"""
+    cliente_original = getattr(factura, '_cliente_id_original', None)
+    actualizar_contadores_cliente(factura.cliente_id, cliente_original)
+    factura._cliente_id_original = factura.cliente_id
+
+
+def recalcular_contadores_clientes(usuario_ids=None, batch_size=500):
+    """
+    Recalcula los contadores de todos los clientes de los usuarios indicados
+    (o de todos) con un GROUP BY y bulk_update. Retorna la cantidad de
+    clientes actualizados.
+    """
+    clientes = Cliente.objects.all()
+    facturas = Factura.objects.all()
+    if usuario_ids is not None:
+        clientes = clientes.filter(usuario_id__in=usuario_ids)
+        facturas = facturas.filter(cliente__usuario_id__in=usuario_ids)
+
+    with transaction.atomic():
+        contadores = _calcular_contadores(facturas)
+        lote = []
+        for cliente in clientes.only('pk'):
+            for campo, valor in contadores.get(cliente.pk, CONTADORES_VACIOS).items():
+                setattr(cliente, campo, valor)
+            lote.append(cliente)
+        Cliente.objects.bulk_update(lote, Cliente.CAMPOS_CONTADORES, batch_size=batch_size)
+    return len(lote)
+
+
+def verificar_contadores_clientes(usuario_ids=None):
+    """
+    Compara los contadores almacenados con los calculados desde las facturas.
+    Retorna una lista de (cliente_id, campo, esperado, almacenado) con las diferencias.
+    """
+    clientes = Cliente.objects.all()
+    facturas = Factura.objects.all()
+    if usuario_ids is not None:
+        clientes = clientes.filter(usuario_id__in=usuario_ids)
+        facturas = facturas.filter(cliente__usuario_id__in=usuario_ids)
+
+    contadores = _calcular_contadores(facturas)
+    diferencias = []
+    for cliente in clientes.order_by('pk').values('pk', *Cliente.CAMPOS_CONTADORES):
+        esperado = contadores.get(cliente['pk'], CONTADORES_VACIOS)
+        for campo in Cliente.CAMPOS_CONTADORES:
+            if esperado[campo] != cliente[campo]:
+                diferencias.append((cliente['pk'], campo, esperado[campo], cliente[campo]))
+    return diferencias
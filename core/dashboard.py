@@ -0,0 +1,254 @@
+from django.core.cache import cache
+from django.db.models import Sum
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .cache_usuario import obtener_cache_usuario, prefijo_usuario, TIMEOUT_RESUMEN
+from .metricas import resumen_facturas, expresion_deuda, mapa_vencimiento, meses_ventana, serie_mensual
+from .models import Factura
+from .utils import formatear_moneda
+
+
+# ========================
+# WIDGETS DEL DASHBOARD
+# ========================
+
+# Cada widget se calcula por separado, se guarda en la caché del usuario y se
+# sirve como JSON desde /api/dashboard/<widget>/. La página del dashboard se
+# renderiza sin métricas y las pide después de la primera pintura.
+
+
+def resumen_dashboard(usuario, hoy):
+    """Resumen agregado de facturas compartido por varios widgets"""
+    return obtener_cache_usuario(
+        usuario.pk,
+        f'resumen:{hoy.isoformat()}',
+        lambda: resumen_facturas(Factura.objects.filter(usuario=usuario), hoy)
+    )
+
+
+def widget_kpis(usuario, hoy):
+    """Tarjetas de estadísticas: contadores y montos por estado de cobranza y totales"""
+    resumen = resumen_dashboard(usuario, hoy)
+
+    valores = {}
+    for sufijo in ['vigentes', 'por_vencer', 'vencidas', 'en_mora', 'incobrables']:
+        valores[f'facturas_{sufijo}'] = str(resumen[f'facturas_{sufijo}'])
+        valores[f'monto_{sufijo}'] = formatear_moneda(resumen[f'monto_{sufijo}'], 'CLP')
+
+    # Detalle de pagadas: "N pagadas + M parciales"
+    detalle_pagado = []
+    if resumen['facturas_pagadas'] > 0:
+        detalle_pagado.append(f"{resumen['facturas_pagadas']} pagadas")
+    if resumen['facturas_pago_parcial'] > 0:
+        detalle_pagado.append(f"{resumen['facturas_pago_parcial']} parciales")
+
+    tasa_cobranza = 0
+    if resumen['total_facturado'] > 0:
+        tasa_cobranza = round(resumen['total_pagado'] / resumen['total_facturado'] * 100)
+
+    valores.update({
+        'total_pendiente': formatear_moneda(resumen['total_pendiente'], 'CLP'),
+        'facturas_pendientes': f"{resumen['facturas_pendientes']} facturas",
+        'total_pagado': formatear_moneda(resumen['total_pagado'], 'CLP'),
+        'detalle_pagado': ' + '.join(detalle_pagado),
+        'facturas_pago_parcial': str(resumen['facturas_pago_parcial']),
+        'monto_pagos_parciales': f"{formatear_moneda(resumen['monto_pagos_parciales'], 'CLP')} recibidos",
+        'tasa_cobranza': f'{tasa_cobranza}%',
+        'total_facturado': formatear_moneda(resumen['total_facturado'], 'CLP'),
+        'total_facturas': f"{resumen['total_facturas']} facturas",
+    })
+    return {'valores': valores}
+
+
+def widget_vencimiento(usuario, hoy):
+    """Mapa de vencimiento con los tramos 0-30, 31-60, 61-90 y +90 días"""
+    tramos = mapa_vencimiento(Factura.objects.filter(usuario=usuario), (30, 60, 90), hoy)
+    valores = {}
+    for nombre, tramo in zip(['0_30', '31_60', '61_90', '90_mas'], tramos):
+        valores[f'vencidas_{nombre}'] = str(tramo['cantidad'])
+        valores[f'monto_{nombre}'] = formatear_moneda(tramo['monto'], 'CLP')
+    return {'valores': valores}
+
+
+def widget_estados(usuario, hoy):
+    """Serie del gráfico de distribución por estado de cobranza"""
+    resumen = resumen_dashboard(usuario, hoy)
+    return {
+        'labels': ['Vigentes', 'Por Vencer', 'Vencidas', 'En Mora', 'Incobrables', 'Pagadas'],
+        'data': [
+            resumen['facturas_vigentes'],
+            resumen['facturas_por_vencer'],
+            resumen['facturas_vencidas'],
+            resumen['facturas_en_mora'],
+            resumen['facturas_incobrables'],
+            resumen['facturas_pagadas'],
+        ],
+    }
+
+
+def widget_montos(usuario, hoy):
+    """Serie del gráfico de montos por estado de cobranza"""
+    resumen = resumen_dashboard(usuario, hoy)
+    return {
+        'labels': ['Vigentes', 'Por Vencer', 'Vencidas', 'En Mora', 'Incobrables'],
+        'data': [
+            int(resumen['monto_vigentes']),
+            int(resumen['monto_por_vencer']),
+            int(resumen['monto_vencidas']),
+            int(resumen['monto_en_mora']),
+            int(resumen['monto_incobrables']),
+        ],
+    }
+
+
+def tendencia_usuario(usuario, meses=12, hoy=None):
+    """
+    Serie mensual (cantidad, facturado, cobrado) de los últimos `meses` meses
+    del usuario. Cada mes cerrado se guarda en caché por separado, de modo
+    que las distintas ventanas comparten los meses ya calculados; el mes en
+    curso se calcula siempre. Los meses faltantes se obtienen en una sola
+    consulta acotada por fecha.
+    """
+    if hoy is None:
+        hoy = timezone.localdate()
+    meses_serie = meses_ventana(meses, hoy)
+    mes_actual = meses_serie[-1]
+
+    prefijo = prefijo_usuario(usuario.pk)
+    claves = {mes: f'{prefijo}:tendencia:{mes:%Y-%m}' for mes in meses_serie[:-1]}
+    en_cache = cache.get_many(list(claves.values()))
+
+    faltantes = [mes for mes, clave in claves.items() if clave not in en_cache]
+    calculados = {
+        fila['mes']: fila
+        for fila in serie_mensual(Factura.objects.filter(usuario=usuario), faltantes[0] if faltantes else mes_actual, mes_actual)
+    }
+    cache.set_many(
+        {claves[mes]: calculados[mes] for mes in faltantes},
+        timeout=TIMEOUT_RESUMEN
+    )
+
+    return [calculados[mes] if mes in calculados else en_cache[claves[mes]] for mes in meses_serie]
+
+
+def widget_tendencia(usuario, hoy):
+    """Facturas emitidas por mes en los últimos 12 meses"""
+    serie = tendencia_usuario(usuario, 12, hoy)
+    return {
+        'labels': [fila['mes'].strftime('%b %Y') for fila in serie],
+        'data': [fila['cantidad'] for fila in serie],
+        'facturado': [float(fila['facturado']) for fila in serie],
+        'cobrado': [float(fila['cobrado']) for fila in serie],
+    }
+
+
+def widget_alertas(usuario, hoy):
+    """Sistema de alertas inteligentes"""
+    resumen = resumen_dashboard(usuario, hoy)
+    alertas = []
+
+    # Alerta 1: Facturas vencidas este mes
+    if resumen['facturas_vencidas_mes'] > 0:
+        alertas.append({
+            'tipo': 'danger',
+            'icono': 'exclamation-triangle-fill',
+            'mensaje': f"Tienes {resumen['facturas_vencidas_mes']} facturas vencidas este mes",
+            'accion': 'facturas_list',
+            'filtro': 'vencidas'
+        })
+
+    # Alerta 2: Facturas por vencer en los próximos 7 días
+    if resumen['facturas_por_vencer_pronto'] > 0:
+        alertas.append({
+            'tipo': 'warning',
+            'icono': 'clock-fill',
+            'mensaje': f"{resumen['facturas_por_vencer_pronto']} facturas vencen en los próximos 7 días",
+            'accion': 'facturas_list',
+            'filtro': 'por_vencer'
+        })
+
+    # Alerta 3: Facturas en mora (+30 días vencidas)
+    if resumen['facturas_en_mora'] > 0:
+        alertas.append({
+            'tipo': 'danger',
+            'icono': 'hourglass-split',
+            'mensaje': f"{resumen['facturas_en_mora']} facturas en mora por ${resumen['deuda_mora']:,.0f}",
+            'accion': 'facturas_list',
+            'filtro': 'mora'
+        })
+
+    # Alerta 4: Concentración de clientes (análisis 80/20)
+    total_pendiente_global = resumen['deuda_total']
+    if resumen['facturas_pendientes'] > 0 and total_pendiente_global > 0:
+        # Top 5 clientes con más deuda
+        top_clientes = Factura.objects.filter(usuario=usuario, estado='pendiente').values('cliente__nombre').annotate(
+            deuda=Sum(expresion_deuda())
+        ).order_by('-deuda')[:5]
+
+        deuda_top5 = sum(c['deuda'] for c in top_clientes)
+        porcentaje_concentracion = (deuda_top5 / total_pendiente_global) * 100
+
+        if porcentaje_concentracion >= 70:
+            alertas.append({
+                'tipo': 'info',
+                'icono': 'pie-chart-fill',
+                'mensaje': f'5 clientes concentran el {porcentaje_concentracion:.0f}% de tu cartera por cobrar',
+                'accion': None,
+                'filtro': None
+            })
+
+    # Alerta 5: Facturas sin fecha de vencimiento o con datos incompletos
+    if resumen['facturas_sin_vencimiento'] > 0:
+        alertas.append({
+            'tipo': 'secondary',
+            'icono': 'question-circle-fill',
+            'mensaje': f"{resumen['facturas_sin_vencimiento']} facturas sin fecha de vencimiento",
+            'accion': 'facturas_list',
+            'filtro': 'pendientes'
+        })
+
+    # Alerta 6: Facturas incobrables (+90 días)
+    if resumen['facturas_incobrables'] > 0:
+        alertas.append({
+            'tipo': 'dark',
+            'icono': 'x-circle-fill',
+            'mensaje': f"{resumen['facturas_incobrables']} facturas podrían ser incobrables (+90 días)",
+            'accion': 'facturas_list',
+            'filtro': 'incobrables'
+        })
+
+    return {
+        'cantidad': len(alertas),
+        'html': render_to_string('core/partials/dashboard_alertas.html', {'alertas': alertas}),
+    }
+
+
+def widget_ultimas_facturas(usuario, hoy):
+    """Tabla de las últimas 10 facturas emitidas"""
+    ultimas_facturas = Factura.objects.filter(usuario=usuario).con_estado_cobranza(hoy).para_listado().order_by(
+        '-fecha_emision'
+    )[:10]
+    return {
+        'html': render_to_string('core/partials/dashboard_ultimas_facturas.html', {'ultimas_facturas': ultimas_facturas}),
+    }
+
+
+WIDGETS_DASHBOARD = {
+    'kpis': widget_kpis,
+    'vencimiento': widget_vencimiento,
+    'estados': widget_estados,
+    'montos': widget_montos,
+    'tendencia': widget_tendencia,
+    'alertas': widget_alertas,
+    'ultimas': widget_ultimas_facturas,
+}
+
+
+def calcular_widget(nombre, usuario, hoy):
+    """Retorna los datos JSON del widget, desde la caché del usuario si están disponibles"""
+    return obtener_cache_usuario(
+        usuario.pk,
+        f'widget:{nombre}:{hoy.isoformat()}',
+        lambda: WIDGETS_DASHBOARD[nombre](usuario, hoy)
+    )
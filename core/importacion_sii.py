@@ -0,0 +1,799 @@
+import codecs
+import csv
+import datetime
+import itertools
+from collections import deque, namedtuple
+from decimal import Decimal
+from xml.etree import ElementTree
+
+from django.db import DatabaseError, connections, transaction
+from django.db.models import Q, F, Count, Sum, Max, Exists, OuterRef, Subquery, Value, CharField
+from django.db.models.functions import Coalesce, Concat, NullIf
+from django.utils import timezone
+
+from .cobranza import expresion_estado_cobranza
+from .models import Cliente, Factura, FilaImportacion, formatear_rut, normalizar_rut
+
+
+# ========================
+# LECTURA EN STREAMING DEL CSV DEL SII
+# ========================
+
+# El archivo subido se recorre por bloques: se decodifica de forma
+# incremental, el delimitador se detecta con el primer bloque y las filas se
+# validan en lotes de tamaño fijo. La memoria usada no depende del tamaño
+# del archivo (salvo por lo que el llamador decida acumular).
+
+TAMANO_BLOQUE = 64 * 1024
+TAMANO_MUESTRA = 1024
+TAMANO_LOTE = 500
+
+
+class ErrorFilaImportacion(ValueError):
+    """Fila del CSV que no se puede importar; el mensaje se muestra al usuario"""
+
+
+def lineas_decodificadas(bloques, encoding='utf-8-sig'):
+    """
+    Decodifica de forma incremental un iterable de bloques de bytes y genera
+    sus líneas (con el salto de línea incluido, como espera el módulo csv).
+    Los caracteres multibyte y las líneas cortadas entre bloques se completan
+    con el bloque siguiente.
+    """
+    decodificador = codecs.getincrementaldecoder(encoding)()
+    pendiente = ''
+    for bloque in bloques:
+        pendiente += decodificador.decode(bloque)
+        lineas = pendiente.splitlines(keepends=True)
+        pendiente = lineas.pop() if lineas and not lineas[-1].endswith(('\n', '\r')) else ''
+        yield from lineas
+    pendiente += decodificador.decode(b'', final=True)
+    if pendiente:
+        yield pendiente
+
+
+def detectar_delimitador(muestra):
+    """El SII exporta con ';' y las planillas suelen usar ','"""
+    return ';' if muestra.count(';') > muestra.count(',') else ','
+
+
+def leer_filas_csv(bloques):
+    """
+    Genera (numero_fila, fila) por cada registro del CSV, con la fila como
+    diccionario según la cabecera. La numeración parte en 2 (la fila 1 es
+    la cabecera), igual que la ve el usuario en su planilla.
+    """
+    lineas = lineas_decodificadas(bloques)
+
+    # El delimitador se detecta con el primer bloque de texto, sin leer el resto
+    muestra = []
+    largo = 0
+    for linea in lineas:
+        muestra.append(linea)
+        largo += len(linea)
+        if largo >= TAMANO_MUESTRA:
+            break
+
+    lector = csv.DictReader(itertools.chain(muestra, lineas), delimiter=detectar_delimitador(''.join(muestra)))
+    yield from enumerate(lector, start=2)
+
+
+def en_lotes(iterable, tamano=TAMANO_LOTE):
+    """Agrupa un iterable en listas de hasta `tamano` elementos"""
+    iterador = iter(iterable)
+    while True:
+        lote = list(itertools.islice(iterador, tamano))
+        if not lote:
+            return
+        yield lote
+
+
+# ========================
+# LECTURA EN STREAMING DEL XML DEL SII (EnvioDTE)
+# ========================
+
+# Un EnvioDTE trae muchos <DTE>, cada uno con su <Documento> (encabezado,
+# detalle y referencias) y su firma. Se lee con XMLPullParser, el parser
+# incremental de iterparse, alimentado con los mismos bloques que el CSV:
+# al cerrarse cada <Documento> se convierte en una fila con las columnas del
+# CSV y se vacía, y cada <DTE> terminado se quita de su padre, de modo que
+# el árbol en memoria no crece con el archivo. ElementTree no resuelve
+# entidades externas y expat limita la expansión de entidades.
+
+# Tipos de DTE que se importan como facturas (las notas de crédito 61 y
+# débito 56 se informan como errores)
+TIPOS_DTE_FACTURA = {33, 34}
+
+# IdDoc/FmaPago: 1 contado, 2 crédito, 3 sin costo
+FORMA_PAGO_CONTADO = '1'
+
+
+def _etiqueta(elemento):
+    """Nombre de la etiqueta sin el espacio de nombres ({http://www.sii.cl/SiiDte}Folio -> Folio)"""
+    return elemento.tag.rsplit('}', 1)[-1]
+
+
+def _texto(elemento, *ruta):
+    """Texto del descendiente que sigue la ruta de etiquetas, o '' si no existe"""
+    for nombre in ruta:
+        elemento = next((hijo for hijo in elemento if _etiqueta(hijo) == nombre), None)
+        if elemento is None:
+            return ''
+    return (elemento.text or '').strip()
+
+
+def fila_documento_dte(documento):
+    """Convierte un <Documento> en una fila con las columnas de leer_filas_csv()"""
+    id_doc = ('Encabezado', 'IdDoc')
+    receptor = ('Encabezado', 'Receptor')
+    totales = ('Encabezado', 'Totales')
+    monto_total = _texto(documento, *totales, 'MntTotal')
+    contado = _texto(documento, *id_doc, 'FmaPago') == FORMA_PAGO_CONTADO
+    return {
+        'tipo_dte': _texto(documento, *id_doc, 'TipoDTE'),
+        'folio': _texto(documento, *id_doc, 'Folio'),
+        'fecha_emision': _texto(documento, *id_doc, 'FchEmis'),
+        'fecha_vencimiento': _texto(documento, *id_doc, 'FchVenc'),
+        'rut_receptor': _texto(documento, *receptor, 'RUTRecep'),
+        'razon_social_receptor': _texto(documento, *receptor, 'RznSocRecep'),
+        'monto_neto': _texto(documento, *totales, 'MntNeto'),
+        'monto_iva': _texto(documento, *totales, 'IVA'),
+        'monto_exento': _texto(documento, *totales, 'MntExe'),
+        'monto_total': monto_total,
+        # Al contado se emite pagada; a crédito queda pendiente el total
+        'monto_pendiente': '0' if contado else monto_total,
+        'estado_pago': 'pagada' if contado else '',
+    }
+
+
+def leer_documentos_dte(bloques):
+    """
+    Genera (numero_documento, fila) por cada <Documento> del XML, con la
+    fila en el formato de leer_filas_csv(). Los documentos se numeran desde
+    1 en el orden del archivo. Lanza xml.etree.ElementTree.ParseError si el
+    XML está mal formado.
+    """
+    lector = ElementTree.XMLPullParser(events=('start', 'end'))
+    abiertos = []
+    numero = 0
+    for bloque in itertools.chain(bloques, [None]):
+        if bloque is None:
+            lector.close()
+        else:
+            lector.feed(bloque)
+        for evento, elemento in lector.read_events():
+            if evento == 'start':
+                abiertos.append(elemento)
+                continue
+            abiertos.pop()
+            etiqueta = _etiqueta(elemento)
+            if etiqueta == 'Documento':
+                numero += 1
+                yield numero, fila_documento_dte(elemento)
+                elemento.clear()
+            elif etiqueta == 'DTE' and abiertos:
+                abiertos[-1].remove(elemento)
+
+
+# Lector de registros según TrabajoImportacion.formato
+LECTORES = {
+    'csv': leer_filas_csv,
+    'xml': leer_documentos_dte,
+}
+
+
+# ========================
+# VALIDACIÓN DE FILAS
+# ========================
+
+def parsear_decimal(valor):
+    """Convierte montos como '1.234,50', '1234.50' o '1234,5' a Decimal"""
+    if not valor:
+        return Decimal('0')
+    limpio = str(valor).strip()
+    if ',' in limpio and '.' in limpio:
+        limpio = limpio.replace('.', '').replace(',', '.')
+    elif ',' in limpio:
+        limpio = limpio.replace(',', '.')
+    return Decimal(limpio)
+
+
+def parsear_fecha(valor):
+    """Convierte fechas dd-mm-aaaa, aaaa-mm-dd, dd/mm/aaaa o aaaa/mm/dd"""
+    if not valor:
+        return None
+    valor = valor.strip()
+    for formato in ['%d-%m-%Y', '%Y-%m-%d', '%d/%m/%Y', '%Y/%m/%d']:
+        try:
+            return datetime.datetime.strptime(valor, formato).date()
+        except ValueError:
+            continue
+    raise ValueError(f'Formato de fecha no reconocido: {valor}')
+
+
+def _columna(fila, *nombres, defecto=''):
+    """Primer valor no vacío entre las columnas alternativas de los distintos formatos"""
+    for nombre in nombres:
+        valor = (fila.get(nombre) or '').strip()
+        if valor:
+            return valor
+    return defecto
+
+
+def validar_fila(numero_fila, fila, hoy):
+    """
+    Convierte una fila del CSV en el ítem de la vista previa de importación.
+    Lanza ErrorFilaImportacion si faltan datos obligatorios y ValueError (o
+    InvalidOperation) si un monto o una fecha no se pueden leer.
+
+    Formato esperado: folio, tipo_dte, fecha_emision, fecha_vencimiento,
+    rut_receptor, razon_social_receptor, monto_total, monto_pendiente,
+    estado_pago y, opcionales, monto_neto, monto_iva, monto_exento y
+    estado_sii; se aceptan también los nombres de columna de otras
+    exportaciones del SII.
+    """
+    numero_factura = _columna(fila, 'folio', 'Folio', 'Número Documento')
+    tipo_dte_str = _columna(fila, 'tipo_dte', 'TipoDTE', 'Tipo DTE')
+    rut = _columna(fila, 'rut_receptor', 'RUT Receptor', 'RUTReceptor', 'RUT Emisor')
+    razon_social = _columna(fila, 'razon_social_receptor', 'Razón Social Receptor', 'RazonSocialReceptor', 'Razón Social')
+    fecha_emision_str = _columna(fila, 'fecha_emision', 'Fecha Emisión', 'FechaEmision', 'Fecha')
+    fecha_vencimiento_str = _columna(fila, 'fecha_vencimiento')
+    monto_total_str = _columna(fila, 'monto_total', 'Monto Total', 'MontoTotal', 'Total', defecto='0')
+    monto_pendiente_str = _columna(fila, 'monto_pendiente', defecto='0')
+    estado_pago = _columna(fila, 'estado_pago').lower()
+    monto_neto_str = _columna(fila, 'monto_neto', 'MontoNeto', 'Monto Neto')
+    monto_iva_str = _columna(fila, 'monto_iva', 'IVA', 'Monto IVA')
+    monto_exento_str = _columna(fila, 'monto_exento', 'MontoExento', 'Monto Exento')
+    estado_sii = _columna(fila, 'estado_sii', 'EstadoSII', 'Estado SII')
+
+    # Validar datos mínimos requeridos
+    if not numero_factura:
+        raise ErrorFilaImportacion('Falta el folio de la factura')
+    tipo_dte = None
+    if tipo_dte_str:
+        if not tipo_dte_str.isdigit():
+            raise ErrorFilaImportacion(f'Tipo de DTE no válido: {tipo_dte_str}')
+        tipo_dte = int(tipo_dte_str)
+        if tipo_dte not in TIPOS_DTE_FACTURA:
+            raise ErrorFilaImportacion(
+                f'El documento tipo {tipo_dte} no es una factura (se importan los tipos 33 y 34)'
+            )
+    if not rut:
+        raise ErrorFilaImportacion('Falta el RUT del receptor')
+    if not razon_social:
+        raise ErrorFilaImportacion('Falta la razón social del receptor')
+    if not fecha_emision_str:
+        raise ErrorFilaImportacion('Falta la fecha de emisión')
+
+    monto_total = parsear_decimal(monto_total_str)
+    monto_pendiente = parsear_decimal(monto_pendiente_str)
+    fecha_emision = parsear_fecha(fecha_emision_str)
+    if fecha_vencimiento_str:
+        fecha_vencimiento = parsear_fecha(fecha_vencimiento_str)
+    else:
+        # Si no hay fecha de vencimiento, usar 30 días después de la emisión
+        fecha_vencimiento = fecha_emision + datetime.timedelta(days=30)
+
+    monto_pagado = monto_total - monto_pendiente if monto_total > 0 else Decimal('0')
+
+    # Estado según estado_pago ("Pago Total", "Pagada"...) o según el saldo
+    estado = 'pendiente'
+    fecha_pago = None
+    if 'pago total' in estado_pago or estado_pago in ('pagada', 'pagado'):
+        estado = 'pagada'
+        fecha_pago = hoy
+    if monto_pendiente == 0:
+        estado = 'pagada'
+        fecha_pago = fecha_pago or hoy
+        monto_pagado = monto_total
+
+    return {
+        'row_num': numero_fila,
+        'folio': numero_factura,
+        'rut': rut,
+        'razon_social': razon_social,
+        'fecha_emision': fecha_emision.strftime('%Y-%m-%d'),
+        'fecha_vencimiento': fecha_vencimiento.strftime('%Y-%m-%d') if fecha_vencimiento else '',
+        'monto_total': float(monto_total),
+        'monto_pendiente': float(monto_pendiente),
+        'monto_pagado': float(monto_pagado),
+        'monto_neto': float(parsear_decimal(monto_neto_str)) if monto_neto_str else None,
+        'monto_iva': float(parsear_decimal(monto_iva_str)) if monto_iva_str else None,
+        'monto_exento': float(parsear_decimal(monto_exento_str)) if monto_exento_str else None,
+        'tipo_dte': tipo_dte,
+        'estado_sii': estado_sii[:50],
+        'estado': estado,
+        'fecha_pago': fecha_pago.strftime('%Y-%m-%d') if fecha_pago else None,
+        'valido': True,
+    }
+
+
+def validar_lote(lote, hoy):
+    """
+    Valida un lote de (numero_fila, fila). Retorna (items, errores), con los
+    errores como {'row_num', 'error'}.
+    """
+    items = []
+    errores = []
+    for numero_fila, fila in lote:
+        try:
+            items.append(validar_fila(numero_fila, fila, hoy))
+        except Exception as e:
+            errores.append({'row_num': numero_fila, 'error': str(e)})
+    return items, errores
+
+
+# ========================
+# VALIDACIÓN EN PARALELO POR FRAGMENTOS
+# ========================
+
+# Leer y validar filas es Python puro y ocupa un solo núcleo. Para archivos
+# CSV grandes, el archivo se corta en fragmentos de ~TAMANO_FRAGMENTO bytes
+# que terminan en un salto de línea, y cada fragmento se decodifica, lee y
+# valida en un proceso de un pool. Los resultados se recorren en el orden
+# del archivo y se renumeran, de modo que las filas y los errores quedan con
+# el mismo número que en la lectura en streaming. Supone un registro por
+# línea (como exporta el SII): un campo entre comillas con saltos de línea
+# podría quedar cortado entre dos fragmentos.
+#
+# Solo se paraleliza la lectura y validación: la comparación con las facturas
+# y la inserción en la tabla intermedia siguen en un proceso y suelen ser la
+# mayor parte del análisis (~87% del tiempo en un CSV de 120 mil filas). Por
+# eso el modo está desactivado por defecto y solo acelera archivos cuyo
+# costo está en la lectura (muchas columnas o filas inválidas que no llegan
+# a la tabla intermedia).
+
+TAMANO_FRAGMENTO = 4 * 1024 * 1024
+
+FragmentoValidado = namedtuple('FragmentoValidado', ['tamano', 'registros', 'items', 'errores'])
+
+
+def cabecera_csv(archivo):
+    """
+    Lee la cabecera de un archivo binario con buffer (io.BufferedReader)
+    recién abierto y detecta el delimitador. Retorna (campos, delimitador)
+    y deja el archivo al inicio de la primera fila de datos.
+    """
+    primera = archivo.readline()
+    muestra = archivo.peek(TAMANO_MUESTRA)[:TAMANO_MUESTRA]
+    texto = (primera + muestra).decode('utf-8-sig', errors='ignore')
+    delimitador = detectar_delimitador(texto)
+    campos = next(csv.reader([primera.decode('utf-8-sig')], delimiter=delimitador), [])
+    return campos, delimitador
+
+
+def fragmentos_csv(archivo, tamano=TAMANO_FRAGMENTO):
+    """Genera bloques de bytes de ~`tamano` que terminan en un salto de línea"""
+    while True:
+        datos = archivo.read(tamano)
+        if not datos:
+            return
+        yield datos + archivo.readline()
+
+
+def validar_fragmento(datos, campos, delimitador, hoy):
+    """
+    Lee y valida las filas de un fragmento (se ejecuta en un proceso del
+    pool). Las filas se numeran desde 0 dentro del fragmento.
+    """
+    lineas = datos.decode('utf-8').splitlines(keepends=True)
+    lote = list(enumerate(csv.DictReader(lineas, fieldnames=campos, delimiter=delimitador)))
+    items, errores = validar_lote(lote, hoy)
+    return FragmentoValidado(len(datos), len(lote), items, errores)
+
+
+def validar_csv_en_paralelo(archivo, hoy, pool, en_curso, tamano=TAMANO_FRAGMENTO):
+    """
+    Genera un FragmentoValidado por fragmento de ~`tamano` bytes del CSV, en
+    el orden del archivo y con las filas numeradas como en leer_filas_csv().
+    Mantiene a lo más `en_curso` fragmentos enviados al pool, de modo que la
+    memoria no depende del tamaño del archivo.
+    """
+    campos, delimitador = cabecera_csv(archivo)
+    pendientes = deque()
+    numero_fila = 2
+
+    def siguiente():
+        nonlocal numero_fila
+        fragmento = pendientes.popleft().result()
+        for registro in itertools.chain(fragmento.items, fragmento.errores):
+            registro['row_num'] += numero_fila
+        numero_fila += fragmento.registros
+        return fragmento
+
+    for datos in fragmentos_csv(archivo, tamano):
+        pendientes.append(pool.submit(validar_fragmento, datos, campos, delimitador, hoy))
+        if len(pendientes) >= en_curso:
+            yield siguiente()
+    while pendientes:
+        yield siguiente()
+
+
+# ========================
+# COMPARACIÓN CON LAS FACTURAS EXISTENTES
+# ========================
+
+# Campos que la vista previa compara con la factura existente: (campo, etiqueta)
+CAMPOS_COMPARADOS = [
+    ('cliente__nombre', 'Cliente'),
+    ('monto_total', 'Total'),
+    ('monto_pendiente', 'Pendiente'),
+    ('estado', 'Estado'),
+    ('fecha_vencimiento', 'Vencimiento'),
+]
+
+
+def _valor_comparable(campo, valor):
+    """Normaliza un valor del ítem o de la base de datos para compararlo y mostrarlo"""
+    if valor is None:
+        return ''
+    if campo in ('monto_total', 'monto_pendiente'):
+        return f'{Decimal(str(valor)):.0f}'
+    if isinstance(valor, datetime.date):
+        return valor.isoformat()
+    return str(valor)
+
+
+def comparar_con_existentes(usuario, items):
+    """
+    Marca cada ítem de un lote de la vista previa con 'existe' y 'cambios'
+    (lista de {'campo', 'antes', 'despues'} con lo que la importación
+    modificaría). Resuelve todo el lote con una consulta IN que trae además
+    el estado actual de las facturas existentes. Como en la fusión, el folio
+    se busca en todas las cuentas (numero_factura es único global): si es de
+    otra cuenta el ítem se marca 'ajena' y fila_intermedia() lo rechaza.
+    """
+    actuales = {
+        fila['numero_factura']: fila
+        for fila in Factura.objects.filter(
+            numero_factura__in={item['folio'] for item in items},
+        ).values('numero_factura', 'usuario_id', *[campo for campo, etiqueta in CAMPOS_COMPARADOS])
+    }
+
+    for item in items:
+        actual = actuales.get(item['folio'])
+        item['ajena'] = actual is not None and actual['usuario_id'] != usuario.pk
+        item['existe'] = actual is not None and not item['ajena']
+        item['cambios'] = []
+        if not item['existe']:
+            continue
+        nuevo = dict(item, cliente__nombre=item['razon_social'])
+        for campo, etiqueta in CAMPOS_COMPARADOS:
+            antes = _valor_comparable(campo, actual[campo])
+            despues = _valor_comparable(campo, nuevo[campo])
+            if antes != despues:
+                item['cambios'].append({'campo': etiqueta, 'antes': antes, 'despues': despues})
+    return items
+
+
+# ========================
+# TABLA INTERMEDIA Y FUSIÓN
+# ========================
+
+# El análisis deja las filas válidas del archivo en FilaImportacion, ligadas
+# a su TrabajoImportacion. La vista previa se resume y pagina con SQL sobre
+# esa tabla, y la confirmación la fusiona con las facturas con consultas
+# sobre conjuntos (UPDATE con subconsultas e INSERT ... SELECT), sin volver
+# a leer el archivo ni cargar las filas en memoria. Como la fusión no pasa
+# por save() ni por las señales, al final se reconstruyen el resumen de
+# cartera y los contadores de clientes y se invalida la caché del usuario.
+
+ResultadoImportacion = namedtuple('ResultadoImportacion', ['creadas', 'actualizadas', 'errores'])
+
+# Mayor folio numérico que cabe en Factura.folio (IntegerField)
+FOLIO_MAXIMO = 2 ** 31 - 1
+
+
+def _monto_campo(campo, valor):
+    """
+    Convierte un monto del ítem al Decimal del campo de FilaImportacion (las
+    facturas usan la misma precisión). Lanza ErrorFilaImportacion si no cabe
+    en max_digits/decimal_places, para que la fila se informe sola y no haga
+    fallar el lote completo.
+    """
+    if valor is None:
+        return None
+    field = FilaImportacion._meta.get_field(campo)
+    monto = Decimal(str(valor))
+    if not monto.is_finite() or abs(monto) >= Decimal(10) ** (field.max_digits - field.decimal_places):
+        raise ErrorFilaImportacion(f'El {campo.replace("_", " ")} excede el máximo permitido: {valor}')
+    return monto.quantize(Decimal(1).scaleb(-field.decimal_places))
+
+
+def fila_intermedia(trabajo, item):
+    """Convierte un ítem validado y comparado en su FilaImportacion (sin guardar)"""
+    if len(item['folio']) > 50:
+        raise ErrorFilaImportacion('El folio no puede tener más de 50 caracteres')
+    if item.get('ajena'):
+        raise ErrorFilaImportacion(f'El folio {item["folio"]} ya está registrado en otra cuenta')
+    rut = formatear_rut(item['rut'])
+    rut_numero, rut_dv = normalizar_rut(rut)
+    folio = item['folio']
+    return FilaImportacion(
+        trabajo=trabajo,
+        numero_fila=item['row_num'],
+        folio=folio,
+        folio_dte=int(folio) if folio.isdigit() and int(folio) <= FOLIO_MAXIMO else None,
+        tipo_dte=item.get('tipo_dte'),
+        rut=rut[:20],
+        rut_numero=rut_numero,
+        rut_dv=rut_dv,
+        razon_social=item['razon_social'][:200],
+        fecha_emision=datetime.date.fromisoformat(item['fecha_emision']),
+        fecha_vencimiento=datetime.date.fromisoformat(item['fecha_vencimiento']),
+        fecha_pago=datetime.date.fromisoformat(item['fecha_pago']) if item.get('fecha_pago') else None,
+        monto_total=_monto_campo('monto_total', item['monto_total']),
+        monto_pagado=_monto_campo('monto_pagado', item['monto_pagado']),
+        monto_pendiente=_monto_campo('monto_pendiente', item['monto_pendiente']),
+        monto_neto=_monto_campo('monto_neto', item.get('monto_neto')),
+        monto_iva=_monto_campo('monto_iva', item.get('monto_iva')),
+        monto_exento=_monto_campo('monto_exento', item.get('monto_exento')),
+        estado=item['estado'],
+        estado_sii=item.get('estado_sii', ''),
+        existe=item['existe'],
+        con_cambios=bool(item['cambios']),
+        cambios=item['cambios'],
+    )
+
+
+def guardar_lote_intermedio(trabajo, items):
+    """
+    Inserta en la tabla intermedia un lote de ítems ya comparados con las
+    facturas existentes. Retorna los errores de conversión como {'row_num', 'error'}.
+    """
+    filas = []
+    errores = []
+    for item in items:
+        try:
+            filas.append(fila_intermedia(trabajo, item))
+        except Exception as e:
+            errores.append({'row_num': item['row_num'], 'error': str(e)})
+    FilaImportacion.objects.bulk_create(filas, batch_size=TAMANO_LOTE)
+    return errores
+
+
+def descartar_folios_repetidos(trabajo):
+    """
+    Deja una fila por folio en la tabla intermedia del trabajo: si un folio
+    aparece varias veces en el archivo, gana la última fila. Retorna cuántas
+    filas se descartaron.
+    """
+    filas = FilaImportacion.objects.filter(trabajo=trabajo)
+    descartadas, _ = filas.filter(Exists(
+        filas.filter(folio=OuterRef('folio'), numero_fila__gt=OuterRef('numero_fila'))
+    )).delete()
+    return descartadas
+
+
+def resumen_intermedio(trabajo):
+    """Totales de la vista previa en un solo aggregate sobre la tabla intermedia"""
+    resumen = FilaImportacion.objects.filter(trabajo=trabajo).aggregate(
+        nuevas=Count('pk', filter=Q(existe=False)),
+        actualizadas=Count('pk', filter=Q(existe=True, con_cambios=True)),
+        sin_cambios=Count('pk', filter=Q(existe=True, con_cambios=False)),
+        pagadas=Count('pk', filter=Q(estado='pagada')),
+        pendientes=Count('pk', filter=Q(estado='pendiente')),
+        total_monto=Sum('monto_total'),
+        total_pendiente=Sum('monto_pendiente'),
+    )
+    return {clave: valor or 0 for clave, valor in resumen.items()}
+
+
+def _resolver_clientes(usuario, filas):
+    """Asigna a cada fila sin cliente el cliente del usuario con su RUT (el más antiguo si hay duplicados)"""
+    clientes = Cliente.objects.filter(usuario=usuario).order_by('pk')
+    filas.filter(cliente__isnull=True, rut_numero__isnull=False).update(cliente_id=Subquery(
+        clientes.filter(rut_numero=OuterRef('rut_numero'), rut_dv=OuterRef('rut_dv')).values('pk')[:1]
+    ))
+    filas.filter(cliente__isnull=True, rut_numero__isnull=True).update(cliente_id=Subquery(
+        clientes.filter(rut=OuterRef('rut')).values('pk')[:1]
+    ))
+
+
+def _insertar_facturas_nuevas(trabajo, fila_pk=None):
+    """
+    INSERT ... SELECT de las filas sin factura existente (o solo de la fila
+    `fila_pk`). Las columnas que no vienen del archivo reciben el valor por
+    defecto del modelo (los defaults de Django no existen en la base de
+    datos). Retorna las filas insertadas.
+    """
+    connection = connections[FilaImportacion.objects.db]
+    desde_fila = {
+        'usuario_id': ('%s', [trabajo.usuario_id]),
+        'cliente_id': ('f.cliente_id', []),
+        'numero_factura': ('f.folio', []),
+        'monto': ('f.monto_total', []),
+        'monto_total': ('f.monto_total', []),
+        'monto_pagado': ('f.monto_pagado', []),
+        'monto_pendiente': ('f.monto_pendiente', []),
+        'fecha_emision': ('f.fecha_emision', []),
+        'fecha_vencimiento': ('f.fecha_vencimiento', []),
+        'fecha_pago': ('f.fecha_pago', []),
+        'estado': ('f.estado', []),
+        'descripcion': ("%s || f.razon_social", ['Importado desde SII - ']),
+        'tipo_dte': ('f.tipo_dte', []),
+        'folio': ('f.folio_dte', []),
+        'monto_neto': ('f.monto_neto', []),
+        'monto_iva': ('f.monto_iva', []),
+    }
+    # Columnas opcionales del archivo: si la fila no las trae, el default del modelo
+    opcionales = {
+        'monto_exento': 'f.monto_exento',
+        'estado_sii': "NULLIF(f.estado_sii, '')",
+    }
+
+    columnas = []
+    valores = []
+    parametros = []
+    for campo in Factura._meta.concrete_fields:
+        if campo.primary_key:
+            continue
+        if campo.attname in desde_fila:
+            valor, params = desde_fila[campo.attname]
+        elif campo.attname in opcionales:
+            valor = f'COALESCE({opcionales[campo.attname]}, %s)'
+            params = [campo.get_db_prep_save(campo.get_default(), connection)]
+        elif getattr(campo, 'auto_now', False) or getattr(campo, 'auto_now_add', False):
+            valor, params = '%s', [campo.get_db_prep_save(timezone.now(), connection)]
+        else:
+            valor, params = '%s', [campo.get_db_prep_save(campo.get_default(), connection)]
+        columnas.append(connection.ops.quote_name(campo.column))
+        valores.append(valor)
+        parametros.extend(params)
+
+    sql = (
+        f'INSERT INTO {connection.ops.quote_name(Factura._meta.db_table)} ({", ".join(columnas)}) '
+        f'SELECT {", ".join(valores)} FROM {connection.ops.quote_name(FilaImportacion._meta.db_table)} f '
+        'WHERE f.trabajo_id = %s AND f.factura_id IS NULL'
+    )
+    parametros.append(trabajo.pk)
+    if fila_pk is not None:
+        sql += ' AND f.id = %s'
+        parametros.append(fila_pk)
+    sql += ' ORDER BY f.numero_fila'
+    with connection.cursor() as cursor:
+        cursor.execute(sql, parametros)
+        return cursor.rowcount
+
+
+def _fusionar_filas(trabajo, filas, hoy, fila_pk=None):
+    """
+    Pasos 2 a 6 de importar_intermedia() sobre `filas` (todas las del trabajo
+    o solo la fila `fila_pk`). Retorna un ResultadoImportacion.
+    """
+    usuario = trabajo.usuario
+    errores = []
+
+    # 2. Facturas existentes por folio (numero_factura es único global)
+    filas.update(factura_id=Subquery(
+        Factura.objects.filter(numero_factura=OuterRef('folio')).order_by().values('pk')[:1]
+    ))
+    ajenas = filas.filter(factura__isnull=False).exclude(factura__usuario=usuario)
+    for numero_fila, folio in ajenas.values_list('numero_fila', 'folio'):
+        errores.append({'row_num': numero_fila, 'error': f'El folio {folio} ya está registrado en otra cuenta'})
+    ajenas.delete()
+
+    # 3. Clientes: crear los que faltan (uno por RUT, con la razón social de su última fila)
+    _resolver_clientes(usuario, filas)
+    ultimas = filas.filter(cliente__isnull=True).values('rut').annotate(ultima=Max('numero_fila'))
+    nuevos = [
+        Cliente(
+            usuario=usuario,
+            nombre=razon_social,
+            rut=rut,
+            rut_numero=rut_numero,
+            rut_dv=rut_dv,
+            email=f'{rut.replace("-", "").replace(".", "")}@temp.com',
+            activo=True,
+        )
+        for rut, rut_numero, rut_dv, razon_social in filas.filter(
+            numero_fila__in=ultimas.values('ultima')
+        ).values_list('rut', 'rut_numero', 'rut_dv', 'razon_social')
+    ]
+    Cliente.objects.bulk_create(nuevos, batch_size=TAMANO_LOTE)
+    _resolver_clientes(usuario, filas)
+
+    # ... y actualizar la razón social de los existentes que cambió
+    razon_importada = Subquery(
+        filas.filter(cliente_id=OuterRef('pk')).order_by('-numero_fila').values('razon_social')[:1]
+    )
+    renombrados = Cliente.objects.filter(pk__in=filas.values('cliente_id')).annotate(
+        razon_importada=razon_importada
+    ).exclude(nombre=F('razon_importada'))
+    Cliente.objects.filter(pk__in=renombrados.values('pk')).update(nombre=razon_importada)
+
+    # 4. Facturas existentes: un UPDATE con el valor de su fila (única tras el paso 1;
+    # sin ORDER BY para que la subconsulta use el índice de factura_id)
+    fila_factura = filas.filter(factura_id=OuterRef('pk')).order_by()
+    valores = {
+        campo: Subquery(fila_factura.values(columna)[:1])
+        for campo, columna in [
+            ('cliente_id', 'cliente_id'), ('monto', 'monto_total'), ('monto_total', 'monto_total'),
+            ('monto_pagado', 'monto_pagado'), ('monto_pendiente', 'monto_pendiente'),
+            ('fecha_emision', 'fecha_emision'), ('fecha_vencimiento', 'fecha_vencimiento'),
+            ('fecha_pago', 'fecha_pago'), ('estado', 'estado'),
+        ]
+    }
+    # Las columnas opcionales que la fila no trae conservan el valor de la factura
+    for campo, columna in [
+        ('tipo_dte', 'tipo_dte'), ('folio', 'folio_dte'), ('monto_neto', 'monto_neto'),
+        ('monto_iva', 'monto_iva'), ('monto_exento', 'monto_exento'),
+    ]:
+        valores[campo] = Coalesce(Subquery(fila_factura.values(columna)[:1]), F(campo))
+    valores['estado_sii'] = Coalesce(
+        NullIf(Subquery(fila_factura.values('estado_sii')[:1]), Value('')), F('estado_sii'),
+    )
+    valores['descripcion'] = Concat(
+        Value('Importado desde SII - '), Subquery(fila_factura.values('razon_social')[:1]),
+        output_field=CharField(),
+    )
+    actualizadas = Factura.objects.filter(pk__in=filas.values('factura_id')).update(**valores)
+
+    # 5. Facturas nuevas: INSERT ... SELECT desde la tabla intermedia
+    creadas = _insertar_facturas_nuevas(trabajo, fila_pk)
+
+    # 6. Lo que haría save(): estado de cobranza según la fecha de hoy
+    Factura.objects.filter(usuario=usuario, numero_factura__in=filas.values('folio')).update(
+        estado_cobranza=expresion_estado_cobranza(hoy)
+    )
+
+    return ResultadoImportacion(creadas, actualizadas, errores)
+
+
+def importar_intermedia(trabajo, hoy=None):
+    """
+    Fusiona la tabla intermedia del trabajo con las facturas del usuario:
+    crea los clientes que falten (por RUT normalizado), actualiza la razón
+    social de los existentes, actualiza por folio las facturas existentes e
+    inserta las nuevas. Si un folio aparece varias veces en el archivo, gana
+    la última fila; los folios registrados en otra cuenta se informan como
+    errores {'row_num', 'error'}.
+
+    La fusión se intenta con consultas sobre todo el conjunto; si la base de
+    datos rechaza alguna fila, se repite fila por fila (cada una en su
+    savepoint) y las filas rechazadas se informan como errores en vez de
+    deshacer la importación completa.
+
+    No reconstruye los derivados (ver reconstruir_derivados()). Retorna un
+    ResultadoImportacion(creadas, actualizadas, errores).
+    """
+    if hoy is None:
+        hoy = timezone.localdate()
+    filas = FilaImportacion.objects.filter(trabajo=trabajo)
+
+    with transaction.atomic():
+        # 1. Folios repetidos en el archivo: queda la última fila (ya lo hizo el
+        # análisis; se repite por si la tabla cambió)
+        descartar_folios_repetidos(trabajo)
+
+        try:
+            with transaction.atomic():
+                creadas, actualizadas, errores = _fusionar_filas(trabajo, filas, hoy)
+        except DatabaseError:
+            creadas = actualizadas = 0
+            errores = []
+            for fila_pk, numero_fila in filas.order_by('numero_fila').values_list('pk', 'numero_fila'):
+                try:
+                    with transaction.atomic():
+                        resultado = _fusionar_filas(trabajo, filas.filter(pk=fila_pk), hoy, fila_pk)
+                except DatabaseError as e:
+                    errores.append({'row_num': numero_fila, 'error': f'No se pudo importar la fila: {e}'})
+                    continue
+                creadas += resultado.creadas
+                actualizadas += resultado.actualizadas
+                errores.extend(resultado.errores)
+
+    errores.sort(key=lambda error: error['row_num'] or 0)
+    return ResultadoImportacion(creadas, actualizadas, errores)
+
+
+def reconstruir_derivados(usuario_id):
+    """Reconstruye el resumen de cartera y los contadores de clientes del usuario e invalida su caché"""
+    from .cache_usuario import invalidar_cache_usuario
+    from .contadores_cliente import recalcular_contadores_clientes
+    from .resumen_cartera import reconstruir_resumen_cartera
+
+    with transaction.atomic():
+        reconstruir_resumen_cartera([usuario_id])
+        recalcular_contadores_clientes([usuario_id])
+    transaction.on_commit(lambda: invalidar_cache_usuario(usuario_id))
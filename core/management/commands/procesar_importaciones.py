@@ -0,0 +1,82 @@
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from core.models import TrabajoImportacion
+from core.trabajos_importacion import procesar_trabajo, reencolar_interrumpidos, descartar_previas_vencidas
+
+
+# Segundos entre limpiezas de vistas previas vencidas
+INTERVALO_LIMPIEZA = 3600
+
+
+class Command(BaseCommand):
+    help = 'Procesa en segundo plano las importaciones del SII en cola (análisis y confirmadas) con un pool de procesos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--procesos', type=int, default=2, help='Cantidad de procesos que importan en paralelo')
+        parser.add_argument('--intervalo', type=float, default=2.0, help='Segundos entre consultas a la cola')
+        parser.add_argument('--una-vez', action='store_true', help='Procesar lo que haya en cola y terminar')
+        parser.add_argument(
+            '--procesos-lectura', type=int, default=1,
+            help=(
+                'Procesos que leen y validan en paralelo cada CSV grande (1, por defecto: lectura en streaming). '
+                'Solo acelera archivos cuyo costo está en la lectura: la tabla intermedia se escribe en un proceso'
+            ),
+        )
+
+    def handle(self, *args, **options):
+        procesos = options['procesos']
+        if procesos < 1:
+            raise CommandError('--procesos debe ser mayor que 0')
+        intervalo = options['intervalo']
+        procesos_lectura = options['procesos_lectura']
+        if procesos_lectura < 1:
+            raise CommandError('--procesos-lectura debe ser mayor que 0')
+
+        # Un worker que se detuvo a mitad deja trabajos en proceso: se reencolan
+        reencolados = reencolar_interrumpidos()
+        if reencolados:
+            self.stdout.write(f'{reencolados} trabajos interrumpidos devueltos a la cola')
+
+        en_curso = {}
+        ultima_limpieza = None
+        # Los procesos hijos configuran Django al iniciar (necesario si no se usa fork)
+        with ProcessPoolExecutor(max_workers=procesos, initializer=django.setup) as pool:
+            while True:
+                # Vistas previas abandonadas: una vez por hora
+                if ultima_limpieza is None or time.monotonic() - ultima_limpieza > INTERVALO_LIMPIEZA:
+                    descartadas = descartar_previas_vencidas()
+                    if descartadas:
+                        self.stdout.write(f'{descartadas} vistas previas vencidas descartadas')
+                    ultima_limpieza = time.monotonic()
+
+                cola = TrabajoImportacion.objects.filter(
+                    estado__in=list(TrabajoImportacion.ESTADOS_EN_COLA),
+                ).exclude(pk__in=list(en_curso.values())).order_by('fecha_creacion').values_list('pk', flat=True)
+                nuevos = list(cola[:max(procesos - len(en_curso), 0)])
+
+                # Las conexiones abiertas no deben heredarse en los procesos hijos
+                connections.close_all()
+                for pk in nuevos:
+                    en_curso[pool.submit(procesar_trabajo, pk, procesos_lectura)] = pk
+
+                if not en_curso:
+                    if options['una_vez']:
+                        break
+                    time.sleep(intervalo)
+                    continue
+
+                terminados, _ = wait(en_curso, timeout=intervalo, return_when=FIRST_COMPLETED)
+                for futuro in terminados:
+                    pk = en_curso.pop(futuro)
+                    try:
+                        estado = futuro.result()
+                    except Exception as e:
+                        self.stderr.write(f'Trabajo {pk}: {e}')
+                        continue
+                    if estado is not None:
+                        self.stdout.write(f'Trabajo {pk}: {estado}')
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.contadores_cliente import recalcular_contadores_clientes, verificar_contadores_clientes
+
+
+class Command(BaseCommand):
+    help = 'Verifica y repara los contadores de deuda de los clientes (deuda_pendiente, n_vencidas, etc.)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usuario', type=int, action='append', dest='usuarios',
+                            help='ID de usuario a procesar (puede repetirse). Por defecto, todos.')
+        parser.add_argument('--solo-verificar', action='store_true',
+                            help='Solo compara los contadores con las facturas, sin repararlos')
+
+    def handle(self, *args, **options):
+        usuario_ids = options['usuarios']
+
+        diferencias = verificar_contadores_clientes(usuario_ids)
+        for cliente_id, campo, esperado, almacenado in diferencias:
+            self.stdout.write(f'Cliente {cliente_id} {campo}: esperado {esperado}, almacenado {almacenado}')
+
+        if options['solo_verificar']:
+            if diferencias:
+                raise CommandError(f'{len(diferencias)} diferencias entre los contadores y las facturas')
+            self.stdout.write(self.style.SUCCESS('Los contadores de clientes coinciden con las facturas'))
+            return
+
+        clientes = recalcular_contadores_clientes(usuario_ids)
+        self.stdout.write(f'Contadores recalculados: {clientes} clientes ({len(diferencias)} diferencias corregidas)')
+
+        diferencias = verificar_contadores_clientes(usuario_ids)
+        if diferencias:
+            raise CommandError(f'{len(diferencias)} diferencias después de recalcular los contadores')
+        self.stdout.write(self.style.SUCCESS('Verificación correcta'))
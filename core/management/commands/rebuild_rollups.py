@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.cache_usuario import invalidar_cache_usuario
+from core.models import ResumenCartera
+from core.resumen_cartera import reconstruir_resumen_cartera, verificar_resumen_cartera
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye el resumen de cartera (ResumenCartera) desde las facturas y lo verifica'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usuario', type=int, action='append', dest='usuarios',
+                            help='ID de usuario a procesar (puede repetirse). Por defecto, todos.')
+        parser.add_argument('--solo-verificar', action='store_true',
+                            help='Solo compara el resumen con las facturas, sin reconstruirlo')
+
+    def handle(self, *args, **options):
+        usuario_ids = options['usuarios']
+
+        if options['solo_verificar']:
+            diferencias = verificar_resumen_cartera(usuario_ids)
+            for clave, esperado, almacenado in diferencias:
+                self.stdout.write(f'{clave}: esperado {esperado}, almacenado {almacenado}')
+            if diferencias:
+                raise CommandError(f'{len(diferencias)} diferencias entre el resumen y las facturas')
+            self.stdout.write(self.style.SUCCESS('El resumen de cartera coincide con las facturas'))
+            return
+
+        filas = reconstruir_resumen_cartera(usuario_ids)
+        self.stdout.write(f'Resumen reconstruido: {filas} filas')
+
+        # Los contadores de facturas en caché se calcularon con el resumen anterior
+        if usuario_ids is None:
+            usuario_ids = list(ResumenCartera.objects.values_list('usuario_id', flat=True).distinct())
+        for pk in usuario_ids:
+            invalidar_cache_usuario(pk)
+
+        diferencias = verificar_resumen_cartera(usuario_ids)
+        if diferencias:
+            raise CommandError(f'{len(diferencias)} diferencias después de reconstruir el resumen')
+        self.stdout.write(self.style.SUCCESS('Verificación correcta'))
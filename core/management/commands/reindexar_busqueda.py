@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from core.busqueda import instalar_indices_busqueda
+
+
+class Command(BaseCommand):
+    help = 'Crea los índices de búsqueda de texto completo que falten y reconstruye las tablas FTS de SQLite'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS, help='Base de datos a reindexar')
+
+    def handle(self, *args, **options):
+        instalados = instalar_indices_busqueda(connections[options['database']], reconstruir=True)
+        if instalados:
+            self.stdout.write(self.style.SUCCESS(f"Índices reconstruidos: {', '.join(instalados)}"))
+        else:
+            self.stdout.write('El motor de base de datos no usa índices de búsqueda; se busca con icontains')
@@ -0,0 +1,66 @@
+import datetime
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core.cache_usuario import invalidar_cache_usuario
+from core.cobranza import ESTADOS_COBRANZA, recalcular_estados_cobranza
+from core.contadores_cliente import recalcular_contadores_clientes
+from core.models import Factura, RecalculoCobranza
+from core.resumen_cartera import reconstruir_resumen_cartera
+
+
+class Command(BaseCommand):
+    help = 'Recalcula los estados de cobranza de todos los usuarios para el día actual (America/Santiago)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fecha', help='Fecha a usar como "hoy" (YYYY-MM-DD). Por defecto, la fecha local actual.')
+        parser.add_argument('--batch-size', type=int, default=200, help='Cantidad de usuarios por lote')
+        parser.add_argument('--forzar', action='store_true', help='Recalcular aunque la marca del usuario ya esté al día')
+
+    def handle(self, *args, **options):
+        if options['fecha']:
+            try:
+                hoy = datetime.datetime.strptime(options['fecha'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError(f'Fecha inválida: {options["fecha"]}')
+        else:
+            hoy = timezone.localdate()
+
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size debe ser mayor que 0')
+
+        usuarios = User.objects.order_by('pk')
+        if not options['forzar']:
+            usuarios = usuarios.exclude(recalculo_cobranza__fecha=hoy)
+        usuario_ids = list(usuarios.values_list('pk', flat=True))
+
+        totales = dict.fromkeys(ESTADOS_COBRANZA, 0)
+
+        for inicio in range(0, len(usuario_ids), batch_size):
+            lote = usuario_ids[inicio:inicio + batch_size]
+
+            movidas = recalcular_estados_cobranza(Factura.objects.filter(usuario_id__in=lote), hoy)
+            for estado, filas in movidas.items():
+                totales[estado] += filas
+
+            # Actualizar las marcas existentes y crear las que falten
+            RecalculoCobranza.objects.filter(usuario_id__in=lote).update(fecha=hoy, fecha_actualizacion=timezone.now())
+            RecalculoCobranza.objects.bulk_create(
+                [RecalculoCobranza(usuario_id=pk, fecha=hoy) for pk in lote],
+                ignore_conflicts=True,
+            )
+
+            if any(movidas.values()):
+                reconstruir_resumen_cartera(lote)
+                recalcular_contadores_clientes(lote)
+                for pk in lote:
+                    invalidar_cache_usuario(pk)
+
+            self.stdout.write(f'Lote {inicio // batch_size + 1}: {len(lote)} usuarios, {sum(movidas.values())} facturas movidas')
+
+        self.stdout.write(self.style.SUCCESS(f'Recálculo de cobranza al {hoy:%d/%m/%Y}: {len(usuario_ids)} usuarios procesados'))
+        for estado in ESTADOS_COBRANZA:
+            self.stdout.write(f'  {estado}: {totales[estado]}')
@@ -0,0 +1,287 @@
+import datetime
+
+from django.db.models import Q, Sum, Count, Case, When, F, Value, IntegerField
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .cobranza import ESTADOS_COBRANZA, filtros_estado_cobranza
+
+
+# ========================
+# EXPRESIONES REUTILIZABLES
+# ========================
+
+def expresion_deuda(prefijo=''):
+    """
+    Saldo por cobrar de una factura: monto_pendiente si hay abonos, si no monto_total.
+    `prefijo` permite usarla desde otro modelo (ej: 'facturas__' desde Cliente).
+    """
+    return Case(
+        When(**{f'{prefijo}monto_pendiente__gt': 0}, then=F(f'{prefijo}monto_pendiente')),
+        default=F(f'{prefijo}monto_total')
+    )
+
+
+def expresion_monto_facturado():
+    """Monto facturado: monto_total, o monto si la factura no tiene total"""
+    return Case(
+        When(monto_total__gt=0, then=F('monto_total')),
+        default=F('monto')
+    )
+
+
+# Sufijo de contexto de cada estado de cobranza en el dashboard
+SUFIJOS_COBRANZA = {
+    'vigente': 'vigentes',
+    'por_vencer': 'por_vencer',
+    'vencida': 'vencidas',
+    'mora': 'en_mora',
+    'incobrable': 'incobrables',
+}
+
+
+def resumen_facturas(facturas, hoy=None):
+    """
+    Calcula en un solo aggregate() todas las métricas del dashboard sobre
+    el QuerySet de facturas recibido.
+
+    Retorna un diccionario con contadores por estado y por estado de
+    cobranza (calculado a partir de fecha_vencimiento), montos, pagos
+    parciales y los conteos usados por las alertas. El mapa de vencimiento
+    se calcula aparte con mapa_vencimiento().
+    Los montos nulos se normalizan a 0.
+    """
+    if hoy is None:
+        hoy = timezone.localdate()
+
+    pendiente = Q(estado='pendiente')
+    tramos = filtros_estado_cobranza(hoy)
+    deuda = expresion_deuda()
+
+    metricas = {
+        # Contadores por estado principal
+        'total_facturas': Count('id'),
+        'facturas_pendientes': Count('id', filter=pendiente),
+        'facturas_pagadas': Count('id', filter=Q(estado='pagada')),
+        'facturas_anuladas': Count('id', filter=Q(estado='anulada')),
+
+        # Totales
+        'total_pendiente': Sum('monto_pendiente', filter=pendiente),
+        'total_pagado': Sum('monto_pagado'),
+        'total_facturado': Sum('monto_total'),
+        'deuda_total': Sum(deuda, filter=pendiente),
+        'monto_pagadas': Sum(expresion_monto_facturado(), filter=Q(estado='pagada')),
+
+        # Pagos parciales
+        'facturas_pago_parcial': Count('id', filter=pendiente & Q(monto_pagado__gt=0, monto_pendiente__gt=0)),
+        'monto_pagos_parciales': Sum('monto_pagado', filter=pendiente & Q(monto_pagado__gt=0)),
+
+        # Alertas
+        'facturas_vencidas_mes': Count('id', filter=pendiente & Q(
+            fecha_vencimiento__gte=hoy.replace(day=1),
+            fecha_vencimiento__lt=hoy,
+        )),
+        'facturas_por_vencer_pronto': Count('id', filter=pendiente & Q(
+            fecha_vencimiento__gte=hoy,
+            fecha_vencimiento__lte=hoy + datetime.timedelta(days=7),
+        )),
+        'facturas_sin_vencimiento': Count('id', filter=pendiente & Q(fecha_vencimiento__isnull=True)),
+        'deuda_mora': Sum(deuda, filter=pendiente & tramos['mora']),
+    }
+
+    # Contadores y montos por estado de cobranza
+    for estado in ESTADOS_COBRANZA:
+        sufijo = SUFIJOS_COBRANZA[estado]
+        metricas[f'facturas_{sufijo}'] = Count('id', filter=pendiente & tramos[estado])
+        metricas[f'monto_{sufijo}'] = Sum('monto_pendiente', filter=pendiente & tramos[estado])
+
+    resumen = facturas.order_by().aggregate(**metricas)
+    return {clave: valor or 0 for clave, valor in resumen.items()}
+
+
+def resumen_cliente(facturas, hoy=None):
+    """
+    KPIs del detalle de un cliente en un solo aggregate(): contadores por
+    estado, montos facturado/pagado/pendiente y saldo vigente, por vencer y
+    vencido (estados de cobranza calculados con la fecha de hoy).
+    """
+    if hoy is None:
+        hoy = timezone.localdate()
+
+    pendiente = Q(estado='pendiente')
+    tramos = filtros_estado_cobranza(hoy)
+    vencido = tramos['vencida'] | tramos['mora'] | tramos['incobrable']
+    deuda = expresion_deuda()
+    facturado = expresion_monto_facturado()
+
+    resumen = facturas.order_by().aggregate(
+        total_facturas=Count('id'),
+        facturas_pagadas=Count('id', filter=Q(estado='pagada')),
+        facturas_pendientes=Count('id', filter=pendiente),
+        facturas_vencidas=Count('id', filter=pendiente & vencido),
+        total_facturado=Sum(facturado),
+        total_pagado=Sum(facturado, filter=Q(estado='pagada')),
+        total_pendiente=Sum(deuda, filter=pendiente),
+        monto_vigente=Sum(deuda, filter=pendiente & tramos['vigente']),
+        monto_por_vencer=Sum(deuda, filter=pendiente & tramos['por_vencer']),
+        monto_vencido=Sum(deuda, filter=pendiente & vencido),
+    )
+    return {clave: valor or 0 for clave, valor in resumen.items()}
+
+
+# ========================
+# MAPA DE VENCIMIENTO
+# ========================
+
+LIMITES_VENCIMIENTO = (30, 60, 90)
+# Tope de los límites: más allá de diez años el tramo no aporta y restar los
+# días a la fecha de hoy se sale del rango de datetime.date
+LIMITE_MAXIMO_VENCIMIENTO = 3650
+
+
+def tramos_vencimiento(limites=LIMITES_VENCIMIENTO):
+    """
+    Convierte una lista de límites en días (ej: 30, 60, 90) en tramos
+    [(desde, hasta, etiqueta)], con un último tramo abierto (+90).
+
+    Lanza ValueError si algún límite no es positivo o supera
+    LIMITE_MAXIMO_VENCIMIENTO.
+    """
+    limites = sorted(set(int(limite) for limite in limites))
+    if not limites or limites[0] <= 0:
+        raise ValueError('Los límites deben ser días positivos')
+    if limites[-1] > LIMITE_MAXIMO_VENCIMIENTO:
+        raise ValueError(f'Los límites no pueden superar {LIMITE_MAXIMO_VENCIMIENTO} días')
+
+    tramos = []
+    desde = 0
+    for hasta in limites:
+        etiqueta = f'{desde + 1 if desde else 0}-{hasta}'
+        tramos.append((desde, hasta, etiqueta))
+        desde = hasta
+    tramos.append((desde, None, f'+{desde}'))
+    return tramos
+
+
+def mapa_vencimiento(facturas, limites=LIMITES_VENCIMIENTO, hoy=None, por_cliente=False, por_moneda=False):
+    """
+    Agrupa las facturas pendientes vencidas por tramo de días vencidos en
+    una sola consulta (CASE sobre fecha_vencimiento + GROUP BY).
+
+    Retorna una lista de diccionarios con 'tramo', 'desde', 'hasta',
+    'cantidad' y 'monto' (saldo por cobrar). Si se agrupa por cliente o por
+    moneda, cada fila incluye además 'cliente_id'/'cliente' o 'moneda' y
+    solo aparecen las combinaciones con facturas; sin agrupar, se incluyen
+    todos los tramos aunque estén vacíos.
+    """
+    if hoy is None:
+        hoy = timezone.localdate()
+    tramos = tramos_vencimiento(limites)
+
+    # Primer When que calce: tramos ordenados del más reciente al más antiguo
+    indice_tramo = Case(
+        *[
+            When(fecha_vencimiento__gte=hoy - datetime.timedelta(days=hasta), then=Value(i))
+            for i, (desde, hasta, etiqueta) in enumerate(tramos[:-1])
+        ],
+        default=Value(len(tramos) - 1),
+        output_field=IntegerField(),
+    )
+
+    agrupacion = ['indice_tramo']
+    if por_cliente:
+        agrupacion += ['cliente_id', 'cliente__nombre']
+    if por_moneda:
+        agrupacion.append('moneda')
+
+    grupos = facturas.filter(
+        estado='pendiente',
+        fecha_vencimiento__lt=hoy,
+    ).order_by().annotate(
+        indice_tramo=indice_tramo
+    ).values(*agrupacion).annotate(
+        cantidad=Count('id'),
+        monto=Sum(expresion_deuda()),
+    ).order_by(*agrupacion)
+
+    def fila(indice, cantidad, monto):
+        desde, hasta, etiqueta = tramos[indice]
+        return {'tramo': etiqueta, 'desde': desde, 'hasta': hasta, 'cantidad': cantidad, 'monto': monto or 0}
+
+    if not (por_cliente or por_moneda):
+        por_indice = {g['indice_tramo']: g for g in grupos}
+        return [
+            fila(i, por_indice.get(i, {}).get('cantidad', 0), por_indice.get(i, {}).get('monto'))
+            for i in range(len(tramos))
+        ]
+
+    resultado = []
+    for grupo in grupos:
+        item = fila(grupo['indice_tramo'], grupo['cantidad'], grupo['monto'])
+        if por_cliente:
+            item['cliente_id'] = grupo['cliente_id']
+            item['cliente'] = grupo['cliente__nombre']
+        if por_moneda:
+            item['moneda'] = grupo['moneda']
+        resultado.append(item)
+    return resultado
+
+
+# ========================
+# TENDENCIA MENSUAL
+# ========================
+
+VENTANAS_TENDENCIA = (3, 12, 24, 36)
+
+
+def meses_ventana(meses=12, hoy=None):
+    """Primer día de cada uno de los últimos `meses` meses calendario, terminando en el mes de hoy"""
+    if meses not in VENTANAS_TENDENCIA:
+        raise ValueError(f'La ventana debe ser una de {VENTANAS_TENDENCIA} meses')
+    if hoy is None:
+        hoy = timezone.localdate()
+
+    indice_actual = hoy.year * 12 + hoy.month - 1
+    return [
+        datetime.date(indice // 12, indice % 12 + 1, 1)
+        for indice in range(indice_actual - meses + 1, indice_actual + 1)
+    ]
+
+
+def _mes_siguiente(mes):
+    return datetime.date(mes.year + mes.month // 12, mes.month % 12 + 1, 1)
+
+
+def serie_mensual(facturas, desde, hasta):
+    """
+    Cantidad, monto facturado y monto cobrado de las facturas emitidas en
+    cada mes entre `desde` y `hasta` (primeros días de mes, ambos incluidos).
+
+    El rango se acota en la consulta (fecha_emision) y se agrupa por mes en
+    un solo GROUP BY; los meses sin facturas se completan con ceros. El monto
+    cobrado es lo pagado de las facturas emitidas en el mes.
+    """
+    grupos = facturas.filter(
+        fecha_emision__gte=desde,
+        fecha_emision__lt=_mes_siguiente(hasta),
+    ).order_by().annotate(
+        mes=TruncMonth('fecha_emision')
+    ).values('mes').annotate(
+        cantidad=Count('id'),
+        facturado=Sum(expresion_monto_facturado()),
+        cobrado=Sum('monto_pagado'),
+    )
+    por_mes = {grupo['mes']: grupo for grupo in grupos}
+
+    serie = []
+    mes = desde
+    while mes <= hasta:
+        grupo = por_mes.get(mes, {})
+        serie.append({
+            'mes': mes,
+            'cantidad': grupo.get('cantidad', 0),
+            'facturado': grupo.get('facturado') or 0,
+            'cobrado': grupo.get('cobrado') or 0,
+        })
+        mes = _mes_siguiente(mes)
+    return serie
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.2 on 2026-10-17 02:51
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0009_remove_importar_sii_activo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecalculoCobranza',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True)),
+                ('usuario', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='recalculo_cobranza', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
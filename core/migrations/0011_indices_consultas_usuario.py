@@ -0,0 +1,37 @@
+# Generated by Django 4.2.2 on 2026-10-17 02:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_recalculo_cobranza'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cliente',
+            index=models.Index(condition=models.Q(('activo', True)), fields=['usuario', 'nombre'], name='cliente_usr_activo_nombre_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='factura',
+            index=models.Index(fields=['usuario', 'estado', 'estado_cobranza', 'fecha_emision'], name='factura_usr_estado_cob_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='factura',
+            index=models.Index(fields=['usuario', 'estado', 'fecha_vencimiento'], name='factura_usr_estado_venc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='factura',
+            index=models.Index(fields=['usuario', 'fecha_emision'], name='factura_usr_emision_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='factura',
+            index=models.Index(fields=['cliente', 'estado'], name='factura_cliente_estado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='factura',
+            index=models.Index(condition=models.Q(('estado', 'pendiente')), fields=['usuario', 'fecha_vencimiento'], name='factura_pend_venc_idx'),
+        ),
+    ]
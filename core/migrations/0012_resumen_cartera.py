@@ -0,0 +1,60 @@
+# Generated by Django 4.2.2 on 2026-10-17 02:56
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum, Count
+import django.db.models.deletion
+
+
+def poblar_resumen_cartera(apps, schema_editor):
+    Factura = apps.get_model('core', 'Factura')
+    ResumenCartera = apps.get_model('core', 'ResumenCartera')
+    grupos = Factura.objects.order_by().values('usuario_id', 'moneda', 'estado', 'estado_cobranza').annotate(
+        cantidad=Count('id'),
+        total=Sum('monto_total'),
+        pagado=Sum('monto_pagado'),
+        pendiente=Sum('monto_pendiente'),
+    )
+    ResumenCartera.objects.bulk_create([
+        ResumenCartera(
+            usuario_id=grupo['usuario_id'],
+            moneda=grupo['moneda'],
+            estado=grupo['estado'],
+            estado_cobranza=grupo['estado_cobranza'] or '',
+            cantidad=grupo['cantidad'],
+            monto_total=grupo['total'] or 0,
+            monto_pagado=grupo['pagado'] or 0,
+            monto_pendiente=grupo['pendiente'] or 0,
+        )
+        for grupo in grupos
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0011_indices_consultas_usuario'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenCartera',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('moneda', models.CharField(max_length=3)),
+                ('estado', models.CharField(max_length=20)),
+                ('estado_cobranza', models.CharField(blank=True, default='', max_length=20)),
+                ('cantidad', models.IntegerField(default=0)),
+                ('monto_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('monto_pagado', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('monto_pendiente', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumenes_cartera', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='resumencartera',
+            constraint=models.UniqueConstraint(fields=('usuario', 'moneda', 'estado', 'estado_cobranza'), name='resumen_cartera_unico'),
+        ),
+        migrations.RunPython(poblar_resumen_cartera, migrations.RunPython.noop),
+    ]
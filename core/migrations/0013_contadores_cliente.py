@@ -0,0 +1,78 @@
+# Generated by Django 4.2.2 on 2026-10-17 03:03
+
+from django.db import migrations, models
+from django.db.models import Q, F, Sum, Count, Max, Case, When
+
+
+def poblar_contadores_cliente(apps, schema_editor):
+    Cliente = apps.get_model('core', 'Cliente')
+    Factura = apps.get_model('core', 'Factura')
+    pendiente = Q(estado='pendiente')
+    grupos = Factura.objects.order_by().values('cliente_id').annotate(
+        deuda_pendiente=Sum(
+            Case(When(monto_pendiente__gt=0, then=F('monto_pendiente')), default=F('monto_total')),
+            filter=pendiente,
+        ),
+        n_vencidas=Count('id', filter=pendiente & Q(estado_cobranza__in=['vencida', 'mora', 'incobrable'])),
+        n_mora=Count('id', filter=pendiente & Q(estado_cobranza='mora')),
+        n_facturas=Count('id'),
+        n_pagadas=Count('id', filter=Q(estado='pagada')),
+        ultima_emision=Max('fecha_emision'),
+    )
+    clientes = []
+    for grupo in grupos:
+        cliente = Cliente(pk=grupo.pop('cliente_id'))
+        grupo['deuda_pendiente'] = grupo['deuda_pendiente'] or 0
+        for campo, valor in grupo.items():
+            setattr(cliente, campo, valor)
+        clientes.append(cliente)
+    Cliente.objects.bulk_update(
+        clientes,
+        ['deuda_pendiente', 'n_vencidas', 'n_mora', 'n_facturas', 'n_pagadas', 'ultima_emision'],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_resumen_cartera'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cliente',
+            name='deuda_pendiente',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=14),
+        ),
+        migrations.AddField(
+            model_name='cliente',
+            name='n_facturas',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='cliente',
+            name='n_mora',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='cliente',
+            name='n_pagadas',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='cliente',
+            name='n_vencidas',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Facturas pendientes vencidas, en mora o incobrables'),
+        ),
+        migrations.AddField(
+            model_name='cliente',
+            name='ultima_emision',
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='cliente',
+            index=models.Index(condition=models.Q(('activo', True)), fields=['usuario', '-deuda_pendiente'], name='cliente_usr_deuda_idx'),
+        ),
+        migrations.RunPython(poblar_contadores_cliente, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,91 @@
+from django.db import migrations
+
+
+# SQL congelado al momento de esta migración (no se importa core.busqueda: si
+# ese módulo cambia, esta migración debe seguir creando lo mismo). El receptor
+# de post_migrate de core.busqueda recrea después lo que falte.
+
+SQLITE_INSTALAR = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS core_factura_fts USING fts5("
+    "numero_factura, descripcion, content='core_factura', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS core_factura_fts_ai AFTER INSERT ON core_factura BEGIN "
+    "INSERT INTO core_factura_fts(rowid, numero_factura, descripcion) "
+    "VALUES (new.id, new.numero_factura, new.descripcion); END",
+    "CREATE TRIGGER IF NOT EXISTS core_factura_fts_ad AFTER DELETE ON core_factura BEGIN "
+    "INSERT INTO core_factura_fts(core_factura_fts, rowid, numero_factura, descripcion) "
+    "VALUES ('delete', old.id, old.numero_factura, old.descripcion); END",
+    "CREATE TRIGGER IF NOT EXISTS core_factura_fts_au AFTER UPDATE OF numero_factura, descripcion ON core_factura BEGIN "
+    "INSERT INTO core_factura_fts(core_factura_fts, rowid, numero_factura, descripcion) "
+    "VALUES ('delete', old.id, old.numero_factura, old.descripcion); "
+    "INSERT INTO core_factura_fts(rowid, numero_factura, descripcion) "
+    "VALUES (new.id, new.numero_factura, new.descripcion); END",
+    "INSERT INTO core_factura_fts(core_factura_fts) VALUES ('rebuild')",
+
+    "CREATE VIRTUAL TABLE IF NOT EXISTS core_cliente_fts USING fts5("
+    "nombre, rut, email, content='core_cliente', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS core_cliente_fts_ai AFTER INSERT ON core_cliente BEGIN "
+    "INSERT INTO core_cliente_fts(rowid, nombre, rut, email) "
+    "VALUES (new.id, new.nombre, new.rut, new.email); END",
+    "CREATE TRIGGER IF NOT EXISTS core_cliente_fts_ad AFTER DELETE ON core_cliente BEGIN "
+    "INSERT INTO core_cliente_fts(core_cliente_fts, rowid, nombre, rut, email) "
+    "VALUES ('delete', old.id, old.nombre, old.rut, old.email); END",
+    "CREATE TRIGGER IF NOT EXISTS core_cliente_fts_au AFTER UPDATE OF nombre, rut, email ON core_cliente BEGIN "
+    "INSERT INTO core_cliente_fts(core_cliente_fts, rowid, nombre, rut, email) "
+    "VALUES ('delete', old.id, old.nombre, old.rut, old.email); "
+    "INSERT INTO core_cliente_fts(rowid, nombre, rut, email) "
+    "VALUES (new.id, new.nombre, new.rut, new.email); END",
+    "INSERT INTO core_cliente_fts(core_cliente_fts) VALUES ('rebuild')",
+]
+
+SQLITE_ELIMINAR = [
+    'DROP TRIGGER IF EXISTS core_factura_fts_ai',
+    'DROP TRIGGER IF EXISTS core_factura_fts_ad',
+    'DROP TRIGGER IF EXISTS core_factura_fts_au',
+    'DROP TABLE IF EXISTS core_factura_fts',
+    'DROP TRIGGER IF EXISTS core_cliente_fts_ai',
+    'DROP TRIGGER IF EXISTS core_cliente_fts_ad',
+    'DROP TRIGGER IF EXISTS core_cliente_fts_au',
+    'DROP TABLE IF EXISTS core_cliente_fts',
+]
+
+POSTGRESQL_INSTALAR = [
+    'CREATE INDEX IF NOT EXISTS "factura_busqueda_gin" ON "core_factura" USING gin '
+    "((to_tsvector('simple'::regconfig, COALESCE(\"numero_factura\", '') || ' ' || "
+    "COALESCE(\"descripcion\", ''))))",
+    'CREATE INDEX IF NOT EXISTS "cliente_busqueda_gin" ON "core_cliente" USING gin '
+    "((to_tsvector('simple'::regconfig, COALESCE(\"nombre\", '') || ' ' || "
+    "COALESCE(\"rut\", '') || ' ' || COALESCE(\"email\", ''))))",
+]
+
+POSTGRESQL_ELIMINAR = [
+    'DROP INDEX IF EXISTS factura_busqueda_gin',
+    'DROP INDEX IF EXISTS cliente_busqueda_gin',
+]
+
+
+def _ejecutar(schema_editor, sentencias):
+    sentencias = sentencias.get(schema_editor.connection.vendor, [])
+    with schema_editor.connection.cursor() as cursor:
+        for sql in sentencias:
+            cursor.execute(sql)
+
+
+def instalar_indices(apps, schema_editor):
+    _ejecutar(schema_editor, {'sqlite': SQLITE_INSTALAR, 'postgresql': POSTGRESQL_INSTALAR})
+
+
+def eliminar_indices(apps, schema_editor):
+    _ejecutar(schema_editor, {'sqlite': SQLITE_ELIMINAR, 'postgresql': POSTGRESQL_ELIMINAR})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_contadores_cliente'),
+    ]
+
+    operations = [
+        migrations.RunPython(instalar_indices, eliminar_indices),
+    ]
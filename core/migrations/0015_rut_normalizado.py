@@ -0,0 +1,42 @@
+# Generated by Django 4.2.2 on 2026-10-17 03:11
+
+import re
+
+from django.db import migrations, models
+
+
+def poblar_rut_normalizado(apps, schema_editor):
+    Cliente = apps.get_model('core', 'Cliente')
+    clientes = []
+    for cliente in Cliente.objects.exclude(rut='').only('pk', 'rut').iterator():
+        rut_limpio = cliente.rut.upper().replace('.', '').replace('-', '').replace(' ', '')
+        if re.match(r'^[0-9]+[0-9K]$', rut_limpio):
+            cliente.rut_numero = int(rut_limpio[:-1])
+            cliente.rut_dv = rut_limpio[-1]
+            clientes.append(cliente)
+    Cliente.objects.bulk_update(clientes, ['rut_numero', 'rut_dv'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_indices_busqueda'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cliente',
+            name='rut_dv',
+            field=models.CharField(blank=True, default='', editable=False, max_length=1),
+        ),
+        migrations.AddField(
+            model_name='cliente',
+            name='rut_numero',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='cliente',
+            index=models.Index(fields=['usuario', 'rut_numero'], name='cliente_usr_rut_idx'),
+        ),
+        migrations.RunPython(poblar_rut_normalizado, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 4.2.2 on 2026-10-17 03:24
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0015_rut_normalizado'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrabajoImportacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('archivo', models.FileField(blank=True, upload_to='importaciones/%Y/%m/')),
+                ('nombre_archivo', models.CharField(max_length=255)),
+                ('estado', models.CharField(choices=[('pendiente', 'En cola para análisis'), ('analizando', 'Analizando'), ('analizado', 'Listo para confirmar'), ('confirmado', 'En cola para importar'), ('importando', 'Importando'), ('completado', 'Completado'), ('error', 'Error')], default='pendiente', max_length=20)),
+                ('mensaje', models.TextField(blank=True)),
+                ('tamano_archivo', models.PositiveBigIntegerField(default=0)),
+                ('bytes_procesados', models.PositiveBigIntegerField(default=0)),
+                ('filas_procesadas', models.PositiveIntegerField(default=0)),
+                ('filas_con_error', models.PositiveIntegerField(default=0)),
+                ('filas_por_segundo', models.FloatField(default=0)),
+                ('nuevas', models.PositiveIntegerField(default=0)),
+                ('actualizadas', models.PositiveIntegerField(default=0)),
+                ('sin_cambios', models.PositiveIntegerField(default=0)),
+                ('pagadas', models.PositiveIntegerField(default=0)),
+                ('pendientes', models.PositiveIntegerField(default=0)),
+                ('total_monto', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('total_pendiente', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('muestra', models.JSONField(blank=True, default=list)),
+                ('facturas_creadas', models.PositiveIntegerField(default=0)),
+                ('facturas_actualizadas', models.PositiveIntegerField(default=0)),
+                ('errores', models.JSONField(blank=True, default=list)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('fecha_inicio', models.DateTimeField(blank=True, null=True)),
+                ('fecha_fin', models.DateTimeField(blank=True, null=True)),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trabajos_importacion', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-fecha_creacion'],
+                'indexes': [models.Index(fields=['estado', 'fecha_creacion'], name='trabajo_imp_estado_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 4.2.2 on 2026-10-17 03:26
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+def generar_tokens(apps, schema_editor):
+    TrabajoImportacion = apps.get_model('core', 'TrabajoImportacion')
+    for trabajo in TrabajoImportacion.objects.only('pk').iterator():
+        trabajo.token = uuid.uuid4()
+        trabajo.save(update_fields=['token'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_trabajos_importacion'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='trabajoimportacion',
+            name='muestra',
+        ),
+        # Los trabajos existentes necesitan un token distinto cada uno antes del índice único
+        migrations.AddField(
+            model_name='trabajoimportacion',
+            name='token',
+            field=models.UUIDField(editable=False, null=True),
+        ),
+        migrations.RunPython(generar_tokens, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='trabajoimportacion',
+            name='token',
+            field=models.UUIDField(default=uuid.uuid4, editable=False, unique=True),
+        ),
+        migrations.CreateModel(
+            name='FilaImportacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('numero_fila', models.PositiveIntegerField()),
+                ('folio', models.CharField(max_length=50)),
+                ('rut', models.CharField(max_length=20)),
+                ('rut_numero', models.PositiveIntegerField(null=True)),
+                ('rut_dv', models.CharField(blank=True, max_length=1)),
+                ('razon_social', models.CharField(max_length=200)),
+                ('fecha_emision', models.DateField()),
+                ('fecha_vencimiento', models.DateField()),
+                ('fecha_pago', models.DateField(null=True)),
+                ('monto_total', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('monto_pagado', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('monto_pendiente', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('estado', models.CharField(max_length=20)),
+                ('existe', models.BooleanField(default=False)),
+                ('con_cambios', models.BooleanField(default=False)),
+                ('cambios', models.JSONField(default=list)),
+                ('cliente', models.ForeignKey(db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='core.cliente')),
+                ('factura', models.ForeignKey(db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='core.factura')),
+                ('trabajo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='filas', to='core.trabajoimportacion')),
+            ],
+            options={
+                'ordering': ['numero_fila'],
+                'indexes': [
+                    models.Index(fields=['trabajo', 'folio', 'numero_fila'], name='fila_imp_trabajo_folio_idx'),
+                    models.Index(fields=['trabajo', 'cliente', 'numero_fila'], name='fila_imp_trabajo_cliente_idx'),
+                    models.Index(fields=['trabajo', 'factura'], name='fila_imp_trabajo_factura_idx'),
+                ],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='filaimportacion',
+            constraint=models.UniqueConstraint(fields=('trabajo', 'numero_fila'), name='fila_imp_trabajo_fila_unica'),
+        ),
+    ]
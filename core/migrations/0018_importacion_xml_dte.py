@@ -0,0 +1,48 @@
+# Generated by Django 4.2.2 on 2026-10-17 03:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_importacion_intermedia'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='filaimportacion',
+            name='estado_sii',
+            field=models.CharField(blank=True, max_length=50),
+        ),
+        migrations.AddField(
+            model_name='filaimportacion',
+            name='folio_dte',
+            field=models.IntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='filaimportacion',
+            name='monto_exento',
+            field=models.DecimalField(decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='filaimportacion',
+            name='monto_iva',
+            field=models.DecimalField(decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='filaimportacion',
+            name='monto_neto',
+            field=models.DecimalField(decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='filaimportacion',
+            name='tipo_dte',
+            field=models.IntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='trabajoimportacion',
+            name='formato',
+            field=models.CharField(choices=[('csv', 'CSV'), ('xml', 'XML (EnvioDTE)')], default='csv', max_length=3),
+        ),
+    ]
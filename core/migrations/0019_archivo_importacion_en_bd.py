@@ -0,0 +1,44 @@
+# Generated by Django 4.2.2 on 2026-10-17 03:58
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def descartar_trabajos_sin_analizar(apps, schema_editor):
+    # Sus archivos estaban en disco (MEDIA_ROOT), que ya no se usa
+    TrabajoImportacion = apps.get_model('core', 'TrabajoImportacion')
+    TrabajoImportacion.objects.filter(estado__in=['pendiente', 'analizando']).update(
+        estado='error',
+        mensaje='La importación se interrumpió por una actualización del sistema. Sube el archivo nuevamente.',
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_importacion_xml_dte'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BloqueArchivoImportacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('numero', models.PositiveIntegerField()),
+                ('datos', models.BinaryField()),
+                ('trabajo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bloques', to='core.trabajoimportacion')),
+            ],
+            options={
+                'ordering': ['numero'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='bloquearchivoimportacion',
+            constraint=models.UniqueConstraint(fields=('trabajo', 'numero'), name='bloque_imp_trabajo_numero_unico'),
+        ),
+        migrations.RunPython(descartar_trabajos_sin_analizar, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='trabajoimportacion',
+            name='archivo',
+        ),
+    ]
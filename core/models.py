@@ -1,8 +1,19 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Q
 from django.contrib.auth.models import User
 from django.utils import timezone
 from django.core.exceptions import ValidationError
 import re
+import uuid
+
+from .cobranza import (
+    DIAS_INCOBRABLE, DIAS_MORA, DIAS_POR_VENCER, filtros_estado_cobranza, expresion_estado_cobranza,
+)
+
+
+# Cuerpo de RUT más alto que se acepta (9 dígitos): cabe en rut_numero, un
+# PositiveIntegerField, en todos los motores
+RUT_CUERPO_MAXIMO = 10 ** 9 - 1
 
 
 def validar_rut_chileno(rut):
@@ -30,6 +41,9 @@ def validar_rut_chileno(rut):
     cuerpo = rut_limpio[:-1]
     dv_ingresado = rut_limpio[-1]
 
+    if int(cuerpo) > RUT_CUERPO_MAXIMO:
+        raise ValidationError('El RUT es muy largo')
+
     # Calcular dígito verificador
     suma = 0
     multiplo = 2
@@ -77,6 +91,35 @@ def formatear_rut(rut):
     return f'{cuerpo_formateado}-{dv}'
 
 
+def normalizar_rut(rut):
+    """
+    Separa un RUT escrito en cualquier formato (12.345.678-9, 12345678-9,
+    123456789) en cuerpo numérico y dígito verificador: (12345678, '9').
+    Retorna (None, '') si no tiene forma de RUT o el cuerpo tiene más de 9
+    dígitos.
+    """
+    if not rut:
+        return None, ''
+
+    rut_limpio = rut.upper().replace('.', '').replace('-', '').replace(' ', '')
+    if not re.match(r'^[0-9]+[0-9K]$', rut_limpio):
+        return None, ''
+    rut_numero = int(rut_limpio[:-1])
+    if rut_numero > RUT_CUERPO_MAXIMO:
+        return None, ''
+    return rut_numero, rut_limpio[-1]
+
+
+class ClienteQuerySet(models.QuerySet):
+
+    def por_rut(self, rut):
+        """Filtra por RUT en cualquier formato usando el cuerpo numérico indexado"""
+        rut_numero, rut_dv = normalizar_rut(rut)
+        if rut_numero is None:
+            return self.filter(rut=rut)
+        return self.filter(rut_numero=rut_numero, rut_dv=rut_dv)
+
+
 class Cliente(models.Model):
     nombre = models.CharField(max_length=200)
     rut = models.CharField(max_length=20, blank=True, default='', verbose_name='RUT/DNI',
@@ -88,8 +131,33 @@ class Cliente(models.Model):
     fecha_registro = models.DateTimeField(auto_now_add=True)
     activo = models.BooleanField(default=True)
 
+    # RUT normalizado (cuerpo numérico + dígito verificador), derivado de `rut` al guardar
+    rut_numero = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    rut_dv = models.CharField(max_length=1, blank=True, default='', editable=False)
+
+    # Contadores de deuda desnormalizados, mantenidos por core.contadores_cliente
+    # cada vez que cambia una factura del cliente (ver core/signals.py)
+    deuda_pendiente = models.DecimalField(max_digits=14, decimal_places=2, default=0, editable=False)
+    n_vencidas = models.PositiveIntegerField(default=0, editable=False, help_text='Facturas pendientes vencidas, en mora o incobrables')
+    n_mora = models.PositiveIntegerField(default=0, editable=False)
+    n_facturas = models.PositiveIntegerField(default=0, editable=False)
+    n_pagadas = models.PositiveIntegerField(default=0, editable=False)
+    ultima_emision = models.DateField(null=True, blank=True, editable=False)
+
+    CAMPOS_CONTADORES = ('deuda_pendiente', 'n_vencidas', 'n_mora', 'n_facturas', 'n_pagadas', 'ultima_emision')
+
+    objects = ClienteQuerySet.as_manager()
+
     class Meta:
         ordering = ['nombre']
+        indexes = [
+            # Listado de clientes activos del usuario ordenado por nombre
+            models.Index(fields=['usuario', 'nombre'], name='cliente_usr_activo_nombre_idx', condition=Q(activo=True)),
+            # Listado de clientes activos ordenado o filtrado por deuda
+            models.Index(fields=['usuario', '-deuda_pendiente'], name='cliente_usr_deuda_idx', condition=Q(activo=True)),
+            # Búsqueda por RUT en cualquier formato (importación SII, búsqueda, admin)
+            models.Index(fields=['usuario', 'rut_numero'], name='cliente_usr_rut_idx'),
+        ]
 
     def __str__(self):
         return self.nombre
@@ -101,9 +169,21 @@ class Cliente(models.Model):
             validar_rut_chileno(self.rut)
 
     def save(self, *args, **kwargs):
-        # Formatear el RUT antes de guardar
+        # Formatear el RUT antes de guardar y mantener su forma normalizada
         if self.rut:
             self.rut = formatear_rut(self.rut)
+        self.rut_numero, self.rut_dv = normalizar_rut(self.rut)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'rut' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'rut_numero', 'rut_dv'}
+        # Los contadores solo se escriben desde core.contadores_cliente: al actualizar
+        # un cliente no se sobrescriben con los valores que tenga la instancia en memoria
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            excluidos = set(self.CAMPOS_CONTADORES) | self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                campo.attname for campo in self._meta.concrete_fields
+                if not campo.primary_key and campo.attname not in excluidos
+            ]
         super().save(*args, **kwargs)
 
     def rut_formateado(self):
@@ -111,25 +191,55 @@ class Cliente(models.Model):
         return formatear_rut(self.rut) if self.rut else ''
 
     def total_deuda(self):
-        """Retorna el total de deuda (solo facturas pendientes)"""
-        return sum(
-            f.monto_total if f.monto_total else f.monto
-            for f in self.facturas.filter(estado='pendiente')
-        )
+        """
+        Retorna el total de deuda (solo facturas pendientes): suma el saldo por
+        cobrar de cada una (monto_pendiente si tiene abonos, si no monto_total,
+        o monto si no tiene total).
+        """
+        return self.deuda_pendiente
 
     def facturas_vencidas(self):
         """Retorna el número de facturas pendientes con estado de cobranza vencida, mora o incobrable"""
-        return self.facturas.filter(
-            estado='pendiente',
-            estado_cobranza__in=['vencida', 'mora', 'incobrable']
-        ).count()
+        return self.n_vencidas
 
     def facturas_en_mora(self):
         """Retorna el número de facturas en mora"""
-        return self.facturas.filter(
-            estado='pendiente',
-            estado_cobranza='mora'
-        ).count()
+        return self.n_mora
+
+
+# Columnas de texto largo que los listados de facturas no necesitan
+CAMPOS_DIFERIDOS_LISTADO = ('descripcion', 'cliente__notas')
+
+
+class FacturaQuerySet(models.QuerySet):
+    """
+    Consultas de facturas que calculan el estado de cobranza en SQL.
+
+    La columna estado_cobranza queda como caché desnormalizada; estos métodos
+    no dependen de que esté al día.
+    """
+
+    def con_estado_cobranza(self, hoy=None):
+        """Anota estado_cobranza_calculado según fecha_vencimiento y la fecha de hoy"""
+        return self.annotate(estado_cobranza_calculado=expresion_estado_cobranza(hoy))
+
+    def en_estado_cobranza(self, *estados, hoy=None):
+        """Filtra las facturas pendientes que hoy están en alguno de los estados de cobranza indicados"""
+        filtros = filtros_estado_cobranza(hoy)
+        condicion = Q()
+        for estado in estados:
+            condicion |= filtros[estado]
+        return self.filter(condicion, estado='pendiente')
+
+    def para_listado(self, *incluir):
+        """
+        Consulta base de los listados y reportes de facturas: trae el cliente
+        en el mismo JOIN y difiere las columnas de texto largo que no se
+        muestran (descripción de la factura, notas del cliente), salvo las
+        indicadas en `incluir`.
+        """
+        diferidos = [campo for campo in CAMPOS_DIFERIDOS_LISTADO if campo not in incluir]
+        return self.select_related('cliente').defer(*diferidos)
 
 
 class Factura(models.Model):
@@ -185,22 +295,43 @@ class Factura(models.Model):
     usuario = models.ForeignKey(User, on_delete=models.CASCADE)
     fecha_creacion = models.DateTimeField(auto_now_add=True)
 
+    objects = FacturaQuerySet.as_manager()
+
+    # Campos que determinan el aporte de la factura a ResumenCartera
+    CAMPOS_RESUMEN = ('usuario_id', 'moneda', 'estado', 'estado_cobranza', 'monto_total', 'monto_pagado', 'monto_pendiente')
+
     class Meta:
         ordering = ['-fecha_emision']
+        indexes = [
+            # Contadores, montos y listados por estado y estado de cobranza almacenado
+            models.Index(fields=['usuario', 'estado', 'estado_cobranza', 'fecha_emision'], name='factura_usr_estado_cob_idx'),
+            # Rangos de fecha_vencimiento (tramos de cobranza y mapa de vencimiento)
+            models.Index(fields=['usuario', 'estado', 'fecha_vencimiento'], name='factura_usr_estado_venc_idx'),
+            # Listados ordenados por fecha de emisión
+            models.Index(fields=['usuario', 'fecha_emision'], name='factura_usr_emision_idx'),
+            # Métricas por cliente
+            models.Index(fields=['cliente', 'estado'], name='factura_cliente_estado_idx'),
+            # Índice parcial solo sobre la cartera por cobrar
+            models.Index(
+                fields=['usuario', 'fecha_vencimiento'],
+                name='factura_pend_venc_idx',
+                condition=Q(estado='pendiente'),
+            ),
+        ]
 
     def __str__(self):
         return f"{self.numero_factura} - {self.cliente.nombre}"
 
     def dias_vencidos(self):
         """Retorna los días que lleva vencida la factura"""
-        if self.estado == 'pendiente' and self.fecha_vencimiento < timezone.now().date():
-            return (timezone.now().date() - self.fecha_vencimiento).days
+        if self.estado == 'pendiente' and self.fecha_vencimiento < timezone.localdate():
+            return (timezone.localdate() - self.fecha_vencimiento).days
         return 0
 
     def proxima_vencer(self):
         """Verifica si la factura está próxima a vencer (7 días o menos)"""
         if self.estado == 'pendiente':
-            dias = (self.fecha_vencimiento - timezone.now().date()).days
+            dias = (self.fecha_vencimiento - timezone.localdate()).days
             return 0 <= dias <= 7
         return False
 
@@ -220,17 +351,17 @@ class Factura(models.Model):
             self.estado_cobranza = None
             return
 
-        hoy = timezone.now().date()
+        hoy = timezone.localdate()
         dias_vencido = (hoy - self.fecha_vencimiento).days
         dias_para_vencer = (self.fecha_vencimiento - hoy).days
 
-        if dias_vencido >= 90:
+        if dias_vencido >= DIAS_INCOBRABLE:
             self.estado_cobranza = 'incobrable'
-        elif dias_vencido >= 30:
+        elif dias_vencido >= DIAS_MORA:
             self.estado_cobranza = 'mora'
         elif dias_vencido > 0:
             self.estado_cobranza = 'vencida'
-        elif dias_para_vencer <= 7:
+        elif dias_para_vencer <= DIAS_POR_VENCER:
             self.estado_cobranza = 'por_vencer'
         else:
             self.estado_cobranza = 'vigente'
@@ -240,13 +371,254 @@ class Factura(models.Model):
         from .utils import formatear_moneda
         return formatear_moneda(self.monto, self.moneda)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Guardar los valores leídos para aplicar deltas al resumen de cartera
+        instance._valores_resumen = instance.valores_resumen()
+        # Y el cliente original, por si la factura se cambia de cliente
+        instance._cliente_id_original = instance.__dict__.get('cliente_id')
+        return instance
+
+    def valores_resumen(self):
+        """
+        Retorna los valores que determinan el aporte de la factura al
+        resumen de cartera, o None si alguno no está cargado (campos diferidos).
+        """
+        try:
+            return tuple(self.__dict__[campo] for campo in self.CAMPOS_RESUMEN)
+        except KeyError:
+            return None
+
     def save(self, *args, **kwargs):
         # Actualizar estado de cobranza automáticamente
         if self.estado == 'pendiente':
             self.actualizar_estado_cobranza()
         else:
             self.estado_cobranza = None
-        super().save(*args, **kwargs)
+        # El resumen de cartera se actualiza en post_save, dentro de la misma transacción
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic(using=kwargs.get('using')):
+            return super().delete(*args, **kwargs)
+
+
+class RecalculoCobranza(models.Model):
+    """Marca la última fecha (America/Santiago) en que se recalcularon los estados de cobranza de un usuario"""
+    usuario = models.OneToOneField(User, on_delete=models.CASCADE, related_name='recalculo_cobranza')
+    fecha = models.DateField()
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Cobranza: {self.usuario.username} - {self.fecha}"
+
+
+class ResumenCartera(models.Model):
+    """
+    Totales de facturas por usuario, moneda, estado y estado de cobranza.
+    Se mantiene por deltas al guardar o eliminar facturas y puede
+    reconstruirse con `manage.py rebuild_rollups`.
+    """
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE, related_name='resumenes_cartera')
+    moneda = models.CharField(max_length=3)
+    estado = models.CharField(max_length=20)
+    # Cadena vacía para facturas no pendientes (NULL no participa en la restricción única)
+    estado_cobranza = models.CharField(max_length=20, blank=True, default='')
+    cantidad = models.IntegerField(default=0)
+    monto_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    monto_pagado = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    monto_pendiente = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['usuario', 'moneda', 'estado', 'estado_cobranza'],
+                name='resumen_cartera_unico',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.usuario.username} {self.moneda} {self.estado} {self.estado_cobranza}: {self.cantidad}"
+
+
+class TrabajoImportacion(models.Model):
+    """
+    Importación de un archivo del SII (CSV o XML EnvioDTE) procesada en
+    segundo plano por `manage.py procesar_importaciones`. La vista solo
+    guarda el archivo (en BloqueArchivoImportacion) y consulta el avance: el
+    worker lo analiza y deja las filas válidas en FilaImportacion (vista
+    previa) y, cuando el usuario confirma, las fusiona con las facturas. La
+    página identifica el trabajo por su token.
+    """
+    ESTADO_CHOICES = [
+        ('pendiente', 'En cola para análisis'),
+        ('analizando', 'Analizando'),
+        ('analizado', 'Listo para confirmar'),
+        ('confirmado', 'En cola para importar'),
+        ('importando', 'Importando'),
+        ('completado', 'Completado'),
+        ('error', 'Error'),
+    ]
+
+    FORMATO_CHOICES = [
+        ('csv', 'CSV'),
+        ('xml', 'XML (EnvioDTE)'),
+    ]
+
+    # Estados que toma el worker -> estado mientras los procesa
+    ESTADOS_EN_COLA = {'pendiente': 'analizando', 'confirmado': 'importando'}
+    ESTADOS_FINALES = ('completado', 'error')
+
+    token = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE, related_name='trabajos_importacion')
+    nombre_archivo = models.CharField(max_length=255)
+    formato = models.CharField(max_length=3, choices=FORMATO_CHOICES, default='csv')
+    estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='pendiente')
+    mensaje = models.TextField(blank=True)
+
+    # Avance de la fase en curso
+    tamano_archivo = models.PositiveBigIntegerField(default=0)
+    bytes_procesados = models.PositiveBigIntegerField(default=0)
+    filas_procesadas = models.PositiveIntegerField(default=0)
+    filas_con_error = models.PositiveIntegerField(default=0)
+    filas_por_segundo = models.FloatField(default=0)
+
+    # Resultado del análisis (agregados sobre FilaImportacion)
+    nuevas = models.PositiveIntegerField(default=0)
+    actualizadas = models.PositiveIntegerField(default=0)
+    sin_cambios = models.PositiveIntegerField(default=0)
+    pagadas = models.PositiveIntegerField(default=0)
+    pendientes = models.PositiveIntegerField(default=0)
+    total_monto = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    total_pendiente = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+
+    # Resultado de la importación
+    facturas_creadas = models.PositiveIntegerField(default=0)
+    facturas_actualizadas = models.PositiveIntegerField(default=0)
+
+    # Primeros errores por fila ({'row_num', 'error'}); el total está en filas_con_error
+    errores = models.JSONField(default=list, blank=True)
+
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_inicio = models.DateTimeField(null=True, blank=True)
+    fecha_fin = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-fecha_creacion']
+        indexes = [
+            models.Index(fields=['estado', 'fecha_creacion'], name='trabajo_imp_estado_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.nombre_archivo} ({self.get_estado_display()})"
+
+    @property
+    def total_filas(self):
+        return self.nuevas + self.actualizadas + self.sin_cambios
+
+    @property
+    def porcentaje(self):
+        """
+        Avance del análisis según los bytes leídos del archivo; None durante la
+        importación (unas pocas consultas sin avance intermedio)
+        """
+        if self.estado in ('analizado', 'completado'):
+            return 100
+        if self.estado in ('confirmado', 'importando'):
+            return None
+        if not self.tamano_archivo:
+            return 0
+        return min(100, int(self.bytes_procesados * 100 / self.tamano_archivo))
+
+    @property
+    def etiqueta_fila(self):
+        """Cómo se nombra cada registro del archivo en los errores"""
+        return 'Documento' if self.formato == 'xml' else 'Fila'
+
+    @property
+    def en_proceso(self):
+        return self.estado not in ('analizado',) + self.ESTADOS_FINALES
+
+
+class BloqueArchivoImportacion(models.Model):
+    """
+    Bloque del archivo subido de un TrabajoImportacion. El archivo se guarda
+    en la base de datos y no en disco: la web y el worker pueden correr en
+    servidores distintos (como en Render), y la base de datos es lo único
+    que comparten. Se eliminan al terminar el análisis.
+    """
+    trabajo = models.ForeignKey(TrabajoImportacion, on_delete=models.CASCADE, related_name='bloques')
+    numero = models.PositiveIntegerField()
+    datos = models.BinaryField()
+
+    class Meta:
+        ordering = ['numero']
+        constraints = [
+            models.UniqueConstraint(fields=['trabajo', 'numero'], name='bloque_imp_trabajo_numero_unico'),
+        ]
+
+    def __str__(self):
+        return f"Bloque {self.numero} de {self.trabajo_id}"
+
+
+class FilaImportacion(models.Model):
+    """
+    Tabla intermedia de la importación del SII: una fila válida del archivo
+    por registro, con lo que la vista previa muestra y lo que la
+    confirmación fusiona con las facturas. Se vacía al terminar el trabajo.
+    """
+    trabajo = models.ForeignKey(TrabajoImportacion, on_delete=models.CASCADE, related_name='filas')
+    numero_fila = models.PositiveIntegerField()
+    folio = models.CharField(max_length=50)
+    folio_dte = models.IntegerField(null=True)
+    tipo_dte = models.IntegerField(null=True)
+    rut = models.CharField(max_length=20)
+    rut_numero = models.PositiveIntegerField(null=True)
+    rut_dv = models.CharField(max_length=1, blank=True)
+    razon_social = models.CharField(max_length=200)
+    fecha_emision = models.DateField()
+    fecha_vencimiento = models.DateField()
+    fecha_pago = models.DateField(null=True)
+    monto_total = models.DecimalField(max_digits=10, decimal_places=2)
+    monto_pagado = models.DecimalField(max_digits=10, decimal_places=2)
+    monto_pendiente = models.DecimalField(max_digits=10, decimal_places=2)
+    # Columnas opcionales: null (o vacío) si el archivo no las trae
+    monto_neto = models.DecimalField(max_digits=10, decimal_places=2, null=True)
+    monto_iva = models.DecimalField(max_digits=10, decimal_places=2, null=True)
+    monto_exento = models.DecimalField(max_digits=10, decimal_places=2, null=True)
+    estado = models.CharField(max_length=20)
+    estado_sii = models.CharField(max_length=50, blank=True)
+
+    # Comparación con la factura existente al momento del análisis
+    existe = models.BooleanField(default=False)
+    con_cambios = models.BooleanField(default=False)
+    cambios = models.JSONField(default=list)
+
+    # Los resuelve la fusión. Sin restricción ni cascada: eliminar un cliente o
+    # una factura no debe tocar esta tabla
+    cliente = models.ForeignKey(
+        Cliente, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False, null=True, related_name='+',
+    )
+    factura = models.ForeignKey(
+        Factura, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False, null=True, related_name='+',
+    )
+
+    class Meta:
+        ordering = ['numero_fila']
+        constraints = [
+            models.UniqueConstraint(fields=['trabajo', 'numero_fila'], name='fila_imp_trabajo_fila_unica'),
+        ]
+        # Las subconsultas de la fusión buscan por (trabajo, folio | cliente | factura)
+        indexes = [
+            models.Index(fields=['trabajo', 'folio', 'numero_fila'], name='fila_imp_trabajo_folio_idx'),
+            models.Index(fields=['trabajo', 'cliente', 'numero_fila'], name='fila_imp_trabajo_cliente_idx'),
+            models.Index(fields=['trabajo', 'factura'], name='fila_imp_trabajo_factura_idx'),
+        ]
+
+    def __str__(self):
+        return f"Fila {self.numero_fila}: {self.folio}"
 
 
 class ConfiguracionRecordatorio(models.Model):
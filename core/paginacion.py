@@ -0,0 +1,114 @@
+from collections import namedtuple
+
+from django.core import signing
+from django.db.models import Q
+
+
+# ========================
+# PAGINACIÓN POR CURSOR (KEYSET)
+# ========================
+
+# En lugar de OFFSET, cada página continúa desde la última fila de la
+# anterior: WHERE (campo, id) > (valor, id_último) ORDER BY campo, id.
+# El costo de una página no depende de cuántas filas haya antes, y las
+# inserciones entre páginas no producen filas repetidas ni saltadas.
+# El cursor viaja firmado para que sea opaco y no se pueda manipular.
+
+SAL_CURSOR = 'core.paginacion.cursor'
+
+PaginaCursor = namedtuple('PaginaCursor', ['filas', 'siguiente', 'anterior'])
+
+
+def codificar_cursor(orden, direccion, valor, pk):
+    """
+    Genera el cursor opaco que apunta a la fila (valor, pk) para el orden
+    dado. `direccion` es 'despues' (página siguiente) o 'antes' (anterior).
+    """
+    return signing.dumps([orden, direccion, valor, pk], salt=SAL_CURSOR, compress=True)
+
+
+def decodificar_cursor(cursor, orden):
+    """Retorna (direccion, valor, pk) del cursor, o lanza ValueError si es inválido o de otro orden"""
+    try:
+        orden_cursor, direccion, valor, pk = signing.loads(cursor, salt=SAL_CURSOR)
+    except (signing.BadSignature, TypeError, ValueError):
+        raise ValueError('Cursor inválido')
+    if orden_cursor != orden or direccion not in ('despues', 'antes'):
+        raise ValueError('El cursor no corresponde al orden solicitado')
+    return direccion, valor, pk
+
+
+def _campo_orden(queryset, campo):
+    """Campo (o output_field de la anotación) por el que se ordena; admite rutas como cliente__nombre"""
+    if campo in queryset.query.annotations:
+        return queryset.query.annotations[campo].output_field
+    modelo = queryset.model
+    partes = campo.split('__')
+    for parte in partes[:-1]:
+        modelo = modelo._meta.get_field(parte).related_model
+    return modelo._meta.get_field(partes[-1])
+
+
+def _valor_orden(fila, campo):
+    valor = fila
+    for parte in campo.split('__'):
+        valor = getattr(valor, parte)
+    return valor if valor is None or isinstance(valor, (int, str)) else str(valor)
+
+
+def paginar_por_cursor(queryset, orden, cursor=None, tamano=25):
+    """
+    Retorna una PaginaCursor con hasta `tamano` filas del queryset ordenado
+    por `orden` ('campo' o '-campo'; campo no nulo, puede ser una relación
+    como cliente__nombre o una anotación) con el id como desempate, más los
+    cursores de la página siguiente y anterior (None si no existen).
+
+    Lanza ValueError si el cursor es inválido.
+    """
+    campo = orden.lstrip('-')
+    descendente = orden.startswith('-')
+    campo_modelo = _campo_orden(queryset, campo)
+
+    direccion = 'despues'
+    if cursor:
+        direccion, valor, pk = decodificar_cursor(cursor, orden)
+        valor = campo_modelo.to_python(valor)
+
+    # Hacia atrás se recorre en orden inverso y luego se da vuelta la página
+    hacia_atras = direccion == 'antes'
+    descendente_consulta = descendente != hacia_atras
+    operador = 'lt' if descendente_consulta else 'gt'
+    queryset = queryset.order_by(
+        f'-{campo}' if descendente_consulta else campo,
+        '-pk' if descendente_consulta else 'pk',
+    )
+    if cursor:
+        queryset = queryset.filter(
+            Q(**{f'{campo}__{operador}': valor}) |
+            Q(**{campo: valor, f'pk__{operador}': pk})
+        )
+
+    # Se pide una fila extra solo para saber si hay más páginas en esa dirección
+    filas = list(queryset[:tamano + 1])
+    hay_mas = len(filas) > tamano
+    filas = filas[:tamano]
+    if hacia_atras:
+        filas.reverse()
+
+    def cursor_de(direccion_cursor, fila):
+        return codificar_cursor(orden, direccion_cursor, _valor_orden(fila, campo), fila.pk)
+
+    # Hacia adelante hay siguiente si sobró una fila y anterior si se llegó con
+    # un cursor; hacia atrás es al revés (siempre hay siguiente: la página de origen)
+    if hacia_atras:
+        hay_siguiente, hay_anterior = True, hay_mas
+    else:
+        hay_siguiente, hay_anterior = hay_mas, bool(cursor)
+
+    siguiente = anterior = None
+    if filas:
+        if hay_siguiente:
+            siguiente = cursor_de('despues', filas[-1])
+        if hay_anterior:
+            anterior = cursor_de('antes', filas[0])
+    return PaginaCursor(filas, siguiente, anterior)
@@ -0,0 +1,166 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Sum, Count, F
+
+from .cache_usuario import obtener_cache_usuario
+from .cobranza import ESTADOS_COBRANZA
+from .models import Factura, ResumenCartera
+
+
+# ========================
+# RESUMEN DE CARTERA (ROLLUP)
+# ========================
+
+ESTADOS_FACTURA = [estado for estado, etiqueta in Factura.ESTADO_CHOICES]
+
+
+def _aplicar_delta(valores, signo):
+    """Suma (signo=1) o resta (signo=-1) el aporte de una factura a su fila de resumen"""
+    usuario_id, moneda, estado, estado_cobranza, monto_total, monto_pagado, monto_pendiente = valores
+    clave = {
+        'usuario_id': usuario_id,
+        'moneda': moneda,
+        'estado': estado,
+        'estado_cobranza': estado_cobranza or '',
+    }
+    cambios = {
+        'cantidad': F('cantidad') + signo,
+        'monto_total': F('monto_total') + signo * (monto_total or 0),
+        'monto_pagado': F('monto_pagado') + signo * (monto_pagado or 0),
+        'monto_pendiente': F('monto_pendiente') + signo * (monto_pendiente or 0),
+    }
+    actualizadas = ResumenCartera.objects.filter(**clave).update(**cambios)
+    if not actualizadas and signo > 0:
+        ResumenCartera.objects.get_or_create(**clave)
+        ResumenCartera.objects.filter(**clave).update(**cambios)
+
+
+def registrar_factura_guardada(factura, created):
+    """Aplica al resumen el cambio de una factura recién guardada"""
+    anteriores = getattr(factura, '_valores_resumen', None)
+    nuevos = factura.valores_resumen()
+
+    if not created and anteriores is None:
+        # No se conocen los valores previos: reconstruir el resumen del usuario
+        reconstruir_resumen_cartera([factura.usuario_id])
+    elif anteriores != nuevos:
+        if anteriores is not None:
+            _aplicar_delta(anteriores, -1)
+        _aplicar_delta(nuevos, 1)
+
+    factura._valores_resumen = nuevos
+
+
+def registrar_factura_eliminada(factura):
+    """Descuenta del resumen una factura eliminada"""
+    valores = getattr(factura, '_valores_resumen', None) or factura.valores_resumen()
+    if valores is None:
+        # No se conocen los valores (campos diferidos): reconstruir el resumen del usuario
+        reconstruir_resumen_cartera([factura.usuario_id])
+    else:
+        _aplicar_delta(valores, -1)
+
+
+def _agrupar_facturas(usuario_ids=None):
+    facturas = Factura.objects.all()
+    if usuario_ids is not None:
+        facturas = facturas.filter(usuario_id__in=usuario_ids)
+    return facturas.order_by().values(
+        'usuario_id', 'moneda', 'estado', 'estado_cobranza'
+    ).annotate(
+        cantidad=Count('id'),
+        total=Sum('monto_total'),
+        pagado=Sum('monto_pagado'),
+        pendiente=Sum('monto_pendiente'),
+    )
+
+
+def reconstruir_resumen_cartera(usuario_ids=None):
+    """
+    Reconstruye desde cero el resumen de los usuarios indicados (o de todos)
+    con un GROUP BY sobre las facturas. Retorna la cantidad de filas creadas.
+    """
+    with transaction.atomic():
+        resumenes = ResumenCartera.objects.all()
+        if usuario_ids is not None:
+            resumenes = resumenes.filter(usuario_id__in=usuario_ids)
+        resumenes.delete()
+
+        filas = [
+            ResumenCartera(
+                usuario_id=grupo['usuario_id'],
+                moneda=grupo['moneda'],
+                estado=grupo['estado'],
+                estado_cobranza=grupo['estado_cobranza'] or '',
+                cantidad=grupo['cantidad'],
+                monto_total=grupo['total'] or 0,
+                monto_pagado=grupo['pagado'] or 0,
+                monto_pendiente=grupo['pendiente'] or 0,
+            )
+            for grupo in _agrupar_facturas(usuario_ids)
+        ]
+        ResumenCartera.objects.bulk_create(filas, batch_size=500)
+    return len(filas)
+
+
+def verificar_resumen_cartera(usuario_ids=None):
+    """
+    Compara el resumen almacenado con el calculado desde las facturas.
+    Retorna una lista de (clave, esperado, almacenado) con las diferencias;
+    las filas con cantidad 0 se consideran equivalentes a no existir.
+    """
+    vacio = (0, Decimal('0'), Decimal('0'), Decimal('0'))
+
+    esperado = defaultdict(lambda: vacio)
+    for grupo in _agrupar_facturas(usuario_ids):
+        clave = (grupo['usuario_id'], grupo['moneda'], grupo['estado'], grupo['estado_cobranza'] or '')
+        esperado[clave] = (
+            grupo['cantidad'],
+            grupo['total'] or Decimal('0'),
+            grupo['pagado'] or Decimal('0'),
+            grupo['pendiente'] or Decimal('0'),
+        )
+
+    almacenado = defaultdict(lambda: vacio)
+    resumenes = ResumenCartera.objects.all()
+    if usuario_ids is not None:
+        resumenes = resumenes.filter(usuario_id__in=usuario_ids)
+    for r in resumenes:
+        clave = (r.usuario_id, r.moneda, r.estado, r.estado_cobranza)
+        if r.cantidad:
+            almacenado[clave] = (r.cantidad, r.monto_total, r.monto_pagado, r.monto_pendiente)
+
+    diferencias = []
+    for clave in sorted(set(esperado) | set(almacenado), key=str):
+        if esperado[clave] != almacenado[clave]:
+            diferencias.append((clave, esperado[clave], almacenado[clave]))
+    return diferencias
+
+
+def contadores_resumen(usuario_id):
+    """
+    Retorna los contadores de facturas del usuario por estado y por estado
+    de cobranza (de las pendientes), leyendo solo el resumen de cartera.
+    Todas las claves están presentes aunque no haya facturas.
+    """
+    contadores = dict.fromkeys(['total', *ESTADOS_FACTURA, *ESTADOS_COBRANZA], 0)
+    filas = ResumenCartera.objects.filter(usuario_id=usuario_id, cantidad__gt=0).values_list(
+        'estado', 'estado_cobranza', 'cantidad'
+    )
+    for estado, estado_cobranza, cantidad in filas:
+        contadores['total'] += cantidad
+        contadores[estado] = contadores.get(estado, 0) + cantidad
+        if estado == 'pendiente' and estado_cobranza:
+            contadores[estado_cobranza] = contadores.get(estado_cobranza, 0) + cantidad
+    return contadores
+
+
+def contadores_facturas(usuario_id):
+    """
+    Contadores de las pestañas del listado de facturas (ver contadores_resumen),
+    guardados en la caché del usuario: se recalculan solo cuando cambia su
+    versión (al guardar una factura o al mover estados de cobranza).
+    """
+    return obtener_cache_usuario(usuario_id, 'contadores_facturas', lambda: contadores_resumen(usuario_id))
@@ -0,0 +1,37 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .cache_usuario import invalidar_cache_usuario
+from .models import Cliente, Factura
+from .resumen_cartera import registrar_factura_guardada, registrar_factura_eliminada
+from .contadores_cliente import registrar_factura_contadores
+
+
+@receiver(post_save, sender=Factura)
+def actualizar_resumen_al_guardar(sender, instance, created, raw=False, **kwargs):
+    """Aplica el delta de la factura guardada al resumen de cartera"""
+    if not raw:
+        registrar_factura_guardada(instance, created)
+
+
+@receiver(post_delete, sender=Factura)
+def actualizar_resumen_al_eliminar(sender, instance, **kwargs):
+    """Descuenta la factura eliminada del resumen de cartera"""
+    registrar_factura_eliminada(instance)
+
+
+@receiver(post_save, sender=Factura)
+@receiver(post_delete, sender=Factura)
+def actualizar_contadores_cliente_al_cambiar(sender, instance, raw=False, **kwargs):
+    """Recalcula los contadores de deuda del cliente de la factura (y del anterior, si cambió)"""
+    if not raw:
+        registrar_factura_contadores(instance)
+
+
+@receiver(post_save, sender=Factura)
+@receiver(post_delete, sender=Factura)
+@receiver(post_save, sender=Cliente)
+@receiver(post_delete, sender=Cliente)
+def invalidar_cache_al_cambiar(sender, instance, **kwargs):
+    """Invalida los datos en caché del usuario dueño de la factura o cliente modificado"""
+    invalidar_cache_usuario(instance.usuario_id)
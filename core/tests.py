@@ -1,3 +1,658 @@
-from django.test import TestCase
+import datetime
+import io
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+from io import StringIO
+from unittest import skipUnless
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .cobranza import asegurar_estados_cobranza
+from .contadores_cliente import verificar_contadores_clientes
+from .importacion_sii import leer_documentos_dte, leer_filas_csv, validar_csv_en_paralelo, validar_lote
+from .metricas import expresion_monto_facturado
+from .models import Cliente, Factura, TrabajoImportacion, validar_rut_chileno
+from .paginacion import codificar_cursor, paginar_por_cursor
+from .resumen_cartera import verificar_resumen_cartera
+from .trabajos_importacion import crear_trabajo, procesar_trabajo
+
+
+class IndicesConsultasTest(TestCase):
+    """Verifica con EXPLAIN que las consultas principales de las vistas usan los índices compuestos"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('indices', 'indices@example.com', 'clave-segura-123')
+        cls.cliente = Cliente.objects.create(nombre='Cliente Índices', email='c@example.com', usuario=cls.usuario)
+        hoy = timezone.localdate()
+        for i in range(20):
+            Factura.objects.create(
+                cliente=cls.cliente,
+                numero_factura=f'IDX-{i}',
+                monto=1000,
+                monto_total=1000,
+                monto_pendiente=1000,
+                fecha_emision=hoy - datetime.timedelta(days=60),
+                fecha_vencimiento=hoy + datetime.timedelta(days=i * 10 - 120),
+                estado='pendiente' if i % 3 else 'pagada',
+                usuario=cls.usuario,
+            )
+
+    def setUp(self):
+        if connection.vendor == 'postgresql':
+            # Con tablas pequeñas PostgreSQL prefiere el seq scan; forzar el uso de índices
+            with connection.cursor() as cursor:
+                cursor.execute('SET enable_seqscan = off')
+
+    def assertUsaIndice(self, queryset, *indices):
+        plan = queryset.explain()
+        self.assertTrue(
+            any(indice in plan for indice in indices),
+            f'Se esperaba alguno de {indices} en el plan:\n{plan}'
+        )
+
+    def test_clientes_activos_por_nombre(self):
+        queryset = Cliente.objects.filter(usuario=self.usuario, activo=True).order_by('nombre')
+        self.assertUsaIndice(queryset, 'cliente_usr_activo_nombre_idx')
+
+    def test_facturas_por_tramo_de_cobranza(self):
+        queryset = Factura.objects.filter(usuario=self.usuario).en_estado_cobranza('mora')
+        self.assertUsaIndice(queryset, 'factura_usr_estado_venc_idx', 'factura_pend_venc_idx')
+
+    def test_facturas_por_estado_cobranza_almacenado(self):
+        queryset = Factura.objects.filter(usuario=self.usuario, estado='pendiente', estado_cobranza='mora')
+        self.assertUsaIndice(queryset, 'factura_usr_estado_cob_idx')
+
+    def test_facturas_recientes(self):
+        queryset = Factura.objects.filter(usuario=self.usuario).order_by('-fecha_emision')[:10]
+        self.assertUsaIndice(queryset, 'factura_usr_emision_idx')
+
+    def test_facturas_pendientes_del_cliente(self):
+        queryset = self.cliente.facturas.filter(estado='pendiente')
+        self.assertUsaIndice(queryset, 'factura_cliente_estado_idx')
+
+
+# Caché en memoria: el presupuesto cuenta solo las consultas de datos, no las
+# de la tabla de DatabaseCache
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class PresupuestoConsultasTest(TestCase):
+    """
+    Cada listado y reporte ejecuta una cantidad fija de consultas sin importar
+    cuántas filas muestre: una carga N+1 (por ejemplo de factura.cliente) hace
+    crecer la cuenta al agregar facturas y el test falla.
+    """
+
+    # Máximo de consultas por vista (incluye sesión y usuario)
+    PRESUPUESTOS = {
+        'facturas_list': 5,
+        'facturas_list_busqueda': 6,
+        'clientes_list': 6,
+        'cliente_detalle': 5,
+        'cliente_facturas': 4,
+        'dashboard_ultimas': 3,
+        'exportar_pdf': 4,
+        'exportar_excel': 4,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('presupuesto', 'presupuesto@example.com', 'clave-segura-123')
+        cls.cliente = Cliente.objects.create(nombre='Cliente Presupuesto', email='p@example.com', usuario=cls.usuario)
+        cls.crear_facturas(3)
+        asegurar_estados_cobranza(cls.usuario)
+
+    @classmethod
+    def crear_facturas(cls, cantidad):
+        hoy = timezone.localdate()
+        inicio = Factura.objects.filter(usuario=cls.usuario).count()
+        for i in range(inicio, inicio + cantidad):
+            # Cada factura con su propio cliente, salvo las del cliente del detalle
+            cliente = cls.cliente if i % 2 else Cliente.objects.create(
+                nombre=f'Cliente {i}', email=f'c{i}@example.com', usuario=cls.usuario
+            )
+            Factura.objects.create(
+                cliente=cliente,
+                numero_factura=f'PRE-{i}',
+                monto=1000,
+                monto_total=1000,
+                monto_pendiente=1000,
+                fecha_emision=hoy - datetime.timedelta(days=i),
+                fecha_vencimiento=hoy + datetime.timedelta(days=i * 7 - 60),
+                estado='pendiente' if i % 3 else 'pagada',
+                descripcion=f'Servicio de prueba {i}',
+                usuario=cls.usuario,
+            )
+
+    def setUp(self):
+        self.client.force_login(self.usuario)
+
+    def contar_consultas(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.get(url)
+        self.assertEqual(respuesta.status_code, 200)
+        return len(consultas)
+
+    def assertPresupuesto(self, nombre, url):
+        pocas = self.contar_consultas(url)
+        self.crear_facturas(20)
+        muchas = self.contar_consultas(url)
+        self.assertEqual(pocas, muchas, f'{nombre}: {pocas} consultas con 3 facturas y {muchas} con 23')
+        self.assertLessEqual(muchas, self.PRESUPUESTOS[nombre], f'{nombre} excede su presupuesto de consultas')
+
+    def test_facturas_list(self):
+        self.assertPresupuesto('facturas_list', reverse('facturas_list'))
+
+    def test_facturas_list_busqueda(self):
+        self.assertPresupuesto('facturas_list_busqueda', reverse('facturas_list') + '?q=cliente')
+
+    def test_clientes_list(self):
+        self.assertPresupuesto('clientes_list', reverse('clientes_list'))
+
+    def test_cliente_detalle(self):
+        self.assertPresupuesto('cliente_detalle', reverse('cliente_detalle', args=[self.cliente.pk]))
+
+    def test_cliente_facturas(self):
+        self.assertPresupuesto('cliente_facturas', reverse('cliente_facturas', args=[self.cliente.pk]))
+
+    def test_dashboard_ultimas_facturas(self):
+        self.assertPresupuesto('dashboard_ultimas', reverse('api_dashboard_widget', args=['ultimas']))
+
+    def test_exportar_pdf(self):
+        self.assertPresupuesto('exportar_pdf', reverse('exportar_pdf'))
+
+    def test_exportar_excel(self):
+        self.assertPresupuesto('exportar_excel', reverse('exportar_excel'))
+
+
+class MapaVencimientoTest(TestCase):
+    """La API del mapa de vencimiento responde 400 ante parámetros inválidos"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('mapa', 'mapa@example.com', 'clave-segura-123')
+        cliente = Cliente.objects.create(nombre='Cliente Mapa', email='m@example.com', usuario=cls.usuario)
+        hoy = timezone.localdate()
+        for i, dias in enumerate([10, 45, 400]):
+            Factura.objects.create(
+                cliente=cliente,
+                numero_factura=f'MAP-{i}',
+                monto=1000,
+                monto_total=1000,
+                monto_pendiente=1000,
+                fecha_emision=hoy - datetime.timedelta(days=dias + 30),
+                fecha_vencimiento=hoy - datetime.timedelta(days=dias),
+                usuario=cls.usuario,
+            )
+
+    def setUp(self):
+        self.client.force_login(self.usuario)
+
+    def consultar(self, **parametros):
+        return self.client.get(reverse('api_mapa_vencimiento'), parametros)
+
+    def test_limites_validos(self):
+        respuesta = self.consultar(limites='30,3650', por='cliente,moneda')
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(
+            [(tramo['tramo'], tramo['cantidad']) for tramo in respuesta.json()['tramos']],
+            [('0-30', 1), ('31-3650', 2)],
+        )
+
+    def test_limites_invalidos(self):
+        for limites in ['abc', '30,x', '0', '-30', '30,3651', '100000000', '9' * 30]:
+            with self.subTest(limites=limites):
+                self.assertEqual(self.consultar(limites=limites).status_code, 400)
+
+    def test_agrupacion_invalida(self):
+        for por in ['clientes', 'cliente,otro', 'moneda;cliente']:
+            with self.subTest(por=por):
+                self.assertEqual(self.consultar(por=por).status_code, 400)
+
+
+class ContadoresClienteTest(TestCase):
+    """Los contadores de deuda de Cliente siguen a sus facturas al crearlas, cambiarlas, moverlas o eliminarlas"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('contadores', 'contadores@example.com', 'clave-segura-123')
+        cls.uno = Cliente.objects.create(nombre='Cliente Uno', email='uno@example.com', usuario=cls.usuario)
+        cls.dos = Cliente.objects.create(nombre='Cliente Dos', email='dos@example.com', usuario=cls.usuario)
+
+    def crear_factura(self, numero, cliente, dias_vencida=0, **campos):
+        hoy = timezone.localdate()
+        valores = {'monto': 1000, 'monto_total': 1000, 'monto_pendiente': 0}
+        valores.update(campos)
+        return Factura.objects.create(
+            cliente=cliente,
+            numero_factura=numero,
+            fecha_emision=hoy - datetime.timedelta(days=dias_vencida + 30),
+            fecha_vencimiento=hoy - datetime.timedelta(days=dias_vencida),
+            usuario=self.usuario,
+            **valores,
+        )
+
+    def assertContadores(self, cliente, **esperados):
+        self.assertEqual(verificar_contadores_clientes([self.usuario.pk]), [])
+        cliente.refresh_from_db()
+        self.assertEqual({campo: getattr(cliente, campo) for campo in esperados}, esperados)
+
+    def test_crear_actualizar_mover_y_eliminar(self):
+        factura = self.crear_factura('CON-1', self.uno, dias_vencida=45)
+        self.crear_factura('CON-2', self.uno, monto_pendiente=400)
+        self.assertContadores(self.uno, deuda_pendiente=Decimal('1400'), n_facturas=2, n_vencidas=1, n_pagadas=0)
+
+        factura.estado = 'pagada'
+        factura.save()
+        self.assertContadores(self.uno, deuda_pendiente=Decimal('400'), n_facturas=2, n_vencidas=0, n_pagadas=1)
+
+        factura.cliente = self.dos
+        factura.save()
+        self.assertContadores(self.uno, deuda_pendiente=Decimal('400'), n_facturas=1, n_pagadas=0)
+        self.assertContadores(self.dos, deuda_pendiente=Decimal('0'), n_facturas=1, n_pagadas=1)
+
+        factura.delete()
+        self.assertContadores(self.dos, deuda_pendiente=Decimal('0'), n_facturas=0, n_pagadas=0, ultima_emision=None)
+
+    def test_factura_sin_monto_total_suma_su_monto(self):
+        self.crear_factura('CON-3', self.uno, monto=700, monto_total=None)
+        self.assertContadores(self.uno, deuda_pendiente=Decimal('700'), n_facturas=1)
+        self.assertEqual(self.uno.total_deuda(), Decimal('700'))
+
+    def test_rebuild_contadores_clientes(self):
+        self.crear_factura('CON-4', self.uno, dias_vencida=45)
+        Cliente.objects.filter(pk=self.uno.pk).update(deuda_pendiente=0, n_facturas=7)
+        Cliente.objects.filter(pk=self.dos.pk).update(n_mora=3)
+        self.assertEqual(len(verificar_contadores_clientes([self.usuario.pk])), 3)
+
+        call_command('rebuild_contadores_clientes', usuario=[self.usuario.pk], stdout=StringIO())
+        self.assertContadores(self.uno, deuda_pendiente=Decimal('1000'), n_facturas=1, n_vencidas=1)
+        self.assertContadores(self.dos, n_mora=0, n_facturas=0)
+
+
+class PaginacionCursorTest(TestCase):
+    """La paginación por cursor recorre todas las filas una vez, en ambos sentidos, aunque el orden tenga empates"""
+
+    ORDENES = ['-fecha_emision', 'fecha_vencimiento', '-monto_facturado', 'cliente__nombre']
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('paginas', 'paginas@example.com', 'clave-segura-123')
+        clientes = [
+            Cliente.objects.create(nombre=f'Cliente {letra}', email=f'{letra}@example.com', usuario=cls.usuario)
+            for letra in 'AB'
+        ]
+        hoy = timezone.localdate()
+        # Pocos valores distintos por campo: los cortes de página caen sobre empates
+        for i in range(11):
+            Factura.objects.create(
+                cliente=clientes[i % 2],
+                numero_factura=f'PAG-{i}',
+                monto=1000 * (i % 3 + 1),
+                monto_total=1000 * (i % 3 + 1),
+                fecha_emision=hoy - datetime.timedelta(days=i // 4),
+                fecha_vencimiento=hoy + datetime.timedelta(days=i % 2),
+                usuario=cls.usuario,
+            )
+
+    def facturas(self):
+        return Factura.objects.filter(usuario=self.usuario).annotate(monto_facturado=expresion_monto_facturado())
+
+    def esperado(self, orden):
+        desempate = '-pk' if orden.startswith('-') else 'pk'
+        return list(self.facturas().order_by(orden, desempate).values_list('pk', flat=True))
+
+    def test_recorrido_hacia_adelante_y_hacia_atras(self):
+        for orden in self.ORDENES:
+            with self.subTest(orden=orden):
+                paginas = [paginar_por_cursor(self.facturas(), orden, tamano=3)]
+                while paginas[-1].siguiente:
+                    paginas.append(paginar_por_cursor(self.facturas(), orden, paginas[-1].siguiente, tamano=3))
+                self.assertEqual([f.pk for pagina in paginas for f in pagina.filas], self.esperado(orden))
+                self.assertIsNone(paginas[0].anterior)
+                self.assertEqual(len(paginas), 4)
+
+                # Desde la última página, los cursores 'anterior' devuelven las mismas páginas
+                pagina = paginas[-1]
+                for original in reversed(paginas[:-1]):
+                    pagina = paginar_por_cursor(self.facturas(), orden, pagina.anterior, tamano=3)
+                    self.assertEqual([f.pk for f in pagina.filas], [f.pk for f in original.filas])
+                    self.assertIsNotNone(pagina.siguiente)
+                self.assertIsNone(pagina.anterior)
+
+    def test_cursor_invalido(self):
+        cursor = paginar_por_cursor(self.facturas(), '-fecha_emision', tamano=3).siguiente
+        for invalido in [cursor[:-2] + 'xx', 'no-es-un-cursor', codificar_cursor('fecha_emision', 'despues', '2026-01-01', 1)]:
+            with self.subTest(cursor=invalido):
+                with self.assertRaises(ValueError):
+                    paginar_por_cursor(self.facturas(), '-fecha_emision', invalido, tamano=3)
+
+    def test_listado_con_cursor_invalido_vuelve_a_la_primera_pagina(self):
+        self.client.force_login(self.usuario)
+        primera = self.esperado('-fecha_emision')[:25]
+        for cursor in ['no-es-un-cursor', codificar_cursor('fecha_emision', 'despues', '2026-01-01', 1)]:
+            with self.subTest(cursor=cursor):
+                respuesta = self.client.get(reverse('facturas_list'), {'cursor': cursor})
+                self.assertEqual(respuesta.status_code, 200)
+                self.assertEqual([f.pk for f in respuesta.context['pagina'].filas], primera)
+
+
+class BusquedaTest(TestCase):
+    """La búsqueda ?q= de facturas y clientes refleja altas, cambios y bajas, por prefijo y por RUT"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('busca', 'busca@example.com', 'clave-segura-123')
+
+    def setUp(self):
+        self.client.force_login(self.usuario)
+        self.cliente = Cliente.objects.create(
+            nombre='Constructora Andina', rut='12.345.678-5', email='contacto@example.com', usuario=self.usuario
+        )
+        self.factura = Factura.objects.create(
+            cliente=self.cliente,
+            numero_factura='BUS-100',
+            descripcion='Servicios de mantención',
+            monto=1000,
+            monto_total=1000,
+            fecha_emision=timezone.localdate(),
+            fecha_vencimiento=timezone.localdate() + datetime.timedelta(days=30),
+            usuario=self.usuario,
+        )
+
+    def buscar_facturas(self, texto):
+        respuesta = self.client.get(reverse('facturas_list'), {'q': texto})
+        return [factura.numero_factura for factura in respuesta.context['pagina'].filas]
+
+    def buscar_clientes(self, texto):
+        respuesta = self.client.get(reverse('clientes_list'), {'q': texto})
+        return [cliente.nombre for cliente in respuesta.context['clientes']]
+
+    def test_factura_creada_actualizada_y_eliminada(self):
+        for texto in ['BUS-100', 'bus', 'manten', 'mantencion', 'construct']:
+            with self.subTest(texto=texto):
+                self.assertEqual(self.buscar_facturas(texto), ['BUS-100'])
+
+        self.factura.numero_factura = 'OTRA-7'
+        self.factura.descripcion = 'Arriendo de equipos'
+        self.factura.save()
+        self.assertEqual(self.buscar_facturas('manten'), [])
+        self.assertEqual(self.buscar_facturas('arriendo'), ['OTRA-7'])
+        self.assertEqual(self.buscar_facturas('OTRA'), ['OTRA-7'])
+
+        self.factura.delete()
+        self.assertEqual(self.buscar_facturas('OTRA'), [])
+
+    def test_cliente_creado_actualizado_y_eliminado(self):
+        for texto in ['Constructora', 'andi', '12.345.678-5', '12345678-5', '123456785', '12345678']:
+            with self.subTest(texto=texto):
+                self.assertEqual(self.buscar_clientes(texto), ['Constructora Andina'])
+        self.assertEqual(self.buscar_facturas('12.345.678-5'), ['BUS-100'])
+
+        self.cliente.nombre = 'Inmobiliaria Sur'
+        self.cliente.save()
+        self.assertEqual(self.buscar_clientes('andina'), [])
+        self.assertEqual(self.buscar_clientes('inmob'), ['Inmobiliaria Sur'])
+        self.assertEqual(self.buscar_facturas('inmob'), ['BUS-100'])
+
+        self.cliente.delete()
+        self.assertEqual(self.buscar_clientes('inmob'), [])
+        self.assertEqual(self.buscar_clientes('12345678'), [])
+        self.assertEqual(self.buscar_facturas('BUS'), [])
+
+    def test_rut_de_mas_de_nueve_digitos(self):
+        # No cabe en rut_numero: se guarda solo como texto y la búsqueda no lo usa como RUT
+        cliente = Cliente.objects.create(
+            nombre='Cliente Largo', rut='1234567890123-4', email='largo@example.com', usuario=self.usuario
+        )
+        self.assertEqual((cliente.rut_numero, cliente.rut_dv), (None, ''))
+        self.assertEqual(self.buscar_clientes('12345678901234'), [])
+        self.assertEqual(self.buscar_clientes('999.999.999-9'), [])
+        with self.assertRaisesMessage(ValidationError, 'El RUT es muy largo'):
+            validar_rut_chileno('1.234.567.890-1')
+
+
+class ResumenCarteraTest(TestCase):
+    """El resumen de cartera se mantiene al eliminar facturas, aunque se carguen con campos diferidos"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('resumen', 'resumen@example.com', 'clave-segura-123')
+        cliente = Cliente.objects.create(nombre='Cliente Resumen', email='r@example.com', usuario=cls.usuario)
+        hoy = timezone.localdate()
+        for i, moneda in enumerate(['CLP', 'CLP', 'USD']):
+            Factura.objects.create(
+                cliente=cliente,
+                numero_factura=f'RES-{i}',
+                monto=1000,
+                monto_total=1000,
+                monto_pendiente=1000,
+                moneda=moneda,
+                fecha_emision=hoy - datetime.timedelta(days=30),
+                fecha_vencimiento=hoy + datetime.timedelta(days=i * 30 - 30),
+                usuario=cls.usuario,
+            )
+
+    def test_eliminar_factura(self):
+        Factura.objects.filter(usuario=self.usuario).order_by('pk').last().delete()
+        self.assertEqual(verificar_resumen_cartera([self.usuario.pk]), [])
+
+    def test_eliminar_factura_con_campos_diferidos(self):
+        Factura.objects.defer('moneda').filter(usuario=self.usuario).order_by('pk').last().delete()
+        self.assertEqual(verificar_resumen_cartera([self.usuario.pk]), [])
+
+
+class ImportacionSIITest(TestCase):
+    """Análisis (vista previa) y confirmación de importaciones del SII por la tabla intermedia"""
+
+    CABECERA = 'folio,fecha_emision,fecha_vencimiento,rut_receptor,razon_social_receptor,monto_total,monto_pendiente,estado_pago\n'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('importa', 'importa@example.com', 'clave-segura-123')
+        cls.cliente = Cliente.objects.create(
+            nombre='Cliente Uno', rut='12.345.678-5', email='uno@example.com', usuario=cls.usuario,
+        )
+        for folio in ('IMP-10', 'IMP-11'):
+            Factura.objects.create(
+                cliente=cls.cliente,
+                numero_factura=folio,
+                monto=1000,
+                monto_total=1000,
+                monto_pendiente=1000,
+                fecha_emision=datetime.date(2026, 1, 10),
+                fecha_vencimiento=datetime.date(2026, 2, 10),
+                usuario=cls.usuario,
+            )
+
+    def assertDerivadosAlDia(self):
+        self.assertEqual(verificar_resumen_cartera([self.usuario.pk]), [])
+        self.assertEqual(verificar_contadores_clientes([self.usuario.pk]), [])
+
+    def analizar(self, contenido, nombre='facturas.csv'):
+        archivo = SimpleUploadedFile(nombre, contenido.encode('utf-8'))
+        trabajo = crear_trabajo(self.usuario, archivo, nombre.rsplit('.', 1)[-1])
+        procesar_trabajo(trabajo.pk)
+        trabajo.refresh_from_db()
+        return trabajo
+
+    def confirmar(self, trabajo):
+        TrabajoImportacion.objects.filter(pk=trabajo.pk, estado='analizado').update(estado='confirmado')
+        procesar_trabajo(trabajo.pk)
+        trabajo.refresh_from_db()
+        return trabajo
+
+    def test_monto_fuera_de_rango_se_rechaza_solo(self):
+        trabajo = self.analizar(
+            self.CABECERA +
+            'IMP-1,2026-01-10,2026-02-10,12345678-5,Cliente Uno,1000,1000,pendiente\n'
+            'IMP-2,2026-01-10,2026-02-10,12345678-5,Cliente Uno,123456789012,0,pagada\n'
+            'IMP-3,2026-01-11,2026-02-11,12345678-5,Cliente Uno,2000,0,pagada\n'
+        )
+        self.assertEqual(trabajo.estado, 'analizado')
+        self.assertEqual(trabajo.nuevas, 2)
+        self.assertEqual(trabajo.filas_con_error, 1)
+        self.assertEqual(trabajo.errores[0]['row_num'], 3)
+
+        trabajo = self.confirmar(trabajo)
+        self.assertEqual(trabajo.estado, 'completado')
+        self.assertEqual(trabajo.facturas_creadas, 2)
+        self.assertFalse(Factura.objects.filter(numero_factura='IMP-2').exists())
+
+    def test_filas_nuevas_actualizadas_e_invalidas(self):
+        trabajo = self.analizar(
+            self.CABECERA +
+            'IMP-10,2026-01-10,2026-02-10,12345678-5,Cliente Uno,1500,1500,pendiente\n'
+            'IMP-11,2026-01-10,2026-02-10,12345678-5,Cliente Uno,1000,1000,pendiente\n'
+            'IMP-12,2026-01-12,2026-02-12,12345678-5,Cliente Uno,3000,0,pagada\n'
+            'IMP-13,2026-01-13,,11111111-1,Cliente Nuevo,4000,4000,pendiente\n'
+            'IMP-14,2026-99-13,2026-02-13,11111111-1,Cliente Nuevo,5000,5000,pendiente\n'
+            'IMP-15,2026-01-15,2026-02-15,,Sin RUT,6000,6000,pendiente\n'
+        )
+        self.assertEqual(trabajo.estado, 'analizado')
+        self.assertEqual((trabajo.nuevas, trabajo.actualizadas, trabajo.sin_cambios), (2, 1, 1))
+        self.assertEqual([error['row_num'] for error in trabajo.errores], [6, 7])
+
+        trabajo = self.confirmar(trabajo)
+        self.assertEqual(trabajo.estado, 'completado')
+        self.assertEqual((trabajo.facturas_creadas, trabajo.facturas_actualizadas), (2, 2))
+        self.assertEqual(Factura.objects.get(numero_factura='IMP-10').monto_total, 1500)
+        nueva = Factura.objects.get(numero_factura='IMP-13')
+        self.assertEqual(nueva.cliente.nombre, 'Cliente Nuevo')
+        self.assertEqual(nueva.fecha_vencimiento, datetime.date(2026, 2, 12))
+        self.assertDerivadosAlDia()
+
+    @skipUnless(connection.vendor == 'sqlite', 'El rechazo se simula con un trigger de SQLite')
+    def test_fila_rechazada_por_la_base_de_datos_no_deshace_las_demas(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "CREATE TRIGGER prueba_rechazo BEFORE INSERT ON core_factura "
+                "WHEN NEW.numero_factura = 'IMP-FALLA' BEGIN SELECT RAISE(ABORT, 'folio rechazado'); END"
+            )
+        trabajo = self.confirmar(self.analizar(
+            self.CABECERA +
+            'IMP-20,2026-01-10,2026-02-10,12345678-5,Cliente Uno,1000,1000,pendiente\n'
+            'IMP-FALLA,2026-01-10,2026-02-10,12345678-5,Cliente Uno,1000,1000,pendiente\n'
+            'IMP-10,2026-01-10,2026-02-10,12345678-5,Cliente Uno,2500,0,pagada\n'
+        ))
+        self.assertEqual(trabajo.estado, 'completado')
+        self.assertEqual((trabajo.facturas_creadas, trabajo.facturas_actualizadas), (1, 1))
+        self.assertEqual([error['row_num'] for error in trabajo.errores], [3])
+        self.assertIn('folio rechazado', trabajo.errores[0]['error'])
+        self.assertTrue(Factura.objects.filter(numero_factura='IMP-20').exists())
+        self.assertEqual(Factura.objects.get(numero_factura='IMP-10').estado, 'pagada')
+        self.assertDerivadosAlDia()
+
+    def test_vista_previa_cuenta_lo_que_importara_la_confirmacion(self):
+        otro = User.objects.create_user('otro', 'otro@example.com', 'clave-segura-123')
+        Factura.objects.create(
+            cliente=Cliente.objects.create(nombre='Cliente Ajeno', email='a@example.com', usuario=otro),
+            numero_factura='AJENA-1',
+            monto=1000,
+            monto_total=1000,
+            fecha_emision=datetime.date(2026, 1, 10),
+            fecha_vencimiento=datetime.date(2026, 2, 10),
+            usuario=otro,
+        )
+        trabajo = self.analizar(
+            self.CABECERA +
+            'IMP-30,2026-01-10,2026-02-10,12345678-5,Cliente Uno,1000,1000,pendiente\n'
+            'IMP-31,2026-01-10,2026-02-10,12345678-5,Cliente Uno,2000,2000,pendiente\n'
+            'IMP-30,2026-01-10,2026-02-10,12345678-5,Cliente Uno,3000,3000,pendiente\n'
+            'AJENA-1,2026-01-10,2026-02-10,12345678-5,Cliente Uno,4000,4000,pendiente\n'
+        )
+        self.assertEqual((trabajo.nuevas, trabajo.actualizadas, trabajo.sin_cambios), (2, 0, 0))
+        self.assertEqual(trabajo.total_monto, 5000)
+        self.assertEqual([error['row_num'] for error in trabajo.errores], [5])
+
+        trabajo = self.confirmar(trabajo)
+        self.assertEqual((trabajo.facturas_creadas, trabajo.facturas_actualizadas), (2, 0))
+        self.assertEqual(Factura.objects.get(numero_factura='IMP-30').monto_total, 3000)
+        self.assertEqual(Factura.objects.get(numero_factura='AJENA-1').usuario, otro)
+
+
+class LecturaImportacionTest(SimpleTestCase):
+    """La lectura en streaming, la lectura en paralelo por fragmentos y el XML dan las mismas filas y errores"""
+
+    HOY = datetime.date(2026, 3, 1)
+
+    # (folio, emisión, vencimiento, RUT, razón social, total); con filas inválidas
+    # y caracteres multibyte que quedan cortados entre bloques
+    DOCUMENTOS = [
+        ('501', '2026-01-05', '2026-02-05', '12.345.678-5', 'Ñandú Ingeniería Ltda.', '119000'),
+        ('502', '2026-01-06', '2026-02-06', '11.111.111-1', 'Café Señorío', '59500'),
+        ('503', '2026-13-01', '2026-02-07', '12.345.678-5', 'Fecha inválida', '1000'),
+        ('', '2026-01-08', '2026-02-08', '12.345.678-5', 'Sin folio', '1000'),
+        ('505', '2026-01-09', '2026-02-09', '11.111.111-1', 'Árbol y Compañía', 'abc'),
+    ] * 4
+
+    def csv(self):
+        lineas = ['folio,tipo_dte,fecha_emision,fecha_vencimiento,rut_receptor,razon_social_receptor,'
+                  'monto_total,monto_pendiente,estado_pago\n']
+        for folio, emision, vencimiento, rut, razon_social, total in self.DOCUMENTOS:
+            lineas.append(f'{folio},33,{emision},{vencimiento},{rut},{razon_social},{total},{total},\n')
+        return ''.join(lineas).encode('utf-8')
+
+    def xml(self):
+        dtes = ''.join(
+            f'<DTE version="1.0"><Documento><Encabezado>'
+            f'<IdDoc><TipoDTE>33</TipoDTE><Folio>{folio}</Folio><FchEmis>{emision}</FchEmis>'
+            f'<FmaPago>2</FmaPago><FchVenc>{vencimiento}</FchVenc></IdDoc>'
+            f'<Receptor><RUTRecep>{rut}</RUTRecep><RznSocRecep>{razon_social}</RznSocRecep></Receptor>'
+            f'<Totales><MntTotal>{total}</MntTotal></Totales></Encabezado></Documento>'
+            f'<Signature xmlns="http://www.w3.org/2000/09/xmldsig#"><SignatureValue>AAAA</SignatureValue></Signature></DTE>'
+            for folio, emision, vencimiento, rut, razon_social, total in self.DOCUMENTOS
+        )
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            f'<EnvioDTE xmlns="http://www.sii.cl/SiiDte" version="1.0"><SetDTE>{dtes}</SetDTE></EnvioDTE>'
+        ).encode('utf-8')
+
+    def leer_en_streaming(self, lector, datos, tamano_bloque):
+        bloques = (datos[i:i + tamano_bloque] for i in range(0, len(datos), tamano_bloque))
+        return validar_lote(list(lector(bloques)), self.HOY)
+
+    def test_streaming_y_paralelo_dan_lo_mismo(self):
+        datos = self.csv()
+        cabecera = datos.index(b'\n') + 1
+        esperado = validar_lote(list(leer_filas_csv([datos])), self.HOY)
+        self.assertEqual((len(esperado[0]), len(esperado[1])), (8, 12))
+        self.assertEqual([error['row_num'] for error in esperado[1]][:3], [4, 5, 6])
+
+        for tamano_bloque in [1, 2, 3, 7, 64]:
+            with self.subTest(tamano_bloque=tamano_bloque):
+                self.assertEqual(self.leer_en_streaming(leer_filas_csv, datos, tamano_bloque), esperado)
+
+        with ProcessPoolExecutor(max_workers=2) as pool:
+            for tamano in [1, 50, 97, 333, len(datos)]:
+                with self.subTest(tamano_fragmento=tamano):
+                    archivo = io.BufferedReader(io.BytesIO(datos))
+                    fragmentos = list(validar_csv_en_paralelo(archivo, self.HOY, pool, en_curso=2, tamano=tamano))
+                    items = [item for fragmento in fragmentos for item in fragmento.items]
+                    errores = [error for fragmento in fragmentos for error in fragmento.errores]
+                    self.assertEqual((items, errores), esperado)
+                    self.assertEqual(sum(fragmento.tamano for fragmento in fragmentos), len(datos) - cabecera)
+                    if tamano < len(datos):
+                        self.assertGreater(len(fragmentos), 1)
+
+    def test_xml_con_varios_documentos(self):
+        datos = self.xml()
+        # Los documentos se numeran desde 1 y las filas del CSV desde 2 (la cabecera)
+        items_csv, errores_csv = validar_lote(list(leer_filas_csv([self.csv()])), self.HOY)
+        esperado = (
+            [dict(item, row_num=item['row_num'] - 1) for item in items_csv],
+            [dict(error, row_num=error['row_num'] - 1) for error in errores_csv],
+        )
+
+        for tamano_bloque in [1, 3, 7, 64, len(datos)]:
+            with self.subTest(tamano_bloque=tamano_bloque):
+                self.assertEqual(self.leer_en_streaming(leer_documentos_dte, datos, tamano_bloque), esperado)
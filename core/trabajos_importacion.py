@@ -0,0 +1,291 @@
+import datetime
+import io
+import itertools
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.db import connections, transaction
+from django.utils import timezone
+
+from .importacion_sii import (
+    TAMANO_BLOQUE, TAMANO_FRAGMENTO, LECTORES, en_lotes, validar_lote, validar_csv_en_paralelo,
+    comparar_con_existentes, guardar_lote_intermedio, descartar_folios_repetidos, resumen_intermedio,
+    importar_intermedia, reconstruir_derivados,
+)
+from .models import TrabajoImportacion, BloqueArchivoImportacion, FilaImportacion
+
+
+# ========================
+# IMPORTACIONES EN SEGUNDO PLANO
+# ========================
+
+# La vista de importación solo guarda el archivo en un TrabajoImportacion
+# (en bloques en la base de datos, que la web y el worker comparten aunque
+# corran en servidores distintos) y responde de inmediato; `manage.py procesar_importaciones` reparte los
+# trabajos en cola entre procesos. Cada trabajo pasa por dos fases:
+#   pendiente -> analizando -> analizado    (validar, comparar y dejar las
+#                                            filas en la tabla intermedia)
+#   confirmado -> importando -> completado  (fusión desde la tabla intermedia)
+# Un trabajo se toma con un UPDATE condicionado al estado, de modo que dos
+# procesos nunca procesan el mismo. El avance (bytes leídos, filas, filas por
+# segundo) se guarda una vez por lote para que la página lo consulte.
+
+# Errores por fila que se guardan (el total queda en filas_con_error)
+MAX_ERRORES = 200
+
+# Días que se conserva una vista previa sin confirmar
+DIAS_VIGENCIA_PREVIA = 2
+
+# Tamaño de los bloques en que se guarda el archivo subido
+TAMANO_BLOQUE_GUARDADO = 1024 * 1024
+
+CAMPOS_AVANCE = ['bytes_procesados', 'filas_procesadas', 'filas_con_error', 'filas_por_segundo', 'errores']
+
+CAMPOS_ANALISIS = CAMPOS_AVANCE + [
+    'nuevas', 'actualizadas', 'sin_cambios', 'pagadas', 'pendientes', 'total_monto', 'total_pendiente',
+]
+
+CAMPOS_IMPORTACION = CAMPOS_AVANCE + ['facturas_creadas', 'facturas_actualizadas']
+
+
+def crear_trabajo(usuario, archivo_subido, formato):
+    """
+    Crea el trabajo y guarda el archivo subido en bloques, en una sola
+    transacción para que el worker no tome un trabajo a medio guardar
+    """
+    with transaction.atomic():
+        trabajo = TrabajoImportacion.objects.create(
+            usuario=usuario,
+            nombre_archivo=archivo_subido.name[:255],
+            formato=formato,
+            tamano_archivo=archivo_subido.size,
+        )
+        for numero, datos in enumerate(archivo_subido.chunks(TAMANO_BLOQUE_GUARDADO)):
+            BloqueArchivoImportacion.objects.create(trabajo=trabajo, numero=numero, datos=datos)
+    return trabajo
+
+
+class ArchivoGuardado(io.RawIOBase):
+    """
+    Lectura secuencial del archivo de un trabajo desde sus bloques, con un
+    solo bloque en memoria a la vez. Ver abrir_archivo().
+    """
+
+    def __init__(self, trabajo):
+        self.bloques = BloqueArchivoImportacion.objects.filter(trabajo=trabajo).values_list('datos', flat=True)
+        self.siguiente = 0
+        self.pendiente = memoryview(b'')
+
+    def readable(self):
+        return True
+
+    def readinto(self, destino):
+        if not self.pendiente:
+            datos = self.bloques.filter(numero=self.siguiente).first()
+            if datos is None:
+                return 0
+            self.siguiente += 1
+            self.pendiente = memoryview(bytes(datos))
+        cantidad = min(len(destino), len(self.pendiente))
+        destino[:cantidad] = self.pendiente[:cantidad]
+        self.pendiente = self.pendiente[cantidad:]
+        return cantidad
+
+
+def abrir_archivo(trabajo):
+    """Archivo binario de solo lectura (con readline() y peek()) con el contenido subido"""
+    return io.BufferedReader(ArchivoGuardado(trabajo), buffer_size=TAMANO_BLOQUE)
+
+
+def tomar_trabajo(pk):
+    """
+    Pasa el trabajo de su estado en cola al estado en proceso. Retorna el
+    trabajo si este proceso lo tomó, o None si no estaba en cola (otro
+    proceso lo tomó o el usuario aún no lo confirma).
+    """
+    trabajo = TrabajoImportacion.objects.filter(pk=pk).first()
+    if trabajo is None or trabajo.estado not in TrabajoImportacion.ESTADOS_EN_COLA:
+        return None
+    siguiente = TrabajoImportacion.ESTADOS_EN_COLA[trabajo.estado]
+    tomado = TrabajoImportacion.objects.filter(pk=pk, estado=trabajo.estado).update(
+        estado=siguiente,
+        fecha_inicio=timezone.now(),
+        bytes_procesados=0,
+        filas_procesadas=0,
+        filas_por_segundo=0,
+    )
+    if not tomado:
+        return None
+    trabajo.refresh_from_db()
+    return trabajo
+
+
+def procesar_trabajo(pk, procesos_lectura=1):
+    """
+    Punto de entrada de los procesos del worker: toma el trabajo y ejecuta la
+    fase que corresponda. Retorna el estado final, o None si no se tomó.
+    """
+    trabajo = tomar_trabajo(pk)
+    if trabajo is None:
+        return None
+
+    try:
+        if trabajo.estado == 'analizando':
+            analizar_trabajo(trabajo, procesos_lectura)
+        else:
+            importar_trabajo(trabajo)
+    except Exception as e:
+        TrabajoImportacion.objects.filter(pk=pk).update(
+            estado='error',
+            mensaje=f'Error al procesar el archivo: {e}',
+            fecha_fin=timezone.now(),
+        )
+        FilaImportacion.objects.filter(trabajo_id=pk).delete()
+        BloqueArchivoImportacion.objects.filter(trabajo_id=pk).delete()
+        return 'error'
+    return trabajo.estado
+
+
+def _bloques_contados(archivo, trabajo):
+    """Bloques del archivo, acumulando en el trabajo los bytes leídos"""
+    for bloque in iter(lambda: archivo.read(TAMANO_BLOQUE), b''):
+        trabajo.bytes_procesados += len(bloque)
+        yield bloque
+
+
+def _agregar_errores(trabajo, errores):
+    trabajo.filas_con_error += len(errores)
+    espacio = MAX_ERRORES - len(trabajo.errores)
+    if espacio > 0:
+        trabajo.errores.extend(errores[:espacio])
+
+
+def _registrar_avance(trabajo, inicio, campos):
+    segundos = time.monotonic() - inicio
+    trabajo.filas_por_segundo = round(trabajo.filas_procesadas / segundos, 1) if segundos else 0
+    trabajo.save(update_fields=campos)
+
+
+def _guardar_validados(trabajo, items, errores):
+    """Compara con las facturas existentes y guarda en la tabla intermedia los ítems de un lote"""
+    errores = errores + guardar_lote_intermedio(trabajo, comparar_con_existentes(trabajo.usuario, items))
+    _agregar_errores(trabajo, sorted(errores, key=lambda error: error['row_num']))
+
+
+def _analizar_en_paralelo(archivo, trabajo, hoy, inicio, procesos):
+    """
+    Lee y valida el CSV por fragmentos en un pool de `procesos` procesos; este
+    proceso compara y guarda los resultados en el orden del archivo. Como la
+    escritura en la tabla intermedia no se reparte, solo acelera archivos
+    cuyo costo está en la lectura (ver VALIDACIÓN EN PARALELO en importacion_sii).
+    """
+    # Los procesos hijos no usan la base de datos: no deben heredar conexiones
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=procesos, initializer=django.setup) as pool:
+        for fragmento in validar_csv_en_paralelo(archivo, hoy, pool, en_curso=procesos * 2):
+            # Cada lote lleva los errores de validación de sus filas, para que
+            # los errores se acumulen en orden de fila como en la lectura en streaming
+            errores = fragmento.errores
+            for items in en_lotes(fragmento.items):
+                hasta = items[-1]['row_num']
+                previos = list(itertools.takewhile(lambda error: error['row_num'] <= hasta, errores))
+                errores = errores[len(previos):]
+                _guardar_validados(trabajo, items, previos)
+            if errores:
+                _agregar_errores(trabajo, errores)
+            trabajo.bytes_procesados += fragmento.tamano
+            trabajo.filas_procesadas += fragmento.registros
+            _registrar_avance(trabajo, inicio, CAMPOS_AVANCE)
+
+
+def analizar_trabajo(trabajo, procesos_lectura=1):
+    """
+    Fase 1: lee el archivo (CSV o XML según el formato del trabajo) y lo
+    valida por lotes, compara cada lote con las facturas existentes (una
+    consulta por lote) y lo inserta en la tabla intermedia. Con
+    `procesos_lectura` > 1 (desactivado por defecto), los CSV de más de un
+    fragmento se leen y validan en paralelo. Al terminar calcula los totales de la vista previa con un
+    aggregate, elimina el archivo y deja el trabajo en 'analizado'.
+    """
+    hoy = timezone.localdate()
+    inicio = time.monotonic()
+    trabajo.errores = []
+    trabajo.filas_con_error = 0
+    FilaImportacion.objects.filter(trabajo=trabajo).delete()
+
+    en_paralelo = procesos_lectura > 1 and trabajo.formato == 'csv' and trabajo.tamano_archivo > TAMANO_FRAGMENTO
+    with abrir_archivo(trabajo) as archivo:
+        if en_paralelo:
+            _analizar_en_paralelo(archivo, trabajo, hoy, inicio, procesos_lectura)
+        else:
+            leer_registros = LECTORES[trabajo.formato]
+            for lote in en_lotes(leer_registros(_bloques_contados(archivo, trabajo))):
+                items, errores = validar_lote(lote, hoy)
+                _guardar_validados(trabajo, items, errores)
+                trabajo.filas_procesadas += len(lote)
+                _registrar_avance(trabajo, inicio, CAMPOS_AVANCE)
+
+    # La vista previa cuenta lo que hará la confirmación: una fila por folio
+    descartar_folios_repetidos(trabajo)
+    for campo, valor in resumen_intermedio(trabajo).items():
+        setattr(trabajo, campo, valor)
+    # Las filas ya están en la tabla intermedia: el archivo no se vuelve a leer
+    BloqueArchivoImportacion.objects.filter(trabajo=trabajo).delete()
+    trabajo.estado = 'analizado'
+    trabajo.fecha_fin = timezone.now()
+    trabajo.save(update_fields=CAMPOS_ANALISIS + ['estado', 'fecha_fin'])
+
+
+def importar_trabajo(trabajo):
+    """
+    Fase 2: fusiona la tabla intermedia con las facturas en una transacción,
+    reconstruye una vez los derivados (resumen de cartera, contadores de
+    clientes, caché) y vacía la tabla intermedia del trabajo.
+    """
+    inicio = time.monotonic()
+    filas = FilaImportacion.objects.filter(trabajo=trabajo)
+    trabajo.filas_procesadas = filas.count()
+    resultado = importar_intermedia(trabajo)
+    if resultado.creadas or resultado.actualizadas:
+        reconstruir_derivados(trabajo.usuario_id)
+    filas.delete()
+
+    trabajo.facturas_creadas = resultado.creadas
+    trabajo.facturas_actualizadas = resultado.actualizadas
+    _agregar_errores(trabajo, resultado.errores)
+    trabajo.estado = 'completado'
+    trabajo.fecha_fin = timezone.now()
+    _registrar_avance(trabajo, inicio, CAMPOS_IMPORTACION + ['estado', 'fecha_fin'])
+
+
+def descartar_previas_vencidas(dias=DIAS_VIGENCIA_PREVIA):
+    """
+    Marca como error las vistas previas que nadie confirmó en `dias` días y
+    vacía su tabla intermedia. Retorna cuántos trabajos se descartaron.
+    """
+    vencidos = TrabajoImportacion.objects.filter(
+        estado='analizado',
+        fecha_fin__lt=timezone.now() - datetime.timedelta(days=dias),
+    )
+    pks = list(vencidos.values_list('pk', flat=True))
+    if pks:
+        FilaImportacion.objects.filter(trabajo_id__in=pks).delete()
+        TrabajoImportacion.objects.filter(pk__in=pks, estado='analizado').update(
+            estado='error',
+            mensaje='La vista previa expiró sin ser confirmada. Sube el archivo nuevamente.',
+        )
+    return len(pks)
+
+
+def reencolar_interrumpidos():
+    """
+    Devuelve a la cola los trabajos que quedaron en proceso (el worker se
+    detuvo a mitad). Repetir una fase es seguro: el análisis rehace la tabla
+    intermedia y la fusión es una sola transacción que actualiza por folio.
+    Retorna cuántos se reencolaron.
+    """
+    reencolados = 0
+    for en_cola, en_proceso in TrabajoImportacion.ESTADOS_EN_COLA.items():
+        reencolados += TrabajoImportacion.objects.filter(estado=en_proceso).update(estado=en_cola)
+    return reencolados
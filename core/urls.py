@@ -14,6 +14,7 @@ urlpatterns = [
     path('clientes/', views.clientes_list, name='clientes_list'),
     path('clientes/nuevo/', views.cliente_crear, name='cliente_crear'),
     path('clientes/<int:pk>/', views.cliente_detalle, name='cliente_detalle'),
+    path('clientes/<int:pk>/facturas/', views.cliente_facturas, name='cliente_facturas'),
     path('clientes/<int:pk>/editar/', views.cliente_editar, name='cliente_editar'),
     
     path('facturas/', views.facturas_list, name='facturas_list'),
@@ -25,4 +26,9 @@ urlpatterns = [
     path('configuracion/', views.configuracion_view, name='configuracion'),
     path('exportar/pdf/', views.exportar_pdf, name='exportar_pdf'),
     path('exportar/excel/', views.exportar_excel, name='exportar_excel'),
+
+    path('api/vencimiento/', views.api_mapa_vencimiento, name='api_mapa_vencimiento'),
+    path('api/tendencia/', views.api_tendencia, name='api_tendencia'),
+    path('api/dashboard/<str:widget>/', views.api_dashboard_widget, name='api_dashboard_widget'),
+    path('api/importaciones/<uuid:token>/', views.api_importacion, name='api_importacion'),
 ]
\ No newline at end of file
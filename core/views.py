@@ -1,27 +1,32 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
+from django.template.loader import render_to_string
+from django.http import JsonResponse, Http404
 from django.contrib.auth.decorators import login_required
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import etag
 from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib import messages
-from django.db.models import Q, Sum, Count, Case, When, F
-from django.db.models.functions import TruncMonth
+from django.db.models import Q, Sum, Count
 from django.utils import timezone
 from django.core.paginator import Paginator
-from .models import Cliente, Factura, ConfiguracionRecordatorio, HistorialRecordatorio
+from .models import Cliente, Factura, ConfiguracionRecordatorio, HistorialRecordatorio, TrabajoImportacion
 from .forms import ClienteForm, FacturaForm, ConfiguracionForm
 from .utils import generar_pdf_reporte, generar_excel_reporte, enviar_recordatorio_email
+from .cobranza import asegurar_estados_cobranza
+from .metricas import mapa_vencimiento, resumen_cliente, expresion_monto_facturado, VENTANAS_TENDENCIA, LIMITE_MAXIMO_VENCIMIENTO
+from .cache_usuario import version_usuario, obtener_cache_usuario, invalidar_cache_usuario
+from .dashboard import WIDGETS_DASHBOARD, calcular_widget, tendencia_usuario
+from .resumen_cartera import contadores_facturas
+from .paginacion import paginar_por_cursor
+from .busqueda import buscar_clientes, buscar_facturas
+from .trabajos_importacion import crear_trabajo
 import datetime
+import hashlib
+import uuid
 
 
-def actualizar_estados_cobranza(facturas):
-    """
-    Actualiza los estados de cobranza de las facturas pendientes.
-    Esta función debe llamarse en cada vista que muestre facturas.
-    """
-    for factura in facturas.filter(estado='pendiente'):
-        factura.actualizar_estado_cobranza()
-        factura.save()
-
 def register_view(request):
     if request.method == 'POST':
         form = UserCreationForm(request.POST)
@@ -56,390 +61,129 @@ def logout_view(request):
 
 @login_required
 def dashboard(request):
-    clientes = Cliente.objects.filter(usuario=request.user, activo=True)
+    # La página se renderiza sin métricas; cada widget se pide por separado a api_dashboard_widget
+    return render(request, 'core/dashboard.html')
 
-    # Actualizar estados de cobranza primero
-    facturas_pendientes = Factura.objects.filter(usuario=request.user, estado='pendiente')
-    for factura in facturas_pendientes:
-        factura.actualizar_estado_cobranza()
-        factura.save()
+def _etag_widget_dashboard(request, widget):
+    # Cambia cuando el usuario modifica facturas o clientes (versión de caché) y cuando cambia el día
+    return f'"{widget}-{version_usuario(request.user.pk)}-{timezone.localdate().isoformat()}"'
 
-    # Refrescar el QuerySet después de actualizar
-    facturas = Factura.objects.filter(usuario=request.user)
+# no_cache: el navegador revalida siempre con el ETag (304 si nada cambió), así
+# el widget refleja al instante una factura recién creada o pagada
+@login_required
+@cache_control(private=True, no_cache=True)
+@etag(_etag_widget_dashboard)
+def api_dashboard_widget(request, widget):
+    """Datos JSON de un widget del dashboard (kpis, vencimiento, estados, montos, tendencia, alertas, ultimas)"""
+    if widget not in WIDGETS_DASHBOARD:
+        raise Http404('Widget no encontrado')
+    return JsonResponse(calcular_widget(widget, request.user, timezone.localdate()))
 
-    # ========== SISTEMA DE ALERTAS INTELIGENTES ==========
-    alertas = []
-
-    # Alerta 1: Facturas vencidas este mes
-    inicio_mes = timezone.now().date().replace(day=1)
-    facturas_vencidas_mes = facturas.filter(
-        estado='pendiente',
-        fecha_vencimiento__gte=inicio_mes,
-        fecha_vencimiento__lt=timezone.now().date()
-    ).count()
-    if facturas_vencidas_mes > 0:
-        alertas.append({
-            'tipo': 'danger',
-            'icono': 'exclamation-triangle-fill',
-            'mensaje': f'Tienes {facturas_vencidas_mes} facturas vencidas este mes',
-            'accion': 'facturas_list',
-            'filtro': 'vencidas'
-        })
-
-    # Alerta 2: Facturas por vencer en los próximos 7 días
-    proxima_semana = timezone.now().date() + datetime.timedelta(days=7)
-    facturas_por_vencer_pronto = facturas.filter(
-        estado='pendiente',
-        fecha_vencimiento__gte=timezone.now().date(),
-        fecha_vencimiento__lte=proxima_semana
-    ).count()
-    if facturas_por_vencer_pronto > 0:
-        alertas.append({
-            'tipo': 'warning',
-            'icono': 'clock-fill',
-            'mensaje': f'{facturas_por_vencer_pronto} facturas vencen en los próximos 7 días',
-            'accion': 'facturas_list',
-            'filtro': 'por_vencer'
-        })
-
-    # Alerta 3: Facturas en mora (+30 días vencidas)
-    facturas_mora_count = facturas.filter(estado='pendiente', estado_cobranza='mora').count()
-    if facturas_mora_count > 0:
-        monto_mora = facturas.filter(estado='pendiente', estado_cobranza='mora').aggregate(
-            total=Sum(Case(
-                When(monto_pendiente__gt=0, then=F('monto_pendiente')),
-                default=F('monto_total')
-            ))
-        )['total'] or 0
-        alertas.append({
-            'tipo': 'danger',
-            'icono': 'hourglass-split',
-            'mensaje': f'{facturas_mora_count} facturas en mora por ${monto_mora:,.0f}',
-            'accion': 'facturas_list',
-            'filtro': 'mora'
-        })
-
-    # Alerta 4: Concentración de clientes (análisis 80/20)
-    if facturas.filter(estado='pendiente').exists():
-        total_pendiente_global = facturas.filter(estado='pendiente').aggregate(
-            total=Sum(Case(
-                When(monto_pendiente__gt=0, then=F('monto_pendiente')),
-                default=F('monto_total')
-            ))
-        )['total'] or 0
-
-        if total_pendiente_global > 0:
-            # Top 5 clientes con más deuda
-            top_clientes = facturas.filter(estado='pendiente').values('cliente__nombre').annotate(
-                deuda=Sum(Case(
-                    When(monto_pendiente__gt=0, then=F('monto_pendiente')),
-                    default=F('monto_total')
-                ))
-            ).order_by('-deuda')[:5]
-
-            deuda_top5 = sum(c['deuda'] for c in top_clientes)
-            porcentaje_concentracion = (deuda_top5 / total_pendiente_global) * 100 if total_pendiente_global > 0 else 0
-
-            if porcentaje_concentracion >= 70:
-                alertas.append({
-                    'tipo': 'info',
-                    'icono': 'pie-chart-fill',
-                    'mensaje': f'5 clientes concentran el {porcentaje_concentracion:.0f}% de tu cartera por cobrar',
-                    'accion': None,
-                    'filtro': None
-                })
-
-    # Alerta 5: Facturas sin fecha de vencimiento o con datos incompletos
-    facturas_sin_vencimiento = facturas.filter(
-        estado='pendiente',
-        fecha_vencimiento__isnull=True
-    ).count()
-    if facturas_sin_vencimiento > 0:
-        alertas.append({
-            'tipo': 'secondary',
-            'icono': 'question-circle-fill',
-            'mensaje': f'{facturas_sin_vencimiento} facturas sin fecha de vencimiento',
-            'accion': 'facturas_list',
-            'filtro': 'pendientes'
-        })
-
-    # Alerta 6: Facturas incobrables (+90 días)
-    facturas_incobrables_count = facturas.filter(estado='pendiente', estado_cobranza='incobrable').count()
-    if facturas_incobrables_count > 0:
-        alertas.append({
-            'tipo': 'dark',
-            'icono': 'x-circle-fill',
-            'mensaje': f'{facturas_incobrables_count} facturas podrían ser incobrables (+90 días)',
-            'accion': 'facturas_list',
-            'filtro': 'incobrables'
-        })
-
-    # Contadores por estado principal
-    facturas_pendientes = facturas.filter(estado='pendiente').count()
-    facturas_pagadas = facturas.filter(estado='pagada').count()
-    facturas_anuladas = facturas.filter(estado='anulada').count()
-
-    # Contadores por estado de cobranza (solo pendientes)
-    # Forzar evaluación del QuerySet para obtener datos actualizados
-    facturas_vigentes = Factura.objects.filter(usuario=request.user, estado='pendiente', estado_cobranza='vigente').count()
-    facturas_por_vencer = Factura.objects.filter(usuario=request.user, estado='pendiente', estado_cobranza='por_vencer').count()
-    facturas_vencidas = Factura.objects.filter(usuario=request.user, estado='pendiente', estado_cobranza='vencida').count()
-    facturas_en_mora = Factura.objects.filter(usuario=request.user, estado='pendiente', estado_cobranza='mora').count()
-    facturas_incobrables = Factura.objects.filter(usuario=request.user, estado='pendiente', estado_cobranza='incobrable').count()
-
-    # Facturas próximas a vencer (7 días o menos)
-    facturas_proximas = facturas.filter(
-        estado='pendiente',
-        estado_cobranza='por_vencer'
-    )
+# Valores aceptados en el parámetro `por` de api_mapa_vencimiento ('' = sin agrupar)
+AGRUPACIONES_MAPA = {'cliente', 'moneda', ''}
 
-    # Total por cobrar - suma directa de monto_pendiente de facturas pendientes
-    total_pendiente = facturas.filter(estado='pendiente').aggregate(
-        total=Sum('monto_pendiente')
-    )['total'] or 0
-
-    # Total pagado - suma directa de monto_pagado de todas las facturas
-    total_pagado = facturas.aggregate(
-        total=Sum('monto_pagado')
-    )['total'] or 0
-
-    # Total facturado
-    total_facturado = facturas.aggregate(
-        total=Sum('monto_total')
-    )['total'] or 0
-
-    # Total de facturas con pago parcial
-    facturas_pago_parcial = facturas.filter(
-        estado='pendiente',
-        monto_pagado__gt=0,
-        monto_pendiente__gt=0
-    ).count()
-
-    # Monto total de pagos parciales recibidos
-    monto_pagos_parciales = facturas.filter(
-        estado='pendiente',
-        monto_pagado__gt=0
-    ).aggregate(total=Sum('monto_pagado'))['total'] or 0
-
-    # Montos por estado de cobranza para gráficos
-    # Usar monto_pendiente directamente ya que todas son facturas pendientes
-    monto_vigentes = Factura.objects.filter(usuario=request.user, estado='pendiente', estado_cobranza='vigente').aggregate(
-        total=Sum('monto_pendiente')
-    )['total'] or 0
-
-    monto_por_vencer = Factura.objects.filter(usuario=request.user, estado='pendiente', estado_cobranza='por_vencer').aggregate(
-        total=Sum('monto_pendiente')
-    )['total'] or 0
-
-    monto_vencidas = Factura.objects.filter(usuario=request.user, estado='pendiente', estado_cobranza='vencida').aggregate(
-        total=Sum('monto_pendiente')
-    )['total'] or 0
-
-    monto_en_mora = Factura.objects.filter(usuario=request.user, estado='pendiente', estado_cobranza='mora').aggregate(
-        total=Sum('monto_pendiente')
-    )['total'] or 0
-
-    monto_incobrables = Factura.objects.filter(usuario=request.user, estado='pendiente', estado_cobranza='incobrable').aggregate(
-        total=Sum('monto_pendiente')
-    )['total'] or 0
-
-    monto_pagadas = facturas.filter(estado='pagada').aggregate(
-        total=Sum(Case(
-            When(monto_total__gt=0, then=F('monto_total')),
-            default=F('monto')
-        ))
-    )['total'] or 0
-
-    # Facturas por mes para gráfico de línea (últimos 12 meses con datos)
-    facturas_por_mes = facturas.annotate(
-        mes=TruncMonth('fecha_emision')
-    ).values('mes').annotate(
-        total=Count('id')
-    ).order_by('mes')
-
-    # Limitar a los últimos 12 meses con datos
-    facturas_por_mes_list = list(facturas_por_mes)[-12:]
-
-    # Preparar datos para el gráfico
-    import json
-    meses_labels = []
-    meses_data = []
-    for item in facturas_por_mes_list:
-        meses_labels.append(item['mes'].strftime('%b %Y'))
-        meses_data.append(item['total'])
-
-    # ========== MAPA DE VENCIMIENTO ==========
-    hoy = timezone.now().date()
-
-    # 0-30 días vencidas
-    vencidas_0_30 = facturas.filter(
-        estado='pendiente',
-        fecha_vencimiento__lt=hoy,
-        fecha_vencimiento__gte=hoy - datetime.timedelta(days=30)
-    )
-    monto_0_30 = vencidas_0_30.aggregate(
-        total=Sum(Case(
-            When(monto_pendiente__gt=0, then=F('monto_pendiente')),
-            default=F('monto_total')
-        ))
-    )['total'] or 0
-
-    # 31-60 días vencidas
-    vencidas_31_60 = facturas.filter(
-        estado='pendiente',
-        fecha_vencimiento__lt=hoy - datetime.timedelta(days=30),
-        fecha_vencimiento__gte=hoy - datetime.timedelta(days=60)
-    )
-    monto_31_60 = vencidas_31_60.aggregate(
-        total=Sum(Case(
-            When(monto_pendiente__gt=0, then=F('monto_pendiente')),
-            default=F('monto_total')
-        ))
-    )['total'] or 0
-
-    # 61-90 días vencidas
-    vencidas_61_90 = facturas.filter(
-        estado='pendiente',
-        fecha_vencimiento__lt=hoy - datetime.timedelta(days=60),
-        fecha_vencimiento__gte=hoy - datetime.timedelta(days=90)
-    )
-    monto_61_90 = vencidas_61_90.aggregate(
-        total=Sum(Case(
-            When(monto_pendiente__gt=0, then=F('monto_pendiente')),
-            default=F('monto_total')
-        ))
-    )['total'] or 0
-
-    # +90 días vencidas
-    vencidas_90_mas = facturas.filter(
-        estado='pendiente',
-        fecha_vencimiento__lt=hoy - datetime.timedelta(days=90)
-    )
-    monto_90_mas = vencidas_90_mas.aggregate(
-        total=Sum(Case(
-            When(monto_pendiente__gt=0, then=F('monto_pendiente')),
-            default=F('monto_total')
-        ))
-    )['total'] or 0
-
-    context = {
-        'total_clientes': clientes.count(),
-        'total_facturas': facturas.count(),
-        # Estados principales
-        'facturas_pendientes': facturas_pendientes,
-        'facturas_pagadas': facturas_pagadas,
-        # Estados de cobranza (solo para pendientes)
-        'facturas_vigentes': facturas_vigentes,
-        'facturas_por_vencer': facturas_por_vencer,
-        'facturas_vencidas': facturas_vencidas,
-        'facturas_en_mora': facturas_en_mora,
-        'facturas_incobrables': facturas_incobrables,
-        # Métricas de pagos parciales
-        'facturas_pago_parcial': facturas_pago_parcial,
-        'monto_pagos_parciales': float(monto_pagos_parciales),
-        'total_pagado': float(total_pagado),
-        'total_facturado': float(total_facturado),
-        # Montos por estado de cobranza
-        'monto_vigentes': int(monto_vigentes),
-        'monto_por_vencer': int(monto_por_vencer),
-        'monto_vencidas': int(monto_vencidas),
-        'monto_en_mora': int(monto_en_mora),
-        'monto_incobrables': int(monto_incobrables),
-        'monto_pagadas': float(monto_pagadas),
-        # Total pendiente (suma de todos los estados de cobranza)
-        'total_pendiente': float(total_pendiente),
-        # Alertas inteligentes
-        'alertas': alertas,
-        # Mapa de vencimiento
-        'vencidas_0_30': vencidas_0_30.count(),
-        'monto_0_30': float(monto_0_30),
-        'vencidas_31_60': vencidas_31_60.count(),
-        'monto_31_60': float(monto_31_60),
-        'vencidas_61_90': vencidas_61_90.count(),
-        'monto_61_90': float(monto_61_90),
-        'vencidas_90_mas': vencidas_90_mas.count(),
-        'monto_90_mas': float(monto_90_mas),
-        # Otros datos
-        'ultimas_facturas': facturas.order_by('-fecha_emision')[:10],
-        'meses_labels': json.dumps(meses_labels),
-        'meses_data': json.dumps(meses_data),
-    }
-    return render(request, 'core/dashboard.html', context)
+@login_required
+def api_mapa_vencimiento(request):
+    """
+    Mapa de vencimiento en JSON para finanzas.
+
+    Parámetros GET:
+        limites: días separados por coma (default: 30,60,90)
+        por: 'cliente' y/o 'moneda', separados por coma
+    """
+    por = {valor.strip() for valor in request.GET.get('por', '').split(',')}
+    if not por <= AGRUPACIONES_MAPA:
+        return JsonResponse({'error': "El parámetro 'por' acepta 'cliente' y/o 'moneda' separados por coma"}, status=400)
+
+    try:
+        limites = [int(limite) for limite in request.GET.get('limites', '30,60,90').split(',') if limite.strip()]
+        tramos = mapa_vencimiento(
+            Factura.objects.filter(usuario=request.user),
+            limites,
+            por_cliente='cliente' in por,
+            por_moneda='moneda' in por,
+        )
+    except ValueError:
+        return JsonResponse({
+            'error': f'Los límites deben ser días enteros entre 1 y {LIMITE_MAXIMO_VENCIMIENTO} separados por coma'
+        }, status=400)
+
+    for tramo in tramos:
+        tramo['monto'] = float(tramo['monto'])
+    return JsonResponse({'fecha': timezone.localdate().isoformat(), 'tramos': tramos})
+
+@login_required
+def api_tendencia(request):
+    """
+    Serie mensual de facturación en JSON.
+
+    Parámetros GET:
+        meses: tamaño de la ventana, 3, 12, 24 o 36 (default: 12)
+    """
+    try:
+        serie = tendencia_usuario(request.user, int(request.GET.get('meses', 12)))
+    except ValueError:
+        return JsonResponse({'error': f'meses debe ser uno de {VENTANAS_TENDENCIA}'}, status=400)
+
+    return JsonResponse({'meses': [
+        {
+            'mes': fila['mes'].strftime('%Y-%m'),
+            'cantidad': fila['cantidad'],
+            'facturado': float(fila['facturado']),
+            'cobrado': float(fila['cobrado']),
+        }
+        for fila in serie
+    ]})
 
 @login_required
 def clientes_list(request):
     clientes = Cliente.objects.filter(usuario=request.user, activo=True)
 
     # Actualizar estados de cobranza de todas las facturas
-    facturas = Factura.objects.filter(usuario=request.user)
-    actualizar_estados_cobranza(facturas)
+    asegurar_estados_cobranza(request.user)
 
-    # Búsqueda
+    # Búsqueda (índice de texto completo, ver core/busqueda.py)
     busqueda = request.GET.get('q', '').strip()
     if busqueda:
-        clientes = clientes.filter(
-            Q(nombre__icontains=busqueda) |
-            Q(rut__icontains=busqueda) |
-            Q(email__icontains=busqueda)
-        )
-
-    # Ordenamiento
-    orden = request.GET.get('orden', 'nombre')
-    if orden in ['nombre', '-nombre', 'rut', '-rut', '-fecha_registro']:
-        clientes = clientes.order_by(orden)
-
-    # Calcular métricas para cada cliente
-    clientes_con_metricas = []
-    for cliente in clientes:
-        facturas_cliente = cliente.facturas.all()
-        facturas_vencidas = facturas_cliente.filter(
-            estado='pendiente',
-            estado_cobranza__in=['vencida', 'mora', 'incobrable']
-        ).count()
-        total_deuda = facturas_cliente.filter(estado='pendiente').aggregate(
-            total=Sum(Case(
-                When(monto_pendiente__gt=0, then=F('monto_pendiente')),
-                default=F('monto_total')
-            ))
-        )['total'] or 0
-        total_facturas = facturas_cliente.count()
-        facturas_pagadas = facturas_cliente.filter(estado='pagada').count()
-
-        cliente.facturas_vencidas = facturas_vencidas
-        cliente.total_deuda = total_deuda
-        cliente.total_facturas = total_facturas
-        cliente.facturas_pagadas = facturas_pagadas
-        clientes_con_metricas.append(cliente)
-
-    # Dashboard de clientes
-    total_clientes = Cliente.objects.filter(usuario=request.user, activo=True).count()
-    clientes_con_deuda = 0
-    clientes_al_dia = 0
-    total_por_cobrar = 0
-
-    for c in Cliente.objects.filter(usuario=request.user, activo=True):
-        deuda = c.facturas.filter(estado='pendiente').aggregate(
-            total=Sum(Case(
-                When(monto_pendiente__gt=0, then=F('monto_pendiente')),
-                default=F('monto_total')
-            ))
-        )['total'] or 0
-        if deuda > 0:
-            clientes_con_deuda += 1
-            total_por_cobrar += deuda
-        else:
-            clientes_al_dia += 1
+        clientes = buscar_clientes(clientes, busqueda)
+
+    # Filtro por deuda (usa los contadores desnormalizados del cliente)
+    deuda = request.GET.get('deuda', '')
+    if deuda == 'con':
+        clientes = clientes.filter(deuda_pendiente__gt=0)
+    elif deuda == 'sin':
+        clientes = clientes.filter(deuda_pendiente__lte=0)
+
+    # Ordenamiento: al buscar, por defecto los más relevantes primero
+    orden = request.GET.get('orden', '-relevancia' if busqueda else 'nombre')
+    ordenes = ['nombre', '-nombre', 'rut', '-rut', '-fecha_registro', '-deuda_pendiente', '-n_vencidas']
+    if busqueda:
+        ordenes.append('-relevancia')
+    if orden in ordenes:
+        clientes = clientes.order_by(orden, 'nombre')
 
     # Paginación
-    paginator = Paginator(clientes_con_metricas, 20)
+    paginator = Paginator(clientes, 20)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
 
+    # Dashboard de clientes: un solo aggregate sobre los contadores de los clientes activos
+    totales = Cliente.objects.filter(usuario=request.user, activo=True).aggregate(
+        total_clientes=Count('id'),
+        clientes_con_deuda=Count('id', filter=Q(deuda_pendiente__gt=0)),
+        total_por_cobrar=Sum('deuda_pendiente'),
+    )
+    total_clientes = totales['total_clientes']
+    clientes_con_deuda = totales['clientes_con_deuda']
+    clientes_al_dia = total_clientes - clientes_con_deuda
+    total_por_cobrar = totales['total_por_cobrar'] or 0
+
     return render(request, 'core/clientes_list.html', {
         'clientes': page_obj,
         'page_obj': page_obj,
         'busqueda': busqueda,
         'orden': orden,
+        'deuda': deuda,
         'total_clientes': total_clientes,
         'clientes_con_deuda': clientes_con_deuda,
         'clientes_al_dia': clientes_al_dia,
@@ -451,86 +195,81 @@ def cliente_detalle(request, pk):
     cliente = get_object_or_404(Cliente, pk=pk, usuario=request.user)
 
     # Actualizar estados de cobranza
-    facturas = cliente.facturas.all()
-    actualizar_estados_cobranza(facturas)
-
-    # Métricas del cliente
-    total_facturas = facturas.count()
-    facturas_pagadas = facturas.filter(estado='pagada').count()
-    facturas_pendientes = facturas.filter(estado='pendiente').count()
-    facturas_vencidas = facturas.filter(
-        estado='pendiente',
-        estado_cobranza__in=['vencida', 'mora', 'incobrable']
-    ).count()
-
-    # Montos
-    total_facturado = facturas.aggregate(
-        total=Sum(Case(
-            When(monto_total__gt=0, then=F('monto_total')),
-            default=F('monto')
-        ))
-    )['total'] or 0
-
-    total_pagado = facturas.filter(estado='pagada').aggregate(
-        total=Sum(Case(
-            When(monto_total__gt=0, then=F('monto_total')),
-            default=F('monto')
-        ))
-    )['total'] or 0
-
-    total_pendiente = facturas.filter(estado='pendiente').aggregate(
-        total=Sum(Case(
-            When(monto_pendiente__gt=0, then=F('monto_pendiente')),
-            default=F('monto_total')
-        ))
-    )['total'] or 0
-
-    # Por estado de cobranza
-    monto_vigente = facturas.filter(estado='pendiente', estado_cobranza='vigente').aggregate(
-        total=Sum(Case(
-            When(monto_pendiente__gt=0, then=F('monto_pendiente')),
-            default=F('monto_total')
-        ))
-    )['total'] or 0
-
-    monto_por_vencer = facturas.filter(estado='pendiente', estado_cobranza='por_vencer').aggregate(
-        total=Sum(Case(
-            When(monto_pendiente__gt=0, then=F('monto_pendiente')),
-            default=F('monto_total')
-        ))
-    )['total'] or 0
-
-    monto_vencido = facturas.filter(
-        estado='pendiente',
-        estado_cobranza__in=['vencida', 'mora', 'incobrable']
-    ).aggregate(
-        total=Sum(Case(
-            When(monto_pendiente__gt=0, then=F('monto_pendiente')),
-            default=F('monto_total')
-        ))
-    )['total'] or 0
+    asegurar_estados_cobranza(request.user)
+
+    # Métricas del cliente en una sola consulta; el historial de facturas se
+    # carga por páginas desde cliente_facturas
+    resumen = resumen_cliente(cliente.facturas.all())
 
     # Tasa de pago
     tasa_pago = 0
-    if total_facturado > 0:
-        tasa_pago = round((total_pagado / total_facturado) * 100)
+    if resumen['total_facturado'] > 0:
+        tasa_pago = round((resumen['total_pagado'] / resumen['total_facturado']) * 100)
 
     return render(request, 'core/cliente_detalle.html', {
         'cliente': cliente,
-        'facturas': facturas,
-        'total_facturas': total_facturas,
-        'facturas_pagadas': facturas_pagadas,
-        'facturas_pendientes': facturas_pendientes,
-        'facturas_vencidas': facturas_vencidas,
-        'total_facturado': total_facturado,
-        'total_pagado': total_pagado,
-        'total_pendiente': total_pendiente,
-        'monto_vigente': monto_vigente,
-        'monto_por_vencer': monto_por_vencer,
-        'monto_vencido': monto_vencido,
+        **resumen,
         'tasa_pago': tasa_pago,
+        'filtros_facturas': FILTROS_FACTURAS_CLIENTE,
+        'ordenes_facturas': ORDENES_FACTURAS_CLIENTE,
     })
 
+# Filtros y órdenes disponibles en el historial de facturas del cliente
+FILTROS_FACTURAS_CLIENTE = {
+    'todas': 'Todas',
+    'pendientes': 'Pendientes',
+    'vencidas': 'Vencidas',
+    'por_vencer': 'Por vencer',
+    'pagadas': 'Pagadas',
+}
+ORDENES_FACTURAS_CLIENTE = {
+    '-fecha_emision': 'Emisión (más recientes)',
+    'fecha_emision': 'Emisión (más antiguas)',
+    'fecha_vencimiento': 'Vencimiento (más próximas)',
+    '-fecha_vencimiento': 'Vencimiento (más lejanas)',
+    '-monto': 'Mayor monto',
+}
+
+@login_required
+def cliente_facturas(request, pk):
+    """
+    Página del historial de facturas de un cliente en JSON ({'html', 'siguiente'}).
+
+    Parámetros GET:
+        filtro: una de FILTROS_FACTURAS_CLIENTE (default: todas)
+        orden: una de ORDENES_FACTURAS_CLIENTE (default: -fecha_emision)
+        cursor: valor 'siguiente' de la página anterior
+    """
+    cliente = get_object_or_404(Cliente, pk=pk, usuario=request.user)
+    hoy = timezone.localdate()
+
+    filtro = request.GET.get('filtro', 'todas')
+    orden = request.GET.get('orden', '-fecha_emision')
+    if filtro not in FILTROS_FACTURAS_CLIENTE or orden not in ORDENES_FACTURAS_CLIENTE:
+        return JsonResponse({'error': 'Filtro u orden no válido'}, status=400)
+
+    facturas = cliente.facturas.con_estado_cobranza(hoy).para_listado()
+    if filtro == 'pendientes':
+        facturas = facturas.filter(estado='pendiente')
+    elif filtro == 'pagadas':
+        facturas = facturas.filter(estado='pagada')
+    elif filtro == 'vencidas':
+        facturas = facturas.en_estado_cobranza('vencida', 'mora', 'incobrable', hoy=hoy)
+    elif filtro == 'por_vencer':
+        facturas = facturas.en_estado_cobranza('por_vencer', hoy=hoy)
+
+    try:
+        pagina = paginar_por_cursor(facturas, orden, request.GET.get('cursor'), tamano=25)
+    except ValueError:
+        return JsonResponse({'error': 'Cursor no válido'}, status=400)
+
+    html = render_to_string('core/partials/cliente_facturas.html', {
+        'facturas': pagina.filas,
+        'filtro': filtro,
+        'primera_pagina': not request.GET.get('cursor'),
+    }, request=request)
+    return JsonResponse({'html': html, 'siguiente': pagina.siguiente})
+
 @login_required
 def cliente_crear(request):
     if request.method == 'POST':
@@ -558,37 +297,67 @@ def cliente_editar(request, pk):
         form = ClienteForm(instance=cliente)
     return render(request, 'core/cliente_form.html', {'form': form, 'titulo': 'Editar Cliente'})
 
+# Orden público del listado de facturas -> campo por el que se pagina
+ORDENES_FACTURAS = {
+    '-fecha_emision': '-fecha_emision',
+    'fecha_emision': 'fecha_emision',
+    'fecha_vencimiento': 'fecha_vencimiento',
+    '-fecha_vencimiento': '-fecha_vencimiento',
+    'monto_total': 'monto_facturado',
+    '-monto_total': '-monto_facturado',
+    'cliente__nombre': 'cliente__nombre',
+    '-cliente__nombre': '-cliente__nombre',
+    # Solo con búsqueda: anotación de core.busqueda
+    '-relevancia': '-relevancia',
+}
+
+# Filtro del listado de facturas -> clave en contadores_facturas()
+CONTADOR_FILTRO_FACTURAS = {
+    'vigentes': 'vigente',
+    'por_vencer': 'por_vencer',
+    'vencidas': 'vencida',
+    'mora': 'mora',
+    'incobrables': 'incobrable',
+    'pagadas': 'pagada',
+    'pendientes': 'pendiente',
+}
+
 @login_required
 def facturas_list(request):
+    # Los estados de cobranza se calculan en la consulta a partir de la fecha de hoy
+    hoy = timezone.localdate()
     todas_facturas = Factura.objects.filter(usuario=request.user)
 
-    # Actualizar estados de cobranza
-    actualizar_estados_cobranza(todas_facturas)
+    # Los contadores de las pestañas salen del resumen de cartera (un GROUP BY
+    # ya materializado), que depende del estado de cobranza almacenado, y se
+    # guardan en la caché del usuario para que cambiar de pestaña no recuente
+    asegurar_estados_cobranza(request.user, hoy)
+    contadores = contadores_facturas(request.user.pk)
 
     # Calcular conteos para las tarjetas - Estados principales
-    total_facturas = todas_facturas.count()
-    facturas_pagadas = todas_facturas.filter(estado='pagada').count()
-    facturas_pendientes = todas_facturas.filter(estado='pendiente').count()
+    total_facturas = contadores['total']
+    facturas_pagadas = contadores['pagada']
+    facturas_pendientes = contadores['pendiente']
 
     # Conteos por estado de cobranza
-    facturas_vigentes = todas_facturas.filter(estado='pendiente', estado_cobranza='vigente').count()
-    facturas_por_vencer = todas_facturas.filter(estado='pendiente', estado_cobranza='por_vencer').count()
-    facturas_vencidas = todas_facturas.filter(estado='pendiente', estado_cobranza='vencida').count()
-    facturas_en_mora = todas_facturas.filter(estado='pendiente', estado_cobranza='mora').count()
-    facturas_incobrables = todas_facturas.filter(estado='pendiente', estado_cobranza='incobrable').count()
+    facturas_vigentes = contadores['vigente']
+    facturas_por_vencer = contadores['por_vencer']
+    facturas_vencidas = contadores['vencida']
+    facturas_en_mora = contadores['mora']
+    facturas_incobrables = contadores['incobrable']
 
     # Filtrar según la selección del usuario
     filtro = request.GET.get('filtro', 'todas')
     if filtro == 'vigentes':
-        facturas = todas_facturas.filter(estado='pendiente', estado_cobranza='vigente')
+        facturas = todas_facturas.en_estado_cobranza('vigente', hoy=hoy)
     elif filtro == 'por_vencer':
-        facturas = todas_facturas.filter(estado='pendiente', estado_cobranza='por_vencer')
+        facturas = todas_facturas.en_estado_cobranza('por_vencer', hoy=hoy)
     elif filtro == 'vencidas':
-        facturas = todas_facturas.filter(estado='pendiente', estado_cobranza='vencida')
+        facturas = todas_facturas.en_estado_cobranza('vencida', hoy=hoy)
     elif filtro == 'mora':
-        facturas = todas_facturas.filter(estado='pendiente', estado_cobranza='mora')
+        facturas = todas_facturas.en_estado_cobranza('mora', hoy=hoy)
     elif filtro == 'incobrables':
-        facturas = todas_facturas.filter(estado='pendiente', estado_cobranza='incobrable')
+        facturas = todas_facturas.en_estado_cobranza('incobrable', hoy=hoy)
     elif filtro == 'pagadas':
         facturas = todas_facturas.filter(estado='pagada')
     elif filtro == 'pendientes':
@@ -597,30 +366,43 @@ def facturas_list(request):
         facturas = todas_facturas
 
     # ========== BÚSQUEDA ==========
+    # Índice de texto completo (ver core/busqueda.py); anota la relevancia
     busqueda = request.GET.get('q', '').strip()
     if busqueda:
-        facturas = facturas.filter(
-            Q(numero_factura__icontains=busqueda) |
-            Q(cliente__nombre__icontains=busqueda) |
-            Q(cliente__rut__icontains=busqueda) |
-            Q(descripcion__icontains=busqueda)
-        )
+        facturas = buscar_facturas(facturas, busqueda)
 
     # ========== ORDENAMIENTO ==========
-    orden = request.GET.get('orden', '-fecha_emision')
-    ordenes_validos = ['fecha_emision', '-fecha_emision', 'fecha_vencimiento', '-fecha_vencimiento',
-                      'monto_total', '-monto_total', 'cliente__nombre', '-cliente__nombre']
-    if orden in ordenes_validos:
-        facturas = facturas.order_by(orden)
+    # Cada orden público se pagina por un campo no nulo, con el id como desempate.
+    # Al buscar, por defecto se ordena por relevancia.
+    orden = request.GET.get('orden', '-relevancia' if busqueda else '-fecha_emision')
+    if orden not in ORDENES_FACTURAS or (orden == '-relevancia' and not busqueda):
+        orden = '-fecha_emision'
+    facturas = facturas.con_estado_cobranza(hoy).para_listado('descripcion').annotate(
+        monto_facturado=expresion_monto_facturado()
+    )
 
-    # ========== PAGINACIÓN ==========
-    paginator = Paginator(facturas, 25)  # 25 facturas por página
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # ========== PAGINACIÓN POR CURSOR ==========
+    try:
+        pagina = paginar_por_cursor(facturas, ORDENES_FACTURAS[orden], request.GET.get('cursor'), tamano=25)
+    except ValueError:
+        # Cursor inválido o de otro orden: volver a la primera página
+        pagina = paginar_por_cursor(facturas, ORDENES_FACTURAS[orden], tamano=25)
+
+    # Total del listado: sin búsqueda sale de los contadores del resumen de
+    # cartera; con búsqueda se cuenta una vez y se guarda en la caché del usuario
+    if busqueda:
+        total_listado = obtener_cache_usuario(
+            request.user.pk,
+            f'facturas:total:{hoy.isoformat()}:{filtro}:{hashlib.md5(busqueda.encode()).hexdigest()}',
+            facturas.count
+        )
+    else:
+        total_listado = contadores[CONTADOR_FILTRO_FACTURAS.get(filtro, 'total')]
 
     return render(request, 'core/facturas_list.html', {
-        'facturas': page_obj,
-        'page_obj': page_obj,
+        'facturas': pagina.filas,
+        'pagina': pagina,
+        'total_listado': total_listado,
         'filtro': filtro,
         'busqueda': busqueda,
         'orden': orden,
@@ -701,10 +483,10 @@ def exportar_pdf(request):
     facturas = Factura.objects.filter(usuario=request.user)
 
     # Actualizar estados de cobranza
-    actualizar_estados_cobranza(facturas)
+    asegurar_estados_cobranza(request.user)
 
     # Exportar solo facturas pendientes
-    facturas = facturas.filter(estado='pendiente')
+    facturas = facturas.filter(estado='pendiente').para_listado()
     response = generar_pdf_reporte(request.user, facturas)
     return response
 
@@ -713,301 +495,103 @@ def exportar_excel(request):
     facturas = Factura.objects.filter(usuario=request.user)
 
     # Actualizar estados de cobranza
-    actualizar_estados_cobranza(facturas)
+    asegurar_estados_cobranza(request.user)
 
     # Exportar solo facturas pendientes
-    facturas = facturas.filter(estado='pendiente')
+    facturas = facturas.filter(estado='pendiente').para_listado()
     response = generar_excel_reporte(request.user, facturas)
     return response
 
 @login_required
 def importar_sii(request):
-    """Vista para importar facturas desde archivos CSV del SII"""
-    import csv
-    import io
-    from decimal import Decimal
-    from datetime import datetime as dt
-
-    # Funciones auxiliares para parseo
-    def parse_decimal(value_str):
-        if not value_str or value_str == '0':
-            return Decimal('0')
-        cleaned = str(value_str).strip()
-        if ',' in cleaned and '.' in cleaned:
-            cleaned = cleaned.replace('.', '').replace(',', '.')
-        elif ',' in cleaned:
-            cleaned = cleaned.replace(',', '.')
-        return Decimal(cleaned)
-
-    def parse_date(date_str):
-        if not date_str:
-            return None
-        date_str = date_str.strip()
-        formats = ['%d-%m-%Y', '%Y-%m-%d', '%d/%m/%Y', '%Y/%m/%d']
-        for fmt in formats:
-            try:
-                return dt.strptime(date_str, fmt).date()
-            except ValueError:
-                continue
-        raise ValueError(f'Formato de fecha no reconocido: {date_str}')
+    """
+    Vista para importar facturas desde archivos CSV del SII.
 
+    El archivo se guarda en un TrabajoImportacion y la respuesta es inmediata:
+    el análisis y la importación los hace `manage.py procesar_importaciones`
+    (ver core/trabajos_importacion.py) y la página consulta el avance en
+    api_importacion. La vista previa se pagina sobre la tabla intermedia
+    (FilaImportacion) del trabajo, identificado por su token.
+    """
     if request.method == 'POST':
-        # Paso 2: Confirmar importación
+        # Paso 2: Confirmar importación (el worker la toma desde la cola)
         if 'confirmar_importacion' in request.POST:
-            csv_data = request.session.get('csv_preview_data')
-            if not csv_data:
+            token = _token_importacion(request.POST.get('trabajo'))
+            confirmado = token and TrabajoImportacion.objects.filter(
+                token=token, usuario=request.user, estado='analizado',
+            ).update(estado='confirmado')
+            if not confirmado:
                 messages.error(request, 'No hay datos para importar. Por favor, sube el archivo nuevamente.')
                 return redirect('importar_sii')
+            return redirect(f"{reverse('importar_sii')}?trabajo={token}")
 
-            facturas_creadas = 0
-            facturas_actualizadas = 0
-            errores = []
-
-            for item in csv_data:
-                try:
-                    # Buscar o crear cliente
-                    cliente, created = Cliente.objects.get_or_create(
-                        rut=item['rut'],
-                        usuario=request.user,
-                        defaults={
-                            'nombre': item['razon_social'],
-                            'email': f'{item["rut"].replace("-", "").replace(".", "")}@temp.com',
-                            'activo': True
-                        }
-                    )
-
-                    if not created and cliente.nombre != item['razon_social']:
-                        cliente.nombre = item['razon_social']
-                        cliente.save()
-
-                    # Crear o actualizar factura
-                    factura, factura_created = Factura.objects.update_or_create(
-                        numero_factura=item['folio'],
-                        usuario=request.user,
-                        defaults={
-                            'cliente': cliente,
-                            'monto': Decimal(str(item['monto_total'])),
-                            'monto_total': Decimal(str(item['monto_total'])),
-                            'monto_pagado': Decimal(str(item['monto_pagado'])),
-                            'monto_pendiente': Decimal(str(item['monto_pendiente'])),
-                            'fecha_emision': dt.strptime(item['fecha_emision'], '%Y-%m-%d').date(),
-                            'fecha_vencimiento': dt.strptime(item['fecha_vencimiento'], '%Y-%m-%d').date() if item['fecha_vencimiento'] else None,
-                            'fecha_pago': dt.strptime(item['fecha_pago'], '%Y-%m-%d').date() if item.get('fecha_pago') else None,
-                            'estado': item['estado'],
-                            'descripcion': f'Importado desde SII - {item["razon_social"]}',
-                        }
-                    )
-
-                    if factura_created:
-                        facturas_creadas += 1
-                    else:
-                        facturas_actualizadas += 1
-
-                except Exception as e:
-                    errores.append(f'Folio {item["folio"]}: {str(e)}')
-
-            # Limpiar datos de sesión
-            if 'csv_preview_data' in request.session:
-                del request.session['csv_preview_data']
-
-            mensaje_exito = f'Importación completada: {facturas_creadas} facturas creadas, {facturas_actualizadas} actualizadas'
-            messages.success(request, mensaje_exito)
-
-            if errores:
-                for error in errores[:5]:
-                    messages.warning(request, error)
-                if len(errores) > 5:
-                    messages.warning(request, f'... y {len(errores) - 5} errores más')
-
-            return redirect('facturas_list')
-
-        # Paso 1: Subir archivo y mostrar vista previa
+        # Paso 1: Subir archivo y encolar el análisis
         csv_file = request.FILES.get('csv_file')
 
         if not csv_file:
-            messages.error(request, 'Por favor, selecciona un archivo CSV')
+            messages.error(request, 'Por favor, selecciona un archivo CSV o XML')
             return redirect('importar_sii')
 
-        if not csv_file.name.endswith('.csv'):
-            messages.error(request, 'El archivo debe ser un CSV')
+        formato = csv_file.name.rsplit('.', 1)[-1].lower()
+        if formato not in dict(TrabajoImportacion.FORMATO_CHOICES):
+            messages.error(request, 'El archivo debe ser un CSV o un XML de envío de DTE (EnvioDTE)')
             return redirect('importar_sii')
 
-        try:
-            # Decodificar el archivo CSV
-            decoded_file = csv_file.read().decode('utf-8-sig')
-            io_string = io.StringIO(decoded_file)
-
-            # Detectar el delimitador automáticamente
-            sample = io_string.read(1024)
-            io_string.seek(0)
-            delimiter = ';' if sample.count(';') > sample.count(',') else ','
-
-            csv_reader = csv.DictReader(io_string, delimiter=delimiter)
-
-            preview_data = []
-            errores = []
-            total_monto = Decimal('0')
-            total_pendiente = Decimal('0')
-
-            for row_num, row in enumerate(csv_reader, start=2):
-                try:
-                    # Leer datos directamente del CSV
-                    # Formato esperado: folio, tipo_dte, fecha_emision, fecha_vencimiento, rut_receptor, razon_social_receptor, monto_total, monto_pendiente, estado_pago
-
-                    numero_factura = row.get('folio', '').strip()
-                    tipo_dte_str = row.get('tipo_dte', '33').strip() or '33'
-                    fecha_emision_str = row.get('fecha_emision', '').strip()
-                    fecha_vencimiento_str = row.get('fecha_vencimiento', '').strip()
-                    rut_emisor = row.get('rut_receptor', '').strip()
-                    razon_social = row.get('razon_social_receptor', '').strip()
-                    monto_total_str = row.get('monto_total', '0').strip() or '0'
-                    monto_pendiente_str = row.get('monto_pendiente', '0').strip() or '0'
-                    estado_pago_str = row.get('estado_pago', '').strip()
-
-                    # Para compatibilidad con otros formatos, también intentar variantes
-                    if not numero_factura:
-                        numero_factura = row.get('Folio', row.get('Número Documento', '')).strip()
-                    if not rut_emisor:
-                        rut_emisor = row.get('RUT Receptor', row.get('RUTReceptor', row.get('RUT Emisor', ''))).strip()
-                    if not razon_social:
-                        razon_social = row.get('Razón Social Receptor', row.get('RazonSocialReceptor', row.get('Razón Social', ''))).strip()
-                    if not fecha_emision_str:
-                        fecha_emision_str = row.get('Fecha Emisión', row.get('FechaEmision', row.get('Fecha', ''))).strip()
-                    if not monto_total_str or monto_total_str == '0':
-                        monto_total_str = row.get('Monto Total', row.get('MontoTotal', row.get('Total', '0'))).strip() or '0'
-
-                    # Validar datos mínimos requeridos
-                    if not numero_factura:
-                        errores.append(f'Fila {row_num}: Falta el folio de la factura')
-                        continue
-                    if not rut_emisor:
-                        errores.append(f'Fila {row_num}: Falta el RUT del receptor')
-                        continue
-                    if not razon_social:
-                        errores.append(f'Fila {row_num}: Falta la razón social del receptor')
-                        continue
-                    if not fecha_emision_str:
-                        errores.append(f'Fila {row_num}: Falta la fecha de emisión')
-                        continue
-
-                    # Establecer valores por defecto para campos opcionales
-                    monto_neto_str = '0'
-                    monto_iva_str = '0'
-
-                    monto_neto = parse_decimal(monto_neto_str)
-                    monto_iva = parse_decimal(monto_iva_str)
-                    monto_total = parse_decimal(monto_total_str)
-
-                    # Si no hay monto total, calcularlo
-                    if monto_total == 0:
-                        monto_total = monto_neto + monto_iva
-
-                    fecha_emision = parse_date(fecha_emision_str) if fecha_emision_str else timezone.now().date()
-
-                    if fecha_vencimiento_str:
-                        fecha_vencimiento = parse_date(fecha_vencimiento_str)
-                    else:
-                        # Si no hay fecha de vencimiento, usar 30 días después de la emisión
-                        fecha_vencimiento = fecha_emision + datetime.timedelta(days=30)
-
-                    monto_pendiente = parse_decimal(monto_pendiente_str)
-                    # Calcular monto pagado
-                    monto_pagado = monto_total - monto_pendiente if monto_total > 0 else Decimal('0')
-
-                    # Determinar el estado de la factura basado en estado_pago o monto_pendiente
-                    estado_factura = 'pendiente'
-                    fecha_pago = None
-
-                    # Verificar estado de pago del CSV
-                    if estado_pago_str:
-                        estado_lower = estado_pago_str.strip().lower()
-
-                        # Pago Total - factura completamente pagada
-                        if 'pago total' in estado_lower or estado_lower == 'pagada' or estado_lower == 'pagado':
-                            estado_factura = 'pagada'
-                            fecha_pago = timezone.now().date()
-                        # Pago Parcial - factura pendiente con abono
-                        elif 'pago parcial' in estado_lower or 'parcial' in estado_lower:
-                            estado_factura = 'pendiente'
-                        # Impaga - factura sin pagos
-                        elif 'impaga' in estado_lower:
-                            estado_factura = 'pendiente'
-                        # Al día - factura vigente sin vencimiento
-                        elif 'al día' in estado_lower or 'al dia' in estado_lower:
-                            estado_factura = 'pendiente'
-                        # Por vencer - factura próxima a vencer
-                        elif 'por vencer' in estado_lower:
-                            estado_factura = 'pendiente'
-                        # Default: pendiente
-                        else:
-                            estado_factura = 'pendiente'
-
-                    # Si el monto pendiente es 0, está pagada
-                    if monto_pendiente == 0:
-                        estado_factura = 'pagada'
-                        fecha_pago = timezone.now().date() if not fecha_pago else fecha_pago
-                        monto_pagado = monto_total
-
-                    # Verificar si ya existe la factura
-                    existe = Factura.objects.filter(
-                        numero_factura=numero_factura,
-                        usuario=request.user
-                    ).exists()
-
-                    # Agregar a la vista previa
-                    preview_item = {
-                        'row_num': row_num,
-                        'folio': numero_factura,
-                        'rut': rut_emisor,
-                        'razon_social': razon_social,
-                        'fecha_emision': fecha_emision.strftime('%Y-%m-%d'),
-                        'fecha_vencimiento': fecha_vencimiento.strftime('%Y-%m-%d') if fecha_vencimiento else '',
-                        'monto_total': float(monto_total),
-                        'monto_pendiente': float(monto_pendiente),
-                        'monto_pagado': float(monto_pagado),
-                        'estado': estado_factura,
-                        'fecha_pago': fecha_pago.strftime('%Y-%m-%d') if fecha_pago else None,
-                        'existe': existe,
-                        'valido': True
-                    }
-                    preview_data.append(preview_item)
-                    total_monto += monto_total
-                    total_pendiente += monto_pendiente
-
-                except Exception as e:
-                    errores.append({
-                        'row_num': row_num,
-                        'error': str(e)
-                    })
-                    continue
-
-            # Guardar datos en sesión para confirmar
-            request.session['csv_preview_data'] = preview_data
-
-            # Contar estadísticas
-            nuevas = len([p for p in preview_data if not p['existe']])
-            actualizadas = len([p for p in preview_data if p['existe']])
-            pagadas = len([p for p in preview_data if p['estado'] == 'pagada'])
-            pendientes = len([p for p in preview_data if p['estado'] == 'pendiente'])
-
-            return render(request, 'core/importar_sii.html', {
-                'preview': True,
-                'preview_data': preview_data,
-                'errores': errores,
-                'total_facturas': len(preview_data),
-                'nuevas': nuevas,
-                'actualizadas': actualizadas,
-                'pagadas': pagadas,
-                'pendientes': pendientes,
-                'total_monto': float(total_monto),
-                'total_pendiente': float(total_pendiente),
-            })
-
-        except Exception as e:
-            messages.error(request, f'Error al procesar el archivo: {str(e)}')
-            return redirect('importar_sii')
+        trabajo = crear_trabajo(request.user, csv_file, formato)
+        return redirect(f"{reverse('importar_sii')}?trabajo={trabajo.token}")
+
+    token = _token_importacion(request.GET.get('trabajo'))
+    if not token:
+        return render(request, 'core/importar_sii.html')
+
+    trabajo = get_object_or_404(TrabajoImportacion, token=token, usuario=request.user)
+    page_obj = None
+    if trabajo.estado == 'analizado':
+        page_obj = Paginator(trabajo.filas.all(), 50).get_page(request.GET.get('page'))
+    return render(request, 'core/importar_sii.html', {
+        'trabajo': trabajo,
+        'preview': trabajo.estado == 'analizado',
+        'preview_data': page_obj,
+        'page_obj': page_obj,
+        'errores': trabajo.errores,
+        'total_facturas': trabajo.total_filas,
+        'nuevas': trabajo.nuevas,
+        'actualizadas': trabajo.actualizadas,
+        'sin_cambios': trabajo.sin_cambios,
+        'pagadas': trabajo.pagadas,
+        'pendientes': trabajo.pendientes,
+        'total_monto': trabajo.total_monto,
+        'total_pendiente': trabajo.total_pendiente,
+    })
 
-    return render(request, 'core/importar_sii.html')
+
+def _token_importacion(valor):
+    """UUID del parámetro `trabajo`, o None si no es un token válido"""
+    try:
+        return uuid.UUID(valor or '')
+    except ValueError:
+        return None
+
+
+@login_required
+def api_importacion(request, token):
+    """Avance de una importación del SII en JSON (la consulta importar_sii.html mientras se procesa)"""
+    trabajo = get_object_or_404(TrabajoImportacion, token=token, usuario=request.user)
+    return JsonResponse({
+        'estado': trabajo.estado,
+        'estado_display': trabajo.get_estado_display(),
+        'porcentaje': trabajo.porcentaje,
+        'filas_procesadas': trabajo.filas_procesadas,
+        'filas_con_error': trabajo.filas_con_error,
+        'filas_por_segundo': trabajo.filas_por_segundo,
+        'nuevas': trabajo.nuevas,
+        'actualizadas': trabajo.actualizadas,
+        'sin_cambios': trabajo.sin_cambios,
+        'facturas_creadas': trabajo.facturas_creadas,
+        'facturas_actualizadas': trabajo.facturas_actualizadas,
+        'errores': trabajo.errores[:20],
+        'mensaje': trabajo.mensaje,
+    })
 
 
 def error_404(request, exception):